@@ -0,0 +1,204 @@
+# file: admission.py
+"""Admission control in front of `invoke_agent`.
+
+Two token buckets gate every upstream call: one per session (stops a single
+player from spamming) and one global (keeps the process near its Bedrock
+quota instead of tripping throttling). Calls that find the global bucket
+empty wait in a bounded FIFO queue; each carries a deadline and is dropped
+once it can no longer be served in time. Rejections carry an HTTP status,
+a Retry-After hint and, when queued, the caller's position.
+
+The limits are per process: divide the account quota by the number of
+gunicorn workers when setting ADMISSION_GLOBAL_RATE.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+
+class Rejected(Exception):
+	def __init__(self, status: int, reason: str, retry_after: float, position: int | None = None):
+		super().__init__(reason)
+		self.status = status
+		self.reason = reason
+		self.retry_after = max(1, int(retry_after + 0.999))
+		self.position = position
+
+	def as_dict(self) -> dict:
+		out = {"error": self.reason, "retry_after": self.retry_after}
+		if self.position is not None:
+			out["position"] = self.position
+		return out
+
+
+class TokenBucket:
+	def __init__(self, rate: float, burst: float, now: float | None = None):
+		self.rate = rate
+		self.burst = burst
+		self.tokens = burst
+		self.updated = time.monotonic() if now is None else now
+
+	def _refill(self, now: float):
+		# Callers take `now` before the lock, so it may be older than the last update.
+		self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+		self.updated = max(self.updated, now)
+
+	def try_take(self, now: float) -> float:
+		"""Takes a token and returns 0, or returns the seconds until one is available."""
+		self._refill(now)
+		if self.tokens >= 1:
+			self.tokens -= 1
+			return 0.0
+		return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class Ticket:
+	def __init__(self, controller: "AdmissionController", deadline: float):
+		self._controller = controller
+		self.deadline = deadline
+		self.admitted = False
+
+	@property
+	def position(self) -> int:
+		"""1-based place in the queue, 0 once admitted."""
+		return self._controller._position(self)
+
+	def wait(self, timeout: float) -> bool:
+		"""Waits up to `timeout` seconds; True once admitted. Raises Rejected at the deadline."""
+		return self._controller._wait(self, timeout)
+
+	def wait_until_admitted(self):
+		while not self.wait(self.deadline - time.monotonic()):
+			pass
+
+	def cancel(self):
+		self._controller._cancel(self)
+
+
+class AdmissionController:
+	def __init__(
+		self,
+		session_rate: float = 0.5,
+		session_burst: float = 3,
+		global_rate: float = 5,
+		global_burst: float = 10,
+		max_queue: int = 100,
+		max_wait_s: float = 20,
+	):
+		self.session_rate = session_rate
+		self.session_burst = session_burst
+		self.global_bucket = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+		self.max_queue = max_queue
+		self.max_wait_s = max_wait_s
+		self._sessions: dict[str, TokenBucket] = {}
+		self._queue: deque[Ticket] = deque()
+		self._cond = threading.Condition()
+		self._requests = 0
+
+	def request(self, session_id: str, max_wait_s: float | None = None, check_session: bool = True) -> Ticket:
+		"""Returns a ticket (possibly already admitted) or raises Rejected right away.
+
+		Pass check_session=False for the extra calls of one message fanned out
+		to several agents, so the message counts once against the session.
+		"""
+		now = time.monotonic()
+		with self._cond:
+			self._requests += 1
+			if self._requests % 1000 == 0:
+				self._prune_sessions(now)
+			if check_session and self.session_rate > 0:
+				bucket = self._sessions.get(session_id)
+				if bucket is None:
+					bucket = self._sessions[session_id] = TokenBucket(self.session_rate, self.session_burst, now)
+				wait = bucket.try_take(now)
+				if wait:
+					raise Rejected(429, "Too many messages from this session; slow down.", wait)
+
+			ticket = Ticket(self, now + (self.max_wait_s if max_wait_s is None else max_wait_s))
+			if not self._queue and self._take_global(now) == 0:
+				ticket.admitted = True
+				return ticket
+			if len(self._queue) >= self.max_queue:
+				raise Rejected(503, "The agents are saturated; please retry shortly.", self._eta(len(self._queue) + 1), len(self._queue) + 1)
+			eta = self._eta(len(self._queue) + 1)
+			if now + eta > ticket.deadline:
+				raise Rejected(503, "The queue is too long to answer in time; please retry shortly.", eta, len(self._queue) + 1)
+			self._queue.append(ticket)
+			return ticket
+
+	def stats(self) -> dict:
+		with self._cond:
+			return {"queued": len(self._queue), "sessions": len(self._sessions)}
+
+	# Callers hold self._cond for the helpers below.
+	def _take_global(self, now: float) -> float:
+		return self.global_bucket.try_take(now) if self.global_bucket else 0.0
+
+	def _eta(self, position: int) -> float:
+		if not self.global_bucket or self.global_bucket.rate <= 0:
+			return 0.0
+		return position / self.global_bucket.rate
+
+	def _drop_expired(self, now: float):
+		if any(t.deadline <= now for t in self._queue):
+			self._queue = deque(t for t in self._queue if t.deadline > now)
+			self._cond.notify_all()
+
+	def _position(self, ticket: Ticket) -> int:
+		with self._cond:
+			if ticket.admitted:
+				return 0
+			try:
+				return self._queue.index(ticket) + 1
+			except ValueError:
+				return 0
+
+	def _wait(self, ticket: Ticket, timeout: float) -> bool:
+		end = time.monotonic() + max(0.0, timeout)
+		with self._cond:
+			while True:
+				if ticket.admitted:
+					return True
+				now = time.monotonic()
+				self._drop_expired(now)
+				if ticket not in self._queue:
+					raise Rejected(503, "Timed out waiting for a free agent; please retry.", self._eta(len(self._queue) + 1))
+				if self._queue[0] is ticket:
+					wait = self._take_global(now)
+					if wait == 0:
+						self._queue.popleft()
+						ticket.admitted = True
+						self._cond.notify_all()
+						return True
+				else:
+					wait = self._eta(self._queue.index(ticket))
+				remaining = end - now
+				if remaining <= 0:
+					return False
+				self._cond.wait(min(wait or remaining, remaining, ticket.deadline - now + 0.001))
+
+	def _cancel(self, ticket: Ticket):
+		with self._cond:
+			if ticket in self._queue:
+				self._queue.remove(ticket)
+				self._cond.notify_all()
+
+	def _prune_sessions(self, now: float):
+		for sid, bucket in list(self._sessions.items()):
+			if now - bucket.updated > 600:
+				del self._sessions[sid]
+
+
+def from_env() -> AdmissionController | None:
+	"""Controller described by ADMISSION_* env vars, or None when ADMISSION=off."""
+	if os.getenv("ADMISSION", "on").strip().lower() in {"off", "0", "false", "no"}:
+		return None
+	return AdmissionController(
+		session_rate=float(os.getenv("ADMISSION_SESSION_RATE", "0.5")),
+		session_burst=float(os.getenv("ADMISSION_SESSION_BURST", "3")),
+		global_rate=float(os.getenv("ADMISSION_GLOBAL_RATE", "5")),
+		global_burst=float(os.getenv("ADMISSION_GLOBAL_BURST", "10")),
+		max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "100")),
+		max_wait_s=float(os.getenv("ADMISSION_MAX_WAIT_S", "20")),
+	)
@@ -0,0 +1,80 @@
+# file: agent_runtime.py
+"""Helpers shared by the front ends for reading Bedrock agent responses."""
+import codecs
+import json
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def iter_completion_text(resp):
+	"""Yields text from an `invoke_agent` response as each chunk arrives.
+
+	Chunks are raw UTF-8 bytes and a multibyte character can be split across
+	two of them, so decoding goes through an incremental decoder.
+	"""
+	decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+	for event in resp.get("completion", []):
+		if "chunk" in event and "bytes" in event["chunk"]:
+			text = decoder.decode(event["chunk"]["bytes"])
+			if text:
+				yield text
+	tail = decoder.decode(b"", final=True)
+	if tail:
+		yield tail
+
+
+def sse_event(event: str, data: dict, event_id: int | None = None) -> str:
+	"""Formats one Server-Sent Events frame; `event_id` lets EventSource resume with Last-Event-ID."""
+	frame = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+	return frame if event_id is None else f"id: {event_id}\n{frame}"
+
+
+def fan_out(calls: dict, timeout_s):
+	"""Runs several `invoke_agent` calls concurrently and yields their text as it arrives.
+
+	`calls` maps a name to a zero-argument callable returning an `invoke_agent`
+	response. `timeout_s` is one deadline for all calls or a dict of per-name
+	deadlines, measured from the start. Yields `(name, event, value)` tuples in
+	arrival order, where event is "chunk" (value is text) and every name ends
+	with exactly one "done", "error" (value is the exception) or "timeout".
+	A call that misses its deadline is abandoned, never waited on.
+	"""
+	events: queue.Queue = queue.Queue()
+
+	def run(name, call):
+		try:
+			for text in iter_completion_text(call()):
+				events.put((name, "chunk", text))
+			events.put((name, "done", None))
+		except Exception as e:
+			events.put((name, "error", e))
+
+	start = time.monotonic()
+	deadlines = {
+		name: start + (timeout_s.get(name, 60) if isinstance(timeout_s, dict) else timeout_s)
+		for name in calls
+	}
+	if calls:
+		pool = ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="fan-out")
+		for name, call in calls.items():
+			pool.submit(run, name, call)
+		pool.shutdown(wait=False)
+
+	pending = set(calls)
+	while pending:
+		now = time.monotonic()
+		for name in sorted(n for n in pending if deadlines[n] <= now):
+			pending.discard(name)
+			yield name, "timeout", None
+		if not pending:
+			break
+		try:
+			name, event, value = events.get(timeout=max(0.0, min(deadlines[n] for n in pending) - now))
+		except queue.Empty:
+			continue
+		if name not in pending:
+			continue  # arrived after its deadline
+		if event != "chunk":
+			pending.discard(name)
+		yield name, event, value
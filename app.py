@@ -1,16 +1,87 @@
 # file: app.py
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-import boto3, uuid, json, os
+import uuid, json, os, queue, time
+
+import admission
+import intent_router
+import metrics
+import resilience
+import response_cache
+import retrieval
+import rooms
+import session_rotation
+import tracing
+from agent_runtime import iter_completion_text, sse_event
+from catalog import get_catalog, normalize_challenge_key
+from clients import get_runtime_client
+from grading import get_answer_key
 
 REGION = os.getenv("AWS_REGION", os.getenv("REGION", "us-east-1"))
 SUPERVISOR_AGENT_ID = os.getenv("SUPERVISOR_AGENT_ID", "SUPERVISOR_AGENT_ID")
 SUPERVISOR_ALIAS_ID = os.getenv("SUPERVISOR_ALIAS_ID", "SUPERVISOR_ALIAS_ID")
 
-runtime = boto3.client("bedrock-agent-runtime", region_name=REGION)
+GRADE_MAX_ATTEMPTS = int(os.getenv("GRADE_MAX_ATTEMPTS", "1000"))
+UPSTREAM_RETRY_AFTER = int(os.getenv("UPSTREAM_RETRY_AFTER", "2"))
+OVER_CAPACITY = "Too many players are waiting on the agents right now, please retry shortly."
+
+runtime = get_runtime_client(REGION)
+reply_cache = response_cache.from_env()  # None unless RESPONSE_CACHE is set
+admission_control = admission.from_env()  # None when ADMISSION=off
+router = intent_router.from_env(SUPERVISOR_AGENT_ID, SUPERVISOR_ALIAS_ID)  # None unless ROUTER=on
+if router is not None:
+    retrieval.get_index()  # build the persona index now rather than on the first routed message
+sessions = session_rotation.from_env()  # None when SESSION_ROTATION=off
+# Set by asgi.py: blocks for an upstream slot and returns its release callable, or None when full.
+upstream_gate = None
 app = Flask(__name__, static_folder=None)
 CORS(app)
 
+def invoke_turn(session_id, user_text, challenge=""):
+    # Long sessions move to a fresh Bedrock session seeded with a summary (see session_rotation).
+    message = user_text
+    upstream_session = session_id
+    if sessions is not None:
+        upstream_session, seed = sessions.session_for(session_id)
+        user_text = sessions.seeded(seed, user_text)
+    # With the router on, confident matches go straight to one collaborator.
+    if router is None:
+        resp = runtime.invoke_agent(
+            agentId=SUPERVISOR_AGENT_ID,
+            agentAliasId=SUPERVISOR_ALIAS_ID,
+            sessionId=upstream_session,
+            inputText=user_text,
+        )
+    else:
+        record = get_catalog().challenge(challenge) if challenge else None
+        route = router.route(message, (record or {}).get("category", ""))
+        if route.direct:
+            # Skipping the supervisor, so hand the collaborator its own reference material.
+            grounding = retrieval.grounding(retrieval.persona_for(route.target), message, exclude=(record or {}).get("description", ""))
+            if grounding:
+                user_text = f"{grounding}\nPergunta do jogador: {user_text}"
+        start = time.perf_counter()
+        resp = runtime.invoke_agent(
+            agentId=route.agent_id,
+            agentAliasId=route.alias_id,
+            sessionId=upstream_session,
+            inputText=user_text,
+        )
+        resp = router.timed(resp, route, start)
+    return sessions.track(session_id, message, user_text, resp) if sessions is not None else resp
+
+def reply_cache_key(data, user_text):
+    if reply_cache is None:
+        return None
+    challenge = normalize_challenge_key(data.get("challenge", ""))
+    return response_cache.make_key(SUPERVISOR_AGENT_ID, SUPERVISOR_ALIAS_ID, challenge, user_text)
+
+def rejected_response(e):
+    resp = jsonify(e.as_dict())
+    resp.status_code = e.status
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
 @app.get("/")
 def serve_index():
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -22,30 +93,262 @@ def chat():
     user_text = data.get("message", "")
     session_id = data.get("session_id") or str(uuid.uuid4())
 
+    cache_key = reply_cache_key(data, user_text)
+    if cache_key:
+        cached = reply_cache.get(cache_key)
+        if cached is not None:
+            return jsonify({"session_id": session_id, "reply": cached, "cached": True})
+
+    if admission_control is not None:
+        try:
+            admission_control.request(session_id).wait_until_admitted()
+        except admission.Rejected as e:
+            return rejected_response(e)
+
     # Simple (non-streaming) invoke:
-    resp = runtime.invoke_agent(
-        agentId=SUPERVISOR_AGENT_ID,
-        agentAliasId=SUPERVISOR_ALIAS_ID,
-        sessionId=session_id,
-        inputText=user_text,
+    try:
+        resp = invoke_turn(session_id, user_text, data.get("challenge", ""))
+        # The response contains chunks; collect text chunks:
+        reply = "".join(iter_completion_text(resp))
+    except Exception as e:
+        return jsonify({"session_id": session_id, "error": resilience.friendly_error(e)}), 502
+    if cache_key:
+        reply_cache.put(cache_key, reply)
+    return jsonify({"session_id": session_id, "reply": reply})
+
+@app.post("/chat/stream")
+def chat_stream():
+    data = request.get_json()
+    user_text = data.get("message", "")
+    session_id = data.get("session_id") or str(uuid.uuid4())
+    cache_key = reply_cache_key(data, user_text)
+    cached = reply_cache.get(cache_key) if cache_key else None
+    ticket = None
+    if cached is None and admission_control is not None:
+        # Rate-limited and hopeless requests are refused before the stream starts.
+        try:
+            ticket = admission_control.request(session_id)
+        except admission.Rejected as e:
+            return rejected_response(e)
+
+    def generate():
+        # Send the session id first so the client gets its first byte
+        # before the supervisor round trip starts.
+        yield sse_event("session", {"session_id": session_id})
+        if cached is not None:
+            yield sse_event("chunk", {"text": cached})
+            yield sse_event("done", {"cached": True})
+            return
+        if ticket is not None:
+            try:
+                while not ticket.wait(1.0):
+                    yield sse_event("queued", {"position": ticket.position})
+            except admission.Rejected as e:
+                yield sse_event("error", {"message": e.reason, "retry_after": e.retry_after})
+                yield sse_event("done", {})
+                return
+            finally:
+                ticket.cancel()
+        output = []
+        try:
+            resp = invoke_turn(session_id, user_text, data.get("challenge", ""))
+            for text in iter_completion_text(resp):
+                output.append(text)
+                yield sse_event("chunk", {"text": text})
+            if cache_key:
+                reply_cache.put(cache_key, "".join(output))
+        except Exception as e:
+            yield sse_event("error", {"message": resilience.friendly_error(e)})
+        yield sse_event("done", {})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    # The response contains chunks; collect text chunks:
-    output = []
-    for chunk in resp.get("completion", []):
-        if "chunk" in chunk and "bytes" in chunk["chunk"]:
-            output.append(chunk["chunk"]["bytes"].decode("utf-8"))
-    return jsonify({"session_id": session_id, "reply": "".join(output)})
+
+def region_health():
+    # Per-region latency, error rate and ejection when REGIONS is set (see regions.py).
+    health = getattr(runtime, "region_health", None)
+    return health() if health else None
 
 @app.get("/health")
 def health():
     return jsonify({
         "status": "ok",
         "region": REGION,
+        "regions": region_health(),
         "supervisor_agent_id": SUPERVISOR_AGENT_ID != "SUPERVISOR_AGENT_ID",
         "supervisor_alias_id": SUPERVISOR_ALIAS_ID != "SUPERVISOR_ALIAS_ID",
     })
 
-# Optional streaming (if you want progressive updates):
+@app.get("/challenges")
+def list_challenges():
+    # Answers stay server-side; the UI only needs what players may see.
+    catalog = get_catalog()
+    items = catalog.desafios + [catalog.challenge(c["id"]) for c in catalog.challenges]
+    return jsonify({"challenges": [
+        {k: c[k] for k in ("id", "title", "category", "difficulty", "description")} for c in items
+    ]})
+
+@app.post("/grade")
+def grade():
+    # Body: {"attempts": [{"challenge": "...", "answer": "...", "team": "..."}, ...]}
+    body = request.get_json(silent=True) or {}
+    attempts = (body.get("attempts") or []) if isinstance(body, dict) else None
+    if not isinstance(attempts, list) or not all(isinstance(a, dict) for a in attempts):
+        return jsonify({"error": "attempts must be a list of objects"}), 400
+    if len(attempts) > GRADE_MAX_ATTEMPTS:
+        return jsonify({"error": f"at most {GRADE_MAX_ATTEMPTS} attempts per call"}), 400
+    pairs = [(str(a.get("challenge", "")), str(a.get("answer", ""))) for a in attempts]
+    results = []
+    for attempt, result in zip(attempts, get_answer_key().grade_many(pairs, strict=True)):
+        item = result.as_dict()
+        if "team" in attempt:
+            item["team"] = attempt["team"]
+        results.append(item)
+    return jsonify({
+        "results": results,
+        "correct": sum(1 for r in results if r["correct"]),
+        "total": len(results),
+    })
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def room_or_error(room_id):
+    try:
+        return rooms.get_room(room_id), None
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+    except rooms.RoomLimit as e:
+        return None, (jsonify({"error": str(e)}), 503, {"Retry-After": "30"})
+    except rooms.RoomsUnavailable as e:
+        return None, (jsonify({"error": str(e)}), 503)
+
+@app.get("/rooms/<room_id>")
+def room_state(room_id):
+    room, error = room_or_error(room_id)
+    return error or jsonify(room.state())
+
+@app.post("/rooms/<room_id>/ask")
+def room_ask(room_id):
+    # Body: {"message": "...", "member": "...", "challenge": "..."}; the reply arrives on /events.
+    room, error = room_or_error(room_id)
+    if error:
+        return error
+    data = request.get_json() or {}
+    user_text = data.get("message", "").strip()
+    if not user_text:
+        return jsonify({"error": "message is required"}), 400
+    cache_key = reply_cache_key(data, user_text)
+    cached = reply_cache.get(cache_key) if cache_key else None
+    ticket = None
+    if cached is None and admission_control is not None and not room.busy:
+        try:
+            ticket = admission_control.request(room.session_id)
+        except admission.Rejected as e:
+            return rejected_response(e)
+    release = None
+    if cached is None and upstream_gate is not None and (ticket is None or ticket.admitted) and not room.busy:
+        # Room questions share the ASGI upstream cap with /chat; queued ones take their slot once admitted.
+        release = upstream_gate()
+        if release is None:
+            if ticket is not None:
+                ticket.cancel()
+            return jsonify({"error": OVER_CAPACITY}), 503, {"Retry-After": str(UPSTREAM_RETRY_AFTER)}
+
+    def run():
+        nonlocal release
+        if cached is not None:
+            yield cached
+            return
+        try:
+            if ticket is not None:
+                try:
+                    ticket.wait_until_admitted()
+                finally:
+                    ticket.cancel()
+            if release is None and upstream_gate is not None:
+                release = upstream_gate()
+                if release is None:
+                    raise resilience.AgentUnavailable(OVER_CAPACITY)
+            output = []
+            try:
+                for text in iter_completion_text(invoke_turn(room.session_id, user_text, data.get("challenge", ""))):
+                    output.append(text)
+                    yield text
+            except Exception as e:
+                # Everyone in the room sees this, so never the raw error.
+                raise resilience.AgentUnavailable(resilience.friendly_error(e)) from e
+        finally:
+            if release is not None:
+                release()
+        if cache_key:
+            reply_cache.put(cache_key, "".join(output))
+
+    try:
+        turn = room.ask(str(data.get("member") or "anon")[:40], user_text, run)
+    except rooms.RoomBusy as e:
+        if ticket is not None:
+            ticket.cancel()
+        if release is not None:
+            release()
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"room": room.id, "turn": turn}), 202
+
+@app.get("/rooms/<room_id>/events")
+def room_events(room_id):
+    # One SSE stream per member; replays the room's buffer after Last-Event-ID (or ?after=).
+    room, error = room_or_error(room_id)
+    if error:
+        return error
+    after = rooms.parse_after(request.headers.get("Last-Event-ID") or request.args.get("after"))
+
+    def generate():
+        inbox = queue.Queue()
+        backlog, unsubscribe = room.subscribe(inbox.put, after)
+        try:
+            yield sse_event("state", room.state())
+            for seq, event, data in backlog:
+                yield sse_event(event, data, seq)
+            while True:
+                try:
+                    seq, event, data = inbox.get(timeout=rooms.HEARTBEAT_S)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield sse_event(event, data, seq)
+        finally:
+            unsubscribe()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/cache/stats")
+def cache_stats():
+    if reply_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **reply_cache.stats()})
+
+@app.get("/debug/traces")
+def debug_traces():
+    # ?limit=N, ?id=<trace id>, ?format=text for a plain-text waterfall.
+    if not tracing.enabled():
+        return jsonify({"error": "tracing is off; set TRACE_SAMPLE_RATE"}), 404
+    limit = request.args.get("limit", tracing.BUFFER_SIZE, type=int)
+    traces = tracing.recent(max(0, limit))
+    if request.args.get("id"):
+        traces = [t for t in tracing.recent() if t["id"] == request.args["id"]]
+    if request.args.get("format") == "text":
+        return Response("\n\n".join(tracing.render_text(t) for t in traces) + "\n", mimetype="text/plain")
+    return jsonify({"sample_rate": tracing.SAMPLE_RATE, "traces": traces})
+
+# Streaming: /chat/stream forwards each completion chunk as a Server-Sent Event.
 # See docs for streaming configurations & permissions.
 # https://docs.aws.amazon.com/bedrock/latest/userguide/agents-invoke-agent.html
 
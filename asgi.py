@@ -0,0 +1,283 @@
+# file: asgi.py
+"""Async serving mode for the Flask app.
+
+`/`, `/health`, `/chat`, `/chat/stream` and the room event streams are
+served natively on the event loop; every other route falls through to the
+Flask app. Upstream calls are
+still made with boto3, so each one runs on a dedicated thread pool sized to
+MAX_UPSTREAM_CONCURRENCY. Requests over the cap are rejected immediately (or
+after UPSTREAM_QUEUE_TIMEOUT seconds) with 503 and a Retry-After header
+instead of tying up a worker. Room questions run on the room's own thread
+but take a slot from the same cap through `app.upstream_gate`.
+"""
+import asyncio
+import contextlib
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import admission
+import app as flask_app
+import resilience
+import rooms
+from agent_runtime import iter_completion_text, sse_event
+from clients import MAX_UPSTREAM_CONCURRENCY
+
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "0"))
+UPSTREAM_RETRY_AFTER = flask_app.UPSTREAM_RETRY_AFTER
+
+_upstream_slots = asyncio.Semaphore(MAX_UPSTREAM_CONCURRENCY)
+_upstream_pool = ThreadPoolExecutor(max_workers=MAX_UPSTREAM_CONCURRENCY, thread_name_prefix="bedrock")
+_DONE = object()
+
+
+async def _acquire_slot() -> bool:
+	if UPSTREAM_QUEUE_TIMEOUT <= 0:
+		if _upstream_slots.locked():
+			return False
+		await _upstream_slots.acquire()
+		return True
+	try:
+		await asyncio.wait_for(_upstream_slots.acquire(), timeout=UPSTREAM_QUEUE_TIMEOUT)
+		return True
+	except asyncio.TimeoutError:
+		return False
+
+
+def _install_room_gate():
+	"""Makes room questions, which run on their own threads, take the same slots as /chat."""
+	loop = asyncio.get_running_loop()
+
+	def gate():
+		if not asyncio.run_coroutine_threadsafe(_acquire_slot(), loop).result():
+			return None
+		return lambda: loop.call_soon_threadsafe(_upstream_slots.release)
+
+	flask_app.upstream_gate = gate
+
+
+def _over_capacity():
+	return JSONResponse(
+		{"error": flask_app.OVER_CAPACITY},
+		status_code=503,
+		headers={"Retry-After": str(UPSTREAM_RETRY_AFTER)},
+	)
+
+
+def _rejected(e: admission.Rejected):
+	return JSONResponse(e.as_dict(), status_code=e.status, headers={"Retry-After": str(e.retry_after)})
+
+
+async def _wait_admitted(ticket: admission.Ticket):
+	# Polling keeps queued clients off the thread pool; only admitted calls use a thread.
+	while not ticket.wait(0):
+		await asyncio.sleep(0.05)
+
+
+def _stream_supervisor(session_id: str, user_text: str, challenge: str = ""):
+	"""Starts the upstream call and returns an async iterator over its text.
+
+	The caller must already hold a slot. The call is submitted right away and
+	the slot is released when the upstream thread finishes, not when the
+	client goes away, so the cap always reflects real Bedrock calls.
+	"""
+	loop = asyncio.get_running_loop()
+	queue: asyncio.Queue = asyncio.Queue()
+
+	def pump():
+		try:
+			resp = flask_app.invoke_turn(session_id, user_text, challenge)
+			for text in iter_completion_text(resp):
+				loop.call_soon_threadsafe(queue.put_nowait, text)
+		except Exception as e:
+			loop.call_soon_threadsafe(queue.put_nowait, e)
+		finally:
+			loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+	fut = loop.run_in_executor(_upstream_pool, pump)
+	fut.add_done_callback(lambda _: _upstream_slots.release())
+
+	async def drain():
+		while True:
+			item = await queue.get()
+			if item is _DONE:
+				return
+			if isinstance(item, Exception):
+				raise item
+			yield item
+
+	return drain()
+
+
+async def serve_index(request):
+	base_dir = os.path.dirname(os.path.abspath(__file__))
+	return FileResponse(os.path.join(base_dir, "index.html"))
+
+
+async def health(request):
+	return JSONResponse({
+		"status": "ok",
+		"mode": "asgi",
+		"region": flask_app.REGION,
+		"regions": flask_app.region_health(),
+		"supervisor_agent_id": flask_app.SUPERVISOR_AGENT_ID != "SUPERVISOR_AGENT_ID",
+		"supervisor_alias_id": flask_app.SUPERVISOR_ALIAS_ID != "SUPERVISOR_ALIAS_ID",
+		"upstream_limit": MAX_UPSTREAM_CONCURRENCY,
+	})
+
+
+async def chat(request):
+	data = await request.json()
+	user_text = data.get("message", "")
+	session_id = data.get("session_id") or str(uuid.uuid4())
+	# Cache hits never take an upstream slot.
+	cache_key = flask_app.reply_cache_key(data, user_text)
+	cached = flask_app.reply_cache.get(cache_key) if cache_key else None
+	if cached is not None:
+		return JSONResponse({"session_id": session_id, "reply": cached, "cached": True})
+	if flask_app.admission_control is not None:
+		ticket = None
+		try:
+			ticket = flask_app.admission_control.request(session_id)
+			await _wait_admitted(ticket)
+		except admission.Rejected as e:
+			return _rejected(e)
+		finally:
+			if ticket is not None:
+				ticket.cancel()
+	if not await _acquire_slot():
+		return _over_capacity()
+	try:
+		reply = "".join([text async for text in _stream_supervisor(session_id, user_text, data.get("challenge", ""))])
+	except Exception as e:
+		return JSONResponse({"session_id": session_id, "error": resilience.friendly_error(e)}, status_code=502)
+	if cache_key:
+		flask_app.reply_cache.put(cache_key, reply)
+	return JSONResponse({"session_id": session_id, "reply": reply})
+
+
+async def chat_stream(request):
+	data = await request.json()
+	user_text = data.get("message", "")
+	session_id = data.get("session_id") or str(uuid.uuid4())
+	cache_key = flask_app.reply_cache_key(data, user_text)
+	cached = flask_app.reply_cache.get(cache_key) if cache_key else None
+	ticket = None
+	stream = None
+	if cached is None:
+		if flask_app.admission_control is not None:
+			try:
+				ticket = flask_app.admission_control.request(session_id)
+			except admission.Rejected as e:
+				return _rejected(e)
+		if ticket is None or ticket.admitted:
+			if not await _acquire_slot():
+				return _over_capacity()
+			stream = _stream_supervisor(session_id, user_text, data.get("challenge", ""))
+
+	async def generate():
+		nonlocal stream
+		yield sse_event("session", {"session_id": session_id})
+		if cached is not None:
+			yield sse_event("chunk", {"text": cached})
+			yield sse_event("done", {"cached": True})
+			return
+		if stream is None:
+			# Queued: report the position while waiting, then take an upstream slot.
+			last_position = None
+			try:
+				while not ticket.wait(0):
+					if ticket.position != last_position:
+						last_position = ticket.position
+						yield sse_event("queued", {"position": last_position})
+					await asyncio.sleep(0.05)
+			except admission.Rejected as e:
+				yield sse_event("error", {"message": e.reason, "retry_after": e.retry_after})
+				yield sse_event("done", {})
+				return
+			finally:
+				ticket.cancel()
+			if not await _acquire_slot():
+				yield sse_event("error", {"message": "Too many players are waiting on the agents right now.", "retry_after": UPSTREAM_RETRY_AFTER})
+				yield sse_event("done", {})
+				return
+			stream = _stream_supervisor(session_id, user_text, data.get("challenge", ""))
+		output = []
+		try:
+			async for text in stream:
+				output.append(text)
+				yield sse_event("chunk", {"text": text})
+			if cache_key:
+				flask_app.reply_cache.put(cache_key, "".join(output))
+		except Exception as e:
+			yield sse_event("error", {"message": resilience.friendly_error(e)})
+		yield sse_event("done", {})
+
+	return StreamingResponse(
+		generate(),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+async def room_events(request):
+	# Subscribers only wait, so they stay on the event loop instead of holding a WSGI thread each.
+	try:
+		room = rooms.get_room(request.path_params["room_id"])
+	except ValueError as e:
+		return JSONResponse({"error": str(e)}, status_code=400)
+	except rooms.RoomLimit as e:
+		return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "30"})
+	except rooms.RoomsUnavailable as e:
+		return JSONResponse({"error": str(e)}, status_code=503)
+	after = rooms.parse_after(request.headers.get("last-event-id") or request.query_params.get("after"))
+	loop = asyncio.get_running_loop()
+
+	async def generate():
+		inbox: asyncio.Queue = asyncio.Queue()
+		backlog, unsubscribe = room.subscribe(lambda item: loop.call_soon_threadsafe(inbox.put_nowait, item), after)
+		try:
+			yield sse_event("state", room.state())
+			for seq, event, data in backlog:
+				yield sse_event(event, data, seq)
+			while True:
+				try:
+					seq, event, data = await asyncio.wait_for(inbox.get(), timeout=rooms.HEARTBEAT_S)
+				except asyncio.TimeoutError:
+					yield ": ping\n\n"
+					continue
+				yield sse_event(event, data, seq)
+		finally:
+			unsubscribe()
+
+	return StreamingResponse(
+		generate(),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(app):
+	_install_room_gate()
+	yield
+
+
+# Same policy as flask_cors' CORS(app) defaults, so the native routes answer cross-origin clients too.
+CORS_MIDDLEWARE = Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+app = Starlette(middleware=[CORS_MIDDLEWARE], lifespan=_lifespan, routes=[
+	Route("/", serve_index, methods=["GET"]),
+	Route("/health", health, methods=["GET"]),
+	Route("/chat", chat, methods=["POST"]),
+	Route("/chat/stream", chat_stream, methods=["POST"]),
+	Route("/rooms/{room_id}/events", room_events, methods=["GET"]),
+	Mount("/", app=WSGIMiddleware(flask_app.app)),
+])
@@ -0,0 +1,162 @@
+# file: bedrock_stub.py
+"""Local stand-in for the `bedrock-agent-runtime` client.
+
+`StubAgentRuntime.invoke_agent` returns a `completion` event stream shaped
+like the real one, with configurable first-chunk latency, inter-chunk delay,
+reply size and error rate, or replays streams recorded from the real service
+by `RecordingRuntime`. Select it with BEDROCK_STUB=1 (see
+`clients.get_runtime_client`); tune it with the STUB_* env vars.
+"""
+import base64
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+FILLER = (
+	"Vamos analisar as pistas com calma: o bilhete, o guardanapo e os rabiscos na mesa. "
+	"A data no formato ddmmaaaa sugere um aniversário — talvez o código do cadeado. "
+)
+
+
+class StubServiceError(Exception):
+	"""Raised for injected failures; carries a botocore-style error code."""
+
+	def __init__(self, code: str, message: str):
+		super().__init__(f"An error occurred ({code}) when calling the InvokeAgent operation: {message}")
+		self.response = {"Error": {"Code": code, "Message": message}}
+
+
+class StubAgentRuntime:
+	def __init__(
+		self,
+		first_chunk_s: float = 0.8,
+		chunk_delay_s: float = 0.05,
+		reply_bytes: int = 600,
+		chunk_bytes: int = 48,
+		error_rate: float = 0.0,
+		replay_path: str | None = None,
+		seed: int | None = None,
+	):
+		self.first_chunk_s = first_chunk_s
+		self.chunk_delay_s = chunk_delay_s
+		self.reply_bytes = reply_bytes
+		self.chunk_bytes = chunk_bytes
+		self.error_rate = error_rate
+		self._rng = random.Random(seed)
+		self._rng_lock = threading.Lock()
+		self._replays = _load_recordings(replay_path) if replay_path else []
+		self._replay_next = 0
+
+	@classmethod
+	def from_env(cls) -> "StubAgentRuntime":
+		return cls(
+			first_chunk_s=float(os.getenv("STUB_FIRST_CHUNK_S", "0.8")),
+			chunk_delay_s=float(os.getenv("STUB_CHUNK_DELAY_S", "0.05")),
+			reply_bytes=int(os.getenv("STUB_REPLY_BYTES", "600")),
+			chunk_bytes=int(os.getenv("STUB_CHUNK_BYTES", "48")),
+			error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+			replay_path=os.getenv("STUB_REPLAY") or None,
+		)
+
+	def _random(self) -> float:
+		with self._rng_lock:
+			return self._rng.random()
+
+	def invoke_agent(self, agentId: str, agentAliasId: str, sessionId: str, inputText: str, **kwargs) -> dict:
+		if self.error_rate and self._random() < self.error_rate:
+			time.sleep(self.first_chunk_s / 4)
+			raise StubServiceError("ThrottlingException", "Rate exceeded (stub)")
+		if self._replays:
+			with self._rng_lock:
+				recording = self._replays[self._replay_next % len(self._replays)]
+				self._replay_next += 1
+			completion = _replay(recording)
+		else:
+			completion = self._synthesize(inputText, kwargs.get("enableTrace", False))
+		return {"completion": completion, "contentType": "text/plain", "sessionId": sessionId, "memoryId": str(uuid.uuid4())}
+
+	def _synthesize(self, input_text: str, trace: bool = False):
+		body = (f"(stub) Pergunta recebida: {input_text[:80]}\n\n" + FILLER * (self.reply_bytes // len(FILLER) + 1)).encode("utf-8")
+		body = body[: self.reply_bytes].decode("utf-8", "ignore").encode("utf-8")
+		if trace:
+			yield from _synthetic_trace(input_text, self.first_chunk_s)
+		else:
+			time.sleep(self.first_chunk_s)
+		# Split on raw byte offsets on purpose: multibyte characters end up
+		# straddling chunks, just like the real stream.
+		for i in range(0, len(body), self.chunk_bytes):
+			if i:
+				time.sleep(self.chunk_delay_s)
+			yield {"chunk": {"bytes": body[i:i + self.chunk_bytes]}}
+
+
+def _synthetic_trace(input_text: str, total_s: float):
+	"""Orchestration events of a supervisor delegating once to a collaborator, spread over `total_s`."""
+	usage = {"metadata": {"usage": {"inputTokens": 900, "outputTokens": 120}}}
+	steps = [
+		(None, {"modelInvocationInput": {"type": "ORCHESTRATION", "text": input_text}}),
+		(None, {"modelInvocationOutput": usage}),
+		(None, {"rationale": {"text": "A pergunta é sobre um código; vou consultar o Gustavo."}}),
+		(None, {"invocationInput": {"invocationType": "AGENT_COLLABORATOR", "agentCollaboratorInvocationInput": {"agentCollaboratorName": "Gustavo", "input": {"text": input_text}}}}),
+		("Gustavo", {"modelInvocationInput": {"type": "ORCHESTRATION", "text": input_text}}),
+		("Gustavo", {"modelInvocationOutput": usage}),
+		(None, {"observation": {"type": "AGENT_COLLABORATOR", "agentCollaboratorInvocationOutput": {"agentCollaboratorName": "Gustavo", "output": {"text": "..."}}}}),
+		(None, {"modelInvocationInput": {"type": "ORCHESTRATION", "text": "..."}}),
+	]
+	for collaborator, body in steps:
+		time.sleep(total_s / len(steps))
+		event = {"trace": {"orchestrationTrace": body}}
+		if collaborator:
+			event["collaboratorName"] = collaborator
+		yield {"trace": event}
+
+
+def _load_recordings(path: str) -> list[list[dict]]:
+	recordings = []
+	with open(path, "r", encoding="utf-8") as f:
+		for line in f:
+			line = line.strip()
+			if line:
+				recordings.append(json.loads(line)["events"])
+	return recordings
+
+
+def _replay(events: list[dict]):
+	start = time.monotonic()
+	for event in events:
+		wait = event["t"] - (time.monotonic() - start)
+		if wait > 0:
+			time.sleep(wait)
+		yield {"chunk": {"bytes": base64.b64decode(event["bytes"])}}
+
+
+class RecordingRuntime:
+	"""Wraps a real client and appends every completion stream (with chunk timings) to a JSONL file."""
+
+	def __init__(self, client, path: str):
+		self._client = client
+		self._path = path
+		self._lock = threading.Lock()
+
+	def __getattr__(self, name):
+		return getattr(self._client, name)
+
+	def invoke_agent(self, **kwargs) -> dict:
+		start = time.monotonic()
+		resp = self._client.invoke_agent(**kwargs)
+		return {**resp, "completion": self._record(resp.get("completion", []), start)}
+
+	def _record(self, completion, start: float):
+		events = []
+		for event in completion:
+			if "chunk" in event and "bytes" in event["chunk"]:
+				events.append({
+					"t": round(time.monotonic() - start, 4),
+					"bytes": base64.b64encode(event["chunk"]["bytes"]).decode("ascii"),
+				})
+			yield event
+		with self._lock, open(self._path, "a", encoding="utf-8") as f:
+			f.write(json.dumps({"events": events}) + "\n")
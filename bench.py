@@ -0,0 +1,130 @@
+# file: bench.py
+"""Load test for the Flask/ASGI front end.
+
+Drives `/chat` and/or `/chat/stream` at a fixed concurrency and reports
+latency percentiles, time-to-first-chunk (streaming only), throughput and
+error rate. Pair it with the local runtime stub to compare server settings
+without spending Bedrock quota:
+
+	BEDROCK_STUB=1 gunicorn -c gunicorn.conf.py &
+	python bench.py --url http://localhost:8080 --endpoint both -c 50 -n 500
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values: list[float], pct: float) -> float:
+	if not values:
+		return 0.0
+	ordered = sorted(values)
+	k = (len(ordered) - 1) * pct / 100
+	lo = int(k)
+	hi = min(lo + 1, len(ordered) - 1)
+	return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def one_request(base_url: str, endpoint: str, message: str, timeout_s: float) -> dict:
+	body = json.dumps({"message": message, "session_id": str(uuid.uuid4())}).encode("utf-8")
+	path = "/chat/stream" if endpoint == "stream" else "/chat"
+	req = urllib.request.Request(base_url.rstrip("/") + path, data=body, headers={"Content-Type": "application/json"})
+	start = time.perf_counter()
+	first_chunk = None
+	size = 0
+	try:
+		with urllib.request.urlopen(req, timeout=timeout_s) as resp:
+			status = resp.status
+			if endpoint == "stream":
+				error = False
+				for raw in resp:
+					line = raw.decode("utf-8", "replace")
+					if line.startswith("event: chunk") and first_chunk is None:
+						first_chunk = time.perf_counter() - start
+					elif line.startswith("event: error"):
+						error = True
+					size += len(raw)
+				if error:
+					status = "stream-error"
+			else:
+				size = len(resp.read())
+	except urllib.error.HTTPError as e:
+		status = e.code
+	except Exception as e:
+		status = type(e).__name__
+	return {"status": status, "latency": time.perf_counter() - start, "ttfc": first_chunk, "bytes": size}
+
+
+def run(base_url: str, endpoint: str, concurrency: int, total: int, message: str, timeout_s: float) -> dict:
+	results = []
+	lock = threading.Lock()
+
+	def task(_):
+		r = one_request(base_url, endpoint, message, timeout_s)
+		with lock:
+			results.append(r)
+
+	start = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		list(pool.map(task, range(total)))
+	elapsed = time.perf_counter() - start
+
+	ok = [r for r in results if r["status"] == 200]
+	latencies = [r["latency"] for r in ok]
+	ttfcs = [r["ttfc"] for r in ok if r["ttfc"] is not None]
+	report = {
+		"endpoint": endpoint,
+		"concurrency": concurrency,
+		"requests": len(results),
+		"elapsed_s": round(elapsed, 3),
+		"throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+		"error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+		"statuses": {str(k): v for k, v in Counter(r["status"] for r in results).items()},
+		"latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 1) for p in (50, 95, 99)},
+		"avg_bytes": round(sum(r["bytes"] for r in ok) / len(ok)) if ok else 0,
+	}
+	if endpoint == "stream":
+		report["ttfc_ms"] = {f"p{p}": round(percentile(ttfcs, p) * 1000, 1) for p in (50, 95, 99)}
+	return report
+
+
+def print_report(report: dict):
+	print(f"\n== {report['endpoint']} @ concurrency {report['concurrency']} ==")
+	print(f"requests    {report['requests']} in {report['elapsed_s']}s  ({report['throughput_rps']} ok req/s)")
+	print(f"error rate  {report['error_rate'] * 100:.2f}%  statuses={report['statuses']}")
+	lat = report["latency_ms"]
+	print(f"latency ms  p50={lat['p50']}  p95={lat['p95']}  p99={lat['p99']}")
+	if "ttfc_ms" in report:
+		t = report["ttfc_ms"]
+		print(f"1st chunk   p50={t['p50']}  p95={t['p95']}  p99={t['p99']}")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark /chat and /chat/stream.")
+	parser.add_argument("--url", default="http://localhost:5000")
+	parser.add_argument("--endpoint", choices=["chat", "stream", "both"], default="both")
+	parser.add_argument("-c", "--concurrency", type=int, default=20)
+	parser.add_argument("-n", "--requests", type=int, default=200)
+	parser.add_argument("--message", default="Qual é o código do cadeado do bolo?")
+	parser.add_argument("--timeout", type=float, default=120.0)
+	parser.add_argument("--json", help="also write the reports to this file")
+	args = parser.parse_args()
+
+	endpoints = ["chat", "stream"] if args.endpoint == "both" else [args.endpoint]
+	reports = []
+	for endpoint in endpoints:
+		report = run(args.url, endpoint, args.concurrency, args.requests, args.message, args.timeout)
+		print_report(report)
+		reports.append(report)
+	if args.json:
+		with open(args.json, "w", encoding="utf-8") as f:
+			json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
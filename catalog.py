@@ -0,0 +1,268 @@
+# file: catalog.py
+"""Compiled index of the game content shared by app.py and streamlit_app.py.
+
+Sources are `challenges.json`, `respostas.txt` and every `.txt` under
+`agents_description/`. Each file is parsed once; `refresh()` only re-parses
+files whose mtime or size changed and swaps the new index in with a single
+reference assignment, so readers never see a half-built catalog. A compiled
+snapshot is persisted to disk so a cold start skips parsing entirely.
+"""
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+SNAPSHOT_VERSION = 1
+
+HEADING_RE = re.compile(r"^\s*#{2,6}\s+.*DESAFIO\s+\d+\s+[—\-–]\s+.*$", re.IGNORECASE)
+ANSWER_PREFIX = "**resposta:**"
+
+
+def normalize_challenge_key(title: str) -> str:
+	if not title:
+		return ""
+	# Strip heading hashes and emoji, then keep from 'DESAFIO ...'
+	clean = re.sub(r"^#+\s+", "", title).strip()
+	i = clean.upper().find("DESAFIO")
+	core = clean[i:] if i != -1 else clean
+	core = re.sub(r"\s+", " ", core)
+	return core.strip()
+
+
+def parse_desafios(text: str) -> list[dict]:
+	"""Splits '### DESAFIO N — ...' sections into title, description and answer."""
+	entries = []
+	current_title = None
+	buf = []
+	answer = ""
+
+	def flush():
+		desc = "\n".join(x for x in buf if not x.strip().lower().startswith(ANSWER_PREFIX)).strip()
+		entries.append({"title": current_title, "description": desc, "answer": answer})
+
+	for ln in text.splitlines():
+		ls = ln.strip()
+		if HEADING_RE.match(ls):
+			if current_title is not None:
+				flush()
+				buf = []
+				answer = ""
+			current_title = ls
+		elif current_title is not None:
+			buf.append(ln)
+			if ls.lower().startswith(ANSWER_PREFIX):
+				answer = ls[len(ANSWER_PREFIX):].strip().strip("* ")
+	if current_title is not None:
+		flush()
+	return entries
+
+
+def _parse_file(rel: str, text: str):
+	if rel == "challenges.json":
+		try:
+			return json.loads(text).get("challenges", [])
+		except ValueError:
+			return []
+	if rel == "respostas.txt" or rel.endswith("oficina_sem_respostas.txt"):
+		return {"text": text.strip(), "desafios": parse_desafios(text)}
+	return {"text": text.strip()}
+
+
+def _first(files: dict, prefix: str) -> str:
+	for name in sorted(files):
+		if name.startswith(prefix):
+			return files[name]
+	return ""
+
+
+class Catalog:
+	def __init__(self, base_dir: str | os.PathLike | None = None, snapshot_path: str | None = None):
+		self.base = Path(base_dir or Path(__file__).resolve().parent)
+		self.snapshot_path = snapshot_path
+		self._lock = threading.Lock()
+		self._files: dict[str, dict] = {}  # rel path -> {"mtime_ns", "size", "data"}
+		self._index: dict = {}
+		self._load_snapshot()
+		self.refresh()
+
+	# -- public accessors -------------------------------------------------
+	@property
+	def index(self) -> dict:
+		return self._index
+
+	@property
+	def challenges(self) -> list[dict]:
+		return self._index["challenges"]
+
+	@property
+	def desafios(self) -> list[dict]:
+		return self._index["desafios"]
+
+	@property
+	def personas(self) -> dict:
+		return self._index["personas"]
+
+	@property
+	def oficina_text(self) -> str:
+		return self._index["oficina_text"]
+
+	def challenge(self, title: str) -> dict | None:
+		"""Looks a challenge up by any form of its title (heading, display title, id)."""
+		return self._index["by_key"].get(normalize_challenge_key(title))
+
+	def answer(self, title: str) -> str:
+		return (self.challenge(title) or {}).get("answer", "")
+
+	# -- compilation ------------------------------------------------------
+	def _sources(self) -> list[Path]:
+		paths = [self.base / "challenges.json", self.base / "respostas.txt"]
+		agents_dir = self.base / "agents_description"
+		if agents_dir.is_dir():
+			paths.extend(sorted(agents_dir.glob("*/*.txt")))
+		return paths
+
+	def refresh(self) -> bool:
+		"""Re-parses changed files and swaps in a new index. Returns True if anything changed."""
+		with self._lock:
+			seen = {}
+			changed = False
+			for path in self._sources():
+				rel = path.relative_to(self.base).as_posix()
+				try:
+					st = path.stat()
+				except OSError:
+					continue
+				prev = self._files.get(rel)
+				if prev and prev["mtime_ns"] == st.st_mtime_ns and prev["size"] == st.st_size:
+					seen[rel] = prev
+					continue
+				try:
+					text = path.read_text(encoding="utf-8")
+				except (OSError, UnicodeDecodeError):
+					text = ""
+				seen[rel] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "data": _parse_file(rel, text)}
+				changed = True
+			if set(seen) != set(self._files):
+				changed = True
+			if not changed and self._index:
+				return False
+			self._files = seen
+			self._index = self._build_index(seen)
+			self._save_snapshot()
+			return True
+
+	def _build_index(self, files: dict) -> dict:
+		challenges = (files.get("challenges.json") or {}).get("data") or []
+		respostas = (files.get("respostas.txt") or {}).get("data") or {"desafios": []}
+
+		personas: dict[str, dict] = {}
+		persona_files: dict[str, dict] = {}
+		oficina_text = ""
+		for rel, entry in files.items():
+			parts = rel.split("/")
+			if len(parts) != 3 or parts[0] != "agents_description":
+				continue
+			persona_files.setdefault(parts[1], {})[parts[2]] = entry["data"]["text"]
+		preferred = files.get("agents_description/dra_caroline/oficina_sem_respostas.txt")
+		if preferred:
+			oficina_text = preferred["data"]["text"]
+		for name, texts in sorted(persona_files.items()):
+			if not oficina_text and "oficina_sem_respostas.txt" in texts:
+				oficina_text = texts["oficina_sem_respostas.txt"]
+			personas[name] = {
+				"background": _first(texts, "background"),
+				"descricao": _first(texts, "descricao"),
+				"dicas": _first(texts, "dicas"),
+				"files": texts,
+			}
+
+		challenge_texts = {}
+		for entry in parse_desafios(oficina_text) if oficina_text else []:
+			challenge_texts[normalize_challenge_key(entry["title"])] = entry["description"]
+
+		by_key = {}
+		for c in challenges:
+			record = {
+				"id": c.get("id", ""),
+				"title": c.get("title", ""),
+				"category": c.get("category", ""),
+				"difficulty": c.get("difficulty", ""),
+				"description": c.get("description", ""),
+				"answer": c.get("expected_answer", ""),
+				"source": "challenges.json",
+			}
+			for k in (record["id"], record["title"]):
+				if k:
+					by_key[normalize_challenge_key(k)] = record
+		desafios = []
+		for e in respostas["desafios"]:
+			key = normalize_challenge_key(e["title"])
+			record = {
+				"id": key,
+				"title": e["title"],
+				"category": "oficina",
+				"difficulty": "n/a",
+				"description": e["description"] or challenge_texts.get(key, ""),
+				"answer": e["answer"],
+				"source": "respostas.txt",
+			}
+			by_key[key] = record
+			desafios.append(record)
+
+		return {
+			"challenges": challenges,
+			"desafios": desafios,
+			"by_key": by_key,
+			"challenge_texts": challenge_texts,
+			"personas": personas,
+			"oficina_text": oficina_text,
+		}
+
+	# -- snapshot ---------------------------------------------------------
+	def _load_snapshot(self):
+		if not self.snapshot_path:
+			return
+		try:
+			with open(self.snapshot_path, "r", encoding="utf-8") as f:
+				snap = json.load(f)
+		except (OSError, ValueError):
+			return
+		if snap.get("version") != SNAPSHOT_VERSION or snap.get("base") != str(self.base):
+			return
+		self._files = snap.get("files", {})
+
+	def _save_snapshot(self):
+		if not self.snapshot_path:
+			return
+		tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+		try:
+			with open(tmp, "w", encoding="utf-8") as f:
+				json.dump({"version": SNAPSHOT_VERSION, "base": str(self.base), "files": self._files}, f, ensure_ascii=False)
+			os.replace(tmp, self.snapshot_path)
+		except OSError:
+			try:
+				os.remove(tmp)
+			except OSError:
+				pass
+
+
+_catalog: Catalog | None = None
+_catalog_lock = threading.Lock()
+_last_refresh = 0.0
+REFRESH_INTERVAL_S = float(os.getenv("CATALOG_REFRESH_INTERVAL", "2"))
+
+
+def get_catalog() -> Catalog:
+	"""Process-wide catalog; re-checks file mtimes at most every REFRESH_INTERVAL_S."""
+	global _catalog, _last_refresh
+	with _catalog_lock:
+		if _catalog is None:
+			snapshot = os.getenv("CATALOG_SNAPSHOT", str(Path(__file__).resolve().parent / ".catalog_snapshot.json"))
+			_catalog = Catalog(snapshot_path=snapshot or None)
+			_last_refresh = time.monotonic()
+		elif time.monotonic() - _last_refresh >= REFRESH_INTERVAL_S:
+			_last_refresh = time.monotonic()
+			_catalog.refresh()
+		return _catalog
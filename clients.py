@@ -0,0 +1,131 @@
+# file: clients.py
+"""Process-wide factory for `bedrock-agent-runtime` clients.
+
+Clients are cached by region and credentials, so every request (and every
+Streamlit rerun) reuses the same warm connection pool. The pool is sized to
+the server's concurrency, connections use TCP keep-alive, and retries use
+botocore's adaptive mode with tunable connect/read timeouts.
+
+BEDROCK_STUB=1 swaps in the local stub; BEDROCK_RECORD=<path> records
+completion streams for replay (see bedrock_stub). Every client gets
+deadlines, hedging and a circuit breaker (resilience.ResilientRuntime), is
+wrapped in metrics.MeteredRuntime under the caller's front-end label, and in
+tracing.TracingRuntime when TRACE_SAMPLE_RATE is set.
+
+With REGIONS set to more than one region, callers get a
+regions.RegionalRuntime over one client per region instead, whatever
+region they ask for (see regions).
+"""
+import os
+import threading
+
+import bedrock_stub
+import metrics
+import regions
+import resilience
+import tracing
+
+CONNECT_TIMEOUT_S = float(os.getenv("BEDROCK_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT_S = float(os.getenv("BEDROCK_READ_TIMEOUT", "120"))
+MAX_ATTEMPTS = int(os.getenv("BEDROCK_MAX_ATTEMPTS", "3"))
+# Upstream calls in flight per worker; asgi.py caps its thread pool with the same value.
+MAX_UPSTREAM_CONCURRENCY = int(os.getenv("MAX_UPSTREAM_CONCURRENCY", "64"))
+
+_lock = threading.Lock()
+_sessions: dict = {}
+_clients: dict = {}
+
+
+def pool_size() -> int:
+	"""BEDROCK_POOL_SIZE, else enough connections for the server's own concurrency.
+
+	Hedged calls can open a second stream each; without hedging a quarter is
+	kept spare for fan-out and breaker probes.
+	"""
+	if os.getenv("BEDROCK_POOL_SIZE"):
+		return int(os.getenv("BEDROCK_POOL_SIZE"))
+	base = max(10, MAX_UPSTREAM_CONCURRENCY, int(os.getenv("GUNICORN_THREADS", "0")))
+	return base * 2 if resilience.HEDGE_PERCENTILE > 0 else base + base // 4
+
+
+def _session(profile: str | None):
+	import boto3
+
+	session = _sessions.get(profile)
+	if session is None:
+		session = boto3.session.Session(profile_name=profile) if profile else boto3.session.Session()
+		_sessions[profile] = session
+	return session
+
+
+def _credentials_id(session) -> str:
+	creds = session.get_credentials()
+	return creds.access_key if creds else ""
+
+
+def _region_client(region: str, profile: str | None, deadline_s: float | None = None):
+	"""Cached bare client for one region; called with _lock held."""
+	if os.getenv("BEDROCK_STUB"):
+		key = ("stub", region, deadline_s)
+		if key not in _clients:
+			_clients[key] = _resilient(bedrock_stub.StubAgentRuntime.from_env(), deadline_s)
+		return _clients[key]
+
+	from botocore.config import Config
+
+	session = _session(profile)
+	key = (region, profile, _credentials_id(session), deadline_s)
+	client = _clients.get(key)
+	if client is None:
+		config = Config(
+			region_name=region,
+			max_pool_connections=pool_size(),
+			tcp_keepalive=True,
+			connect_timeout=CONNECT_TIMEOUT_S,
+			read_timeout=READ_TIMEOUT_S,
+			retries={"mode": "adaptive", "max_attempts": MAX_ATTEMPTS},
+		)
+		client = _resilient(session.client("bedrock-agent-runtime", config=config), deadline_s)
+		_clients[key] = client
+	return client
+
+
+def get_runtime_client(
+	region: str,
+	frontend: str = "flask",
+	profile: str | None = None,
+	deadline_s: float | None = None,
+):
+	"""Cached client for (region, credentials, front end, deadline).
+
+	`deadline_s` overrides INVOKE_DEADLINE_S for this caller's calls.
+	"""
+	region = (region or "").strip() or os.getenv("AWS_REGION", os.getenv("REGION", "us-east-1"))
+	with _lock:
+		if regions.configured():
+			# The region list replaces the single region; health is shared by every front end.
+			key = ("regions", profile, deadline_s, frontend)
+			if key not in _clients:
+				regional = _clients.get(("regions", profile, deadline_s))
+				if regional is None:
+					regional = regions.RegionalRuntime({r: _region_client(r, profile, deadline_s) for r in regions.REGIONS})
+					_clients[("regions", profile, deadline_s)] = regional
+				_clients[key] = _instrument(regional, frontend)
+			return _clients[key]
+		client = _region_client(region, profile, deadline_s)
+		key = ("frontend", id(client), frontend)
+		if key not in _clients:
+			_clients[key] = _instrument(client, frontend)
+		return _clients[key]
+
+
+def _resilient(client, deadline_s: float | None = None):
+	if os.getenv("BEDROCK_RECORD"):
+		client = bedrock_stub.RecordingRuntime(client, os.getenv("BEDROCK_RECORD"))
+	return resilience.ResilientRuntime(client, deadline_s=deadline_s)
+
+
+def _instrument(client, frontend: str):
+	if tracing.enabled():
+		client = tracing.TracingRuntime(client, frontend)
+	return metrics.MeteredRuntime(client, frontend)
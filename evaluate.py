@@ -0,0 +1,279 @@
+# file: evaluate.py
+"""Offline evaluation: every challenge against every configured agent.
+
+Sends each challenge (the `respostas.txt` DESAFIOs and `challenges.json`)
+to each agent alias on a bounded worker pool, grades the replies with the
+answer key and reports solve rate, latency percentiles, reply size and a
+token/cost proxy per agent and per agent × challenge. Results are appended
+to a JSONL file as they finish, so an interrupted run picks up where it
+stopped when started again with the same --out; runs that ended in an
+error are retried.
+
+Agents come from --agent NAME=AGENT_ID[:ALIAS_ID] (repeatable); without it,
+the supervisor (SUPERVISOR_AGENT_ID/SUPERVISOR_ALIAS_ID) and every agent in
+the manifest with <NAME>_AGENT_ID/<NAME>_ALIAS_ID set. With BEDROCK_STUB=1
+and nothing configured, the manifest agents run against the stub:
+
+	BEDROCK_STUB=1 python evaluate.py -c 8 --out eval_stub.jsonl
+	python evaluate.py --agent Maya=AGENT:ALIAS -c 4 --repeats 3 --out eval_maya.jsonl --json report.json
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import retrieval
+from bench import percentile
+from catalog import get_catalog, normalize_challenge_key
+from clients import get_runtime_client
+from grading import fold, get_answer_key
+from session_context import SessionContext
+
+QUESTION = "Resolva o desafio e termine com a resposta final em uma linha própria."
+# Rough bytes-per-token for Portuguese/English text; only used for the cost proxy.
+BYTES_PER_TOKEN = 4
+
+
+def manifest_agents() -> list[str]:
+	path = Path(os.getenv("AGENTS_MANIFEST", Path(__file__).resolve().parent / "agents_manifest.json"))
+	with open(path, "r", encoding="utf-8") as f:
+		return [a["name"] for a in json.load(f)["agents"] if a.get("collaboration") != "SUPERVISOR"]
+
+
+def env_prefix(name: str) -> str:
+	return re.sub(r"\W+", "_", fold(name)).upper()
+
+
+def configured_agents(specs: list[str]) -> dict[str, tuple[str, str]]:
+	"""name -> (agent_id, alias_id)."""
+	agents = {}
+	for spec in specs:
+		name, _, ids = spec.partition("=")
+		agent_id, _, alias_id = ids.partition(":")
+		if not name or not agent_id:
+			raise SystemExit(f"--agent expects NAME=AGENT_ID[:ALIAS_ID], got {spec!r}")
+		agents[name] = (agent_id, alias_id or "TSTALIASID")
+	if agents:
+		return agents
+	if os.getenv("SUPERVISOR_AGENT_ID") and os.getenv("SUPERVISOR_ALIAS_ID"):
+		agents["Supervisor"] = (os.environ["SUPERVISOR_AGENT_ID"], os.environ["SUPERVISOR_ALIAS_ID"])
+	for name in manifest_agents():
+		prefix = env_prefix(name)
+		if os.getenv(f"{prefix}_AGENT_ID") and os.getenv(f"{prefix}_ALIAS_ID"):
+			agents[name] = (os.environ[f"{prefix}_AGENT_ID"], os.environ[f"{prefix}_ALIAS_ID"])
+	if not agents and os.getenv("BEDROCK_STUB"):
+		agents = {name: (f"stub-{env_prefix(name).lower()}", "stub") for name in manifest_agents()}
+	return agents
+
+
+def all_challenges() -> list[dict]:
+	catalog = get_catalog()
+	records = catalog.desafios + [catalog.challenge(c["id"]) for c in catalog.challenges]
+	return [r for r in records if r and r.get("answer")]
+
+
+def load_done(path: str) -> dict[tuple, dict]:
+	"""Latest result per (agent, challenge, repeat) in the JSONL file, errors included."""
+	done = {}
+	if not path or not os.path.exists(path):
+		return done
+	with open(path, "r", encoding="utf-8") as f:
+		for line in f:
+			line = line.strip()
+			if not line:
+				continue
+			try:
+				r = json.loads(line)
+			except ValueError:
+				continue  # a line cut short by an interrupted run
+			done[(r["agent"], r["challenge_id"], r["repeat"])] = r
+	return done
+
+
+def final_line(reply: str) -> str:
+	"""The last non-empty line, where QUESTION asks for the answer."""
+	lines = [line for line in reply.splitlines() if line.strip()]
+	return lines[-1] if lines else ""
+
+
+def is_done(result: dict | None) -> bool:
+	"""Only runs that got an answer count; errors and timeouts are run again."""
+	return result is not None and not result["error"]
+
+
+def run_one(runtime, name: str, ids: tuple[str, str], record: dict, repeat: int, timeout_s: float) -> dict:
+	agent_id, alias_id = ids
+	grounding = retrieval.grounding(retrieval.persona_for(name), f"{record['title']} {record['description']}", exclude=record["description"])
+	turn = SessionContext().prepare(agent_id, record, QUESTION, grounding)
+	result = {
+		"agent": name,
+		"challenge_id": normalize_challenge_key(record["id"] or record["title"]),
+		"challenge": record["title"],
+		"repeat": repeat,
+		"input_bytes": len(turn.input_text.encode("utf-8")),
+	}
+	start = time.perf_counter()
+	first_chunk = None
+	parts = []
+	events: queue.Queue = queue.Queue()
+
+	def consume():
+		try:
+			resp = runtime.invoke_agent(
+				agentId=agent_id,
+				agentAliasId=alias_id,
+				sessionId=str(uuid.uuid4()),
+				inputText=turn.input_text,
+				sessionState=turn.session_state,
+				hedge=True,  # a fresh session per run, so a hedge cannot lose history
+			)
+			for event in resp.get("completion", []):
+				if "chunk" in event and "bytes" in event["chunk"]:
+					events.put(("chunk", time.perf_counter(), event["chunk"]["bytes"]))
+			events.put(("end", None, None))
+		except Exception as e:
+			events.put(("error", None, e))
+
+	# The call runs on its own thread so the deadline holds even while no event arrives.
+	threading.Thread(target=consume, name="evaluate-call", daemon=True).start()
+	deadline = start + timeout_s
+	try:
+		while True:
+			remaining = deadline - time.perf_counter()
+			if remaining <= 0:
+				raise TimeoutError(f"no complete reply in {timeout_s:.0f}s")
+			try:
+				kind, at, value = events.get(timeout=remaining)
+			except queue.Empty:
+				continue
+			if kind == "error":
+				raise value
+			if kind == "end":
+				break
+			if first_chunk is None:
+				first_chunk = at - start
+			parts.append(value)
+		reply = b"".join(parts).decode("utf-8", "replace")
+		# Only the final line counts, so working that lists every candidate cannot pass.
+		graded = get_answer_key().grade(record["title"], final_line(reply))
+		result.update(correct=graded.correct, kind=graded.kind, error="")
+	except Exception as e:
+		reply = b"".join(parts).decode("utf-8", "replace")
+		result.update(correct=False, kind="", error=f"{type(e).__name__}: {e}")
+	result.update(
+		latency_s=round(time.perf_counter() - start, 3),
+		ttfc_s=round(first_chunk, 3) if first_chunk is not None else None,
+		output_bytes=len(reply.encode("utf-8")),
+		reply=reply,
+	)
+	return result
+
+
+def summarize(results: list[dict], price_in: float, price_out: float) -> dict:
+	def stats(rows: list[dict]) -> dict:
+		graded = [r for r in rows if r["correct"] is not None and not r["error"]]
+		ok = [r for r in rows if not r["error"]]
+		latencies = [r["latency_s"] for r in ok]
+		ttfcs = [r["ttfc_s"] for r in ok if r["ttfc_s"] is not None]
+		tokens_in = sum(r["input_bytes"] for r in rows) / BYTES_PER_TOKEN
+		tokens_out = sum(r["output_bytes"] for r in rows) / BYTES_PER_TOKEN
+		return {
+			"runs": len(rows),
+			"errors": len(rows) - len(ok),
+			"solve_rate": round(sum(1 for r in graded if r["correct"]) / len(graded), 3) if graded else None,
+			"latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000) for p in (50, 95, 99)},
+			"ttfc_ms_p50": round(percentile(ttfcs, 50) * 1000),
+			"avg_reply_bytes": round(sum(r["output_bytes"] for r in ok) / len(ok)) if ok else 0,
+			"est_tokens": {"input": round(tokens_in), "output": round(tokens_out)},
+			"cost_proxy": round(tokens_in / 1000 * price_in + tokens_out / 1000 * price_out, 4),
+		}
+
+	by_agent: dict[str, list] = {}
+	by_pair: dict[tuple, list] = {}
+	for r in results:
+		by_agent.setdefault(r["agent"], []).append(r)
+		by_pair.setdefault((r["agent"], r["challenge"]), []).append(r)
+	return {
+		"agents": {name: stats(rows) for name, rows in sorted(by_agent.items())},
+		"pairs": [
+			{"agent": agent, "challenge": challenge, **stats(rows)}
+			for (agent, challenge), rows in sorted(by_pair.items())
+		],
+	}
+
+
+def print_report(report: dict):
+	print(f"\n{'agent':<14} {'runs':>5} {'err':>4} {'solved':>7} {'p50 ms':>8} {'p95 ms':>8} {'1st ms':>7} {'bytes':>6} {'cost':>8}")
+	for name, s in report["agents"].items():
+		solved = "-" if s["solve_rate"] is None else f"{s['solve_rate'] * 100:.0f}%"
+		print(
+			f"{name:<14} {s['runs']:>5} {s['errors']:>4} {solved:>7} {s['latency_ms']['p50']:>8} "
+			f"{s['latency_ms']['p95']:>8} {s['ttfc_ms_p50']:>7} {s['avg_reply_bytes']:>6} {s['cost_proxy']:>8}"
+		)
+	print()
+	for p in report["pairs"]:
+		solved = "-" if p["solve_rate"] is None else f"{p['solve_rate'] * 100:.0f}%"
+		print(f"  {p['agent']:<14} {solved:>5}  p50 {p['latency_ms']['p50']:>6} ms  {p['challenge']}")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Run every challenge against every agent and grade the replies.")
+	parser.add_argument("--agent", action="append", default=[], help="NAME=AGENT_ID[:ALIAS_ID]; repeatable")
+	parser.add_argument("--region", default=os.getenv("AWS_REGION", os.getenv("REGION", "us-east-1")))
+	parser.add_argument("-c", "--concurrency", type=int, default=4)
+	parser.add_argument("--repeats", type=int, default=1, help="runs per agent × challenge")
+	parser.add_argument("--timeout", type=float, default=180.0)
+	parser.add_argument("--out", default="evaluation.jsonl", help="results file; existing results are reused")
+	parser.add_argument("--json", help="also write the report to this file")
+	parser.add_argument("--price-in", type=float, default=0.003, help="cost per 1k input tokens")
+	parser.add_argument("--price-out", type=float, default=0.015, help="cost per 1k output tokens")
+	args = parser.parse_args()
+
+	agents = configured_agents(args.agent)
+	if not agents:
+		raise SystemExit("No agents configured; pass --agent or set SUPERVISOR_*/<NAME>_AGENT_ID (or BEDROCK_STUB=1).")
+	challenges = all_challenges()
+	done = load_done(args.out)
+	jobs = [
+		(name, ids, record, repeat)
+		for name, ids in agents.items()
+		for record in challenges
+		for repeat in range(args.repeats)
+		if not is_done(done.get((name, normalize_challenge_key(record["id"] or record["title"]), repeat)))
+	]
+	total = len(agents) * len(challenges) * args.repeats
+	print(f"{len(agents)} agents × {len(challenges)} challenges × {args.repeats}: {total - len(jobs)} done, {len(jobs)} to run")
+
+	# --timeout is the limit for a whole call, so the runtime's own deadline must not cut it shorter.
+	runtime = get_runtime_client(args.region, frontend="evaluate", deadline_s=args.timeout)
+	lock = threading.Lock()
+	finished = 0
+
+	def task(job):
+		nonlocal finished
+		result = run_one(runtime, *job, args.timeout)
+		with lock, open(args.out, "a", encoding="utf-8") as f:
+			f.write(json.dumps(result, ensure_ascii=False) + "\n")
+			finished += 1
+			mark = "✓" if result["correct"] else ("!" if result["error"] else "✗")
+			print(f"[{finished}/{len(jobs)}] {mark} {result['agent']} · {result['challenge']} ({result['latency_s']}s)", flush=True)
+
+	with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+		list(pool.map(task, jobs))
+
+	results = [r for r in load_done(args.out).values() if r["agent"] in agents]
+	report = summarize(results, args.price_in, args.price_out)
+	print_report(report)
+	if args.json:
+		with open(args.json, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+	main()
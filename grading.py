@@ -0,0 +1,248 @@
+# file: grading.py
+"""Answer verification for the challenges in the catalog.
+
+Every answer key is compiled once into a typed matcher:
+
+- ``code``: a numeric code such as ``947`` (must appear as a whole number);
+- ``date``: an 8-digit ``ddmmaaaa`` code, also accepted as ``12/03/1979`` or
+  ``12 de março de 1979``;
+- ``sequence``: ordered numbers such as ``1 - 3 - 5`` or ``8 1 6 / 3 5 7 / 4 9 2``;
+- ``assignment``: named parts such as ``Alice: liar, Bob: truth-teller``;
+- ``phrase`` / ``keywords``: free text, matched as a whole phrase or by its
+  content words.
+
+A reply is tokenized once into a :class:`Features` set sized for the compiled
+keys, after which each check is a handful of set lookups regardless of how
+long the reply is.
+
+Agent replies are graded by containment, since the answer sits inside an
+explanation. Typed attempts are graded with ``strict=True``: the attempt must
+be the answer itself (one code, date or sequence), so listing candidates
+does not pass.
+"""
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+
+from catalog import get_catalog, normalize_challenge_key
+
+MONTHS = {
+	"janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6, "julho": 7,
+	"agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12,
+	"january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+	"august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+}
+STOPWORDS = {
+	"a", "an", "and", "the", "of", "to", "is", "are", "in", "on", "at", "by", "for", "with", "where",
+	"their", "each", "but", "or", "o", "os", "as", "e", "de", "da", "do", "das", "dos", "em", "um",
+	"uma", "que", "com", "para", "por",
+}
+NUMERIC_RE = re.compile(r"\d+")
+WORD_RE = re.compile(r"[a-z0-9]+")
+DATE_SEP_RE = re.compile(r"\b(\d{1,2})\s*[/.\-]\s*(\d{1,2})\s*[/.\-]\s*(\d{4})\b")
+DATE_WORDS_RE = re.compile(r"\b(\d{1,2})\s+(?:de\s+)?([a-z]+)\s+(?:de\s+)?(\d{4})\b")
+SEQUENCE_RE = re.compile(r"^[\d\s\-/,;>→|]+$")
+ASSIGNMENT_RE = re.compile(r"^\s*[^:,]+:[^,]+(,\s*[^:,]+:[^,]+)+$")
+
+
+def fold(text: str) -> str:
+	"""Lower-cases and strips accents and markdown emphasis."""
+	text = unicodedata.normalize("NFKD", text or "")
+	text = "".join(ch for ch in text if not unicodedata.combining(ch))
+	return text.replace("*", "").replace("`", "").casefold()
+
+
+def _valid_date(dd: int, mm: int, yyyy: int) -> bool:
+	return 1 <= dd <= 31 and 1 <= mm <= 12 and 1000 <= yyyy <= 2999
+
+
+class Features:
+	"""Everything the matchers need from one reply, computed in a single pass."""
+
+	def __init__(self, text: str, seq_lengths=(), phrase_lengths=(), names=()):
+		folded = fold(text)
+		self.numbers = NUMERIC_RE.findall(folded)
+		self.number_set = set(self.numbers)
+		self.tokens = WORD_RE.findall(folded)
+		self.token_set = set(self.tokens)
+
+		self.dates = {n for n in self.numbers if len(n) == 8}
+		for dd, mm, yyyy in DATE_SEP_RE.findall(folded):
+			self.dates.add(f"{int(dd):02d}{int(mm):02d}{yyyy}")
+		for dd, month, yyyy in DATE_WORDS_RE.findall(folded):
+			if month in MONTHS:
+				self.dates.add(f"{int(dd):02d}{MONTHS[month]:02d}{yyyy}")
+
+		self.number_ngrams = set()
+		for n in seq_lengths:
+			for i in range(len(self.numbers) - n + 1):
+				self.number_ngrams.add("-".join(self.numbers[i:i + n]))
+		self.token_ngrams = set()
+		for n in phrase_lengths:
+			for i in range(len(self.tokens) - n + 1):
+				self.token_ngrams.add(" ".join(self.tokens[i:i + n]))
+
+		# For each known name, the words of every clause that mentions it.
+		self.clauses: dict[str, set] = {}
+		if names:
+			for clause in re.split(r"[,;.\n]", folded):
+				words = WORD_RE.findall(clause)
+				for name in names:
+					if name in words:
+						self.clauses.setdefault(name, set()).update(w for w in words if w != name)
+
+
+@dataclass(frozen=True)
+class Matcher:
+	kind: str
+	answer: str
+	key: tuple
+
+	def matches(self, f: Features, strict: bool = False) -> bool:
+		if strict:
+			return self.equals(f)
+		if self.kind == "code":
+			return self.key[0] in f.number_set
+		if self.kind == "date":
+			return self.key[0] in f.dates
+		if self.kind == "sequence":
+			return self.key[0] in f.number_ngrams
+		if self.kind == "phrase":
+			return self.key[0] in f.token_ngrams
+		if self.kind == "keywords":
+			words = self.key
+			return sum(1 for w in words if w in f.token_set) >= max(1, round(len(words) * 0.6))
+		if self.kind == "assignment":
+			return all(set(value) <= f.clauses.get(name, set()) for name, value in self.key)
+		return False
+
+	def equals(self, f: Features) -> bool:
+		"""Strict check for typed attempts: nothing but the answer (free text keeps its keyword rule)."""
+		if self.kind == "code":
+			return f.numbers == [self.key[0]]
+		if self.kind == "date":
+			code = self.key[0]
+			parts = {code, code[:2], code[2:4], code[4:], str(int(code[:2])), str(int(code[2:4]))}
+			return f.dates == {code} and set(f.numbers) <= parts
+		if self.kind == "sequence":
+			return "-".join(f.numbers) == self.key[0]
+		if self.kind == "phrase":
+			return " ".join(f.tokens) == self.key[0]
+		if self.kind == "assignment":
+			values = {w for _, value in self.key for w in value}
+			return all(
+				set(value) <= f.clauses.get(name, set()) and not (f.clauses.get(name, set()) & (values - set(value)))
+				for name, value in self.key
+			)
+		return self.matches(f)
+
+
+def compile_answer(answer: str) -> Matcher | None:
+	folded = fold(answer).strip()
+	if not folded:
+		return None
+	numbers = NUMERIC_RE.findall(folded)
+	words = WORD_RE.findall(folded)
+
+	if ASSIGNMENT_RE.match(folded):
+		pairs = []
+		for part in folded.split(","):
+			name, _, value = part.partition(":")
+			name_words = WORD_RE.findall(name)
+			value_words = tuple(w for w in WORD_RE.findall(value) if w not in STOPWORDS)
+			if name_words and value_words:
+				pairs.append((name_words[-1], value_words))
+		if pairs:
+			return Matcher("assignment", answer, tuple(pairs))
+	if numbers and SEQUENCE_RE.match(folded):
+		if len(numbers) == 1:
+			code = numbers[0]
+			if len(code) == 8 and _valid_date(int(code[:2]), int(code[2:4]), int(code[4:])):
+				return Matcher("date", answer, (code,))
+			return Matcher("code", answer, (code,))
+		return Matcher("sequence", answer, ("-".join(numbers),))
+	if len(numbers) == 1 and len(words) <= 3:
+		# e.g. '17 minutes': the number is the answer, the unit is optional
+		return Matcher("code", answer, (numbers[0],))
+	if answer.strip().isupper() or len(words) <= 5:
+		return Matcher("phrase", answer, (" ".join(words),))
+	content = tuple(dict.fromkeys(w for w in words if w not in STOPWORDS and (len(w) > 2 or w.isdigit())))
+	return Matcher("keywords", answer, content)
+
+
+@dataclass(frozen=True)
+class GradeResult:
+	challenge: str
+	correct: bool | None
+	kind: str = ""
+	error: str = ""
+
+	def as_dict(self) -> dict:
+		out = {"challenge": self.challenge, "correct": self.correct, "kind": self.kind}
+		if self.error:
+			out["error"] = self.error
+		return out
+
+
+class AnswerKey:
+	"""Compiled matchers for every challenge, keyed by normalized challenge title."""
+
+	def __init__(self, answers: dict[str, str]):
+		self.matchers: dict[str, Matcher] = {}
+		for key, answer in answers.items():
+			matcher = compile_answer(answer)
+			if matcher is not None:
+				self.matchers[normalize_challenge_key(key)] = matcher
+		ms = self.matchers.values()
+		self.seq_lengths = sorted({m.key[0].count("-") + 1 for m in ms if m.kind == "sequence"})
+		self.phrase_lengths = sorted({m.key[0].count(" ") + 1 for m in ms if m.kind == "phrase"})
+		self.names = sorted({name for m in ms if m.kind == "assignment" for name, _ in m.key})
+
+	@classmethod
+	def from_catalog(cls, catalog) -> "AnswerKey":
+		answers = {}
+		for record in catalog.index["by_key"].values():
+			if record.get("answer"):
+				answers[record["id"]] = record["answer"]
+				answers[record["title"]] = record["answer"]
+		return cls(answers)
+
+	def matcher(self, challenge: str) -> Matcher | None:
+		return self.matchers.get(normalize_challenge_key(challenge))
+
+	def features(self, text: str) -> Features:
+		return Features(text, self.seq_lengths, self.phrase_lengths, self.names)
+
+	def grade(self, challenge: str, text: str, features: Features | None = None, strict: bool = False) -> GradeResult:
+		"""`strict=True` for answers typed by players, containment for agent replies."""
+		matcher = self.matcher(challenge)
+		if matcher is None:
+			return GradeResult(challenge, None, error="unknown challenge")
+		return GradeResult(challenge, matcher.matches(features or self.features(text), strict), matcher.kind)
+
+	def grade_many(self, attempts, strict: bool = False) -> list[GradeResult]:
+		"""Grades (challenge, text) pairs; identical texts are tokenized once."""
+		seen: dict[str, Features] = {}
+		results = []
+		for challenge, text in attempts:
+			if text not in seen:
+				seen[text] = self.features(text)
+			results.append(self.grade(challenge, text, seen[text], strict))
+		return results
+
+
+_answer_key: AnswerKey | None = None
+_answer_key_source = None
+_answer_key_lock = threading.Lock()
+
+
+def get_answer_key() -> AnswerKey:
+	"""Answer key for the current catalog; recompiled only when the catalog swaps its index."""
+	global _answer_key, _answer_key_source
+	catalog = get_catalog()
+	with _answer_key_lock:
+		if _answer_key is None or _answer_key_source is not catalog.index:
+			_answer_key = AnswerKey.from_catalog(catalog)
+			_answer_key_source = catalog.index
+		return _answer_key
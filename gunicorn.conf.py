@@ -0,0 +1,32 @@
+# file: gunicorn.conf.py
+# SERVER_MODE=asgi (default) serves asgi:app on uvicorn workers;
+# SERVER_MODE=wsgi keeps the original gthread workers on app:app.
+import os
+import shutil
+
+# Workers share metrics through per-process files in METRICS_DIR (see metrics.py).
+os.environ.setdefault("METRICS_DIR", "/tmp/jigsaw_metrics")
+# ...and sampled traces through TRACE_DIR (see tracing.py).
+os.environ.setdefault("TRACE_DIR", "/tmp/jigsaw_traces")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+asgi = os.getenv("SERVER_MODE", "asgi").lower() != "wsgi"
+# One event loop already serves many players, and rooms live in one process's
+# memory and refuse to run when workers > 1 (see rooms.py), so asgi mode runs
+# a single worker unless WEB_CONCURRENCY says otherwise.
+workers = int(os.getenv("WEB_CONCURRENCY", "1" if asgi else "2"))
+os.environ["GUNICORN_WORKERS"] = str(workers)
+
+if not asgi:
+	wsgi_app = "app:app"
+	worker_class = "gthread"
+	threads = int(os.getenv("GUNICORN_THREADS", "1"))
+else:
+	wsgi_app = "asgi:app"
+	worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def on_starting(server):
+	# Start every deployment with empty counters.
+	shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+	shutil.rmtree(os.environ["TRACE_DIR"], ignore_errors=True)
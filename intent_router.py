@@ -0,0 +1,149 @@
+# file: intent_router.py
+"""Optional local router that sends a message straight to one collaborator.
+
+Each message is scored against every collaborator's keywords (from
+`agents_manifest.json`) plus a prior from the selected challenge's category
+(`Logic`, `Social`, `Spatial`), matched against the collaboration
+instructions. When the best collaborator wins clearly enough, its alias is
+invoked directly and the supervisor hop is skipped; otherwise the message
+goes to the supervisor as before. Every decision is logged with its
+latency and the estimated time saved against recent supervisor turns.
+
+Enable with ROUTER=on and set <NAME>_AGENT_ID / <NAME>_ALIAS_ID for each
+collaborator (e.g. GUSTAVO_AGENT_ID).
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from grading import fold
+
+log = logging.getLogger("jigsaw.router")
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+CATEGORY_WEIGHT = 2.0
+SUPERVISOR = "supervisor"
+
+
+@dataclass
+class Route:
+	target: str
+	agent_id: str
+	alias_id: str
+	confidence: float
+	scores: dict = field(default_factory=dict)
+
+	@property
+	def direct(self) -> bool:
+		return self.target != SUPERVISOR
+
+
+class IntentRouter:
+	def __init__(
+		self,
+		collaborators: list[dict],
+		supervisor_agent_id: str,
+		supervisor_alias_id: str,
+		min_confidence: float = 0.6,
+		min_score: float = 2.0,
+	):
+		"""`collaborators` items: {"name", "agent_id", "alias_id", "instruction", "keywords"}."""
+		self.supervisor = (supervisor_agent_id, supervisor_alias_id)
+		self.min_confidence = min_confidence
+		self.min_score = min_score
+		self.collaborators = []
+		for c in collaborators:
+			self.collaborators.append({
+				**c,
+				"keywords": {fold(k) for k in c.get("keywords", [])},
+				"instruction_words": set(WORD_RE.findall(fold(c.get("instruction", "")))),
+			})
+		self._lock = threading.Lock()
+		self._ewma: dict[str, float] = {}
+
+	def _score(self, words: list[str], keywords: set) -> float:
+		score = 0.0
+		for w in words:
+			if w in keywords or any(len(k) >= 4 and w.startswith(k) for k in keywords):
+				score += 1
+		return score
+
+	def route(self, message: str, category: str = "") -> Route:
+		words = WORD_RE.findall(fold(message))
+		cat = fold(category).strip()
+		scores = {}
+		for c in self.collaborators:
+			score = self._score(words, c["keywords"])
+			if cat and cat in c["instruction_words"]:
+				score += CATEGORY_WEIGHT
+			scores[c["name"]] = score
+		total = sum(scores.values())
+		if total:
+			best = max(self.collaborators, key=lambda c: scores[c["name"]])
+			top = scores[best["name"]]
+			confidence = top / total
+			# Unconfigured collaborators still score, so they are never mistaken for someone else.
+			if top >= self.min_score and confidence >= self.min_confidence and best["agent_id"]:
+				return Route(best["name"], best["agent_id"], best["alias_id"], round(confidence, 3), scores)
+			return Route(SUPERVISOR, *self.supervisor, round(confidence, 3), scores)
+		return Route(SUPERVISOR, *self.supervisor, 0.0, scores)
+
+	def _observe(self, target: str, latency_s: float) -> float:
+		with self._lock:
+			prev = self._ewma.get(target)
+			self._ewma[target] = latency_s if prev is None else 0.8 * prev + 0.2 * latency_s
+			return self._ewma.get(SUPERVISOR, 0.0)
+
+	def timed(self, resp: dict, route: Route, start: float) -> dict:
+		"""Wraps the completion stream so the decision is logged once the turn ends."""
+
+		def completion():
+			try:
+				yield from resp.get("completion", [])
+			finally:
+				latency = time.perf_counter() - start
+				supervisor_avg = self._observe(route.target, latency)
+				saved = f"{supervisor_avg - latency:.2f}s" if route.direct and supervisor_avg else "n/a"
+				log.info(
+					"route=%s confidence=%.2f scores=%s latency=%.2fs est_saved=%s",
+					route.target, route.confidence, route.scores, latency, saved,
+				)
+
+		return {**resp, "completion": completion()}
+
+
+def from_env(supervisor_agent_id: str, supervisor_alias_id: str) -> IntentRouter | None:
+	"""Router built from the manifest and <NAME>_AGENT_ID/<NAME>_ALIAS_ID, or None when ROUTER is off."""
+	if os.getenv("ROUTER", "off").strip().lower() not in {"on", "1", "true", "yes"}:
+		return None
+	path = Path(os.getenv("AGENTS_MANIFEST", Path(__file__).resolve().parent / "agents_manifest.json"))
+	with open(path, "r", encoding="utf-8") as f:
+		manifest = json.load(f)
+	links = [link for a in manifest["agents"] for link in a.get("collaborators", [])]
+	collaborators = []
+	for link in links:
+		prefix = re.sub(r"\W+", "_", fold(link["agent"])).upper()
+		agent_id = os.getenv(f"{prefix}_AGENT_ID", "")
+		alias_id = os.getenv(f"{prefix}_ALIAS_ID", "")
+		if not agent_id or not alias_id:
+			log.warning("router: %s has no %s_AGENT_ID/%s_ALIAS_ID; it will be reached via the supervisor", link["agent"], prefix, prefix)
+			agent_id = alias_id = ""
+		collaborators.append({
+			"name": link["agent"],
+			"agent_id": agent_id,
+			"alias_id": alias_id,
+			"instruction": link.get("instruction", ""),
+			"keywords": link.get("keywords", []),
+		})
+	return IntentRouter(
+		collaborators,
+		supervisor_agent_id,
+		supervisor_alias_id,
+		min_confidence=float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.6")),
+		min_score=float(os.getenv("ROUTER_MIN_SCORE", "2")),
+	)
@@ -0,0 +1,229 @@
+# file: metrics.py
+"""Prometheus-style metrics for upstream agent calls.
+
+Each process keeps its own samples in memory. When METRICS_DIR is set, they
+are also written to `<METRICS_DIR>/<pid>.json` (at most once per
+METRICS_FLUSH_INTERVAL seconds) and `render()` merges every file in the
+directory, so `/metrics` reports totals across all gunicorn workers and the
+Streamlit app alike. Gauges of processes that have exited are dropped;
+their counters and histograms are kept.
+"""
+import json
+import math
+import os
+import threading
+import time
+
+BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+
+DEFINITIONS = {
+	"bedrock_requests_total": ("counter", "invoke_agent calls started."),
+	"bedrock_errors_total": ("counter", "invoke_agent calls that failed, by error code or exception class."),
+	"bedrock_response_bytes_total": ("counter", "Completion bytes received."),
+	"bedrock_response_chunks_total": ("counter", "Completion chunks received."),
+	"bedrock_hedged_requests_total": ("counter", "Second requests started because the first had no chunk yet."),
+	"bedrock_region_failovers_total": ("counter", "invoke_agent calls retried in another region, by the region that failed."),
+	"bedrock_region_ejections_total": ("counter", "Times a region was taken out of rotation for a cooldown."),
+	"bedrock_inflight_requests": ("gauge", "invoke_agent calls currently in progress."),
+	"bedrock_latency_seconds": ("histogram", "Time from invoke_agent to the end of the completion stream."),
+	"bedrock_first_chunk_seconds": ("histogram", "Time from invoke_agent to the first completion chunk."),
+}
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+FLUSH_INTERVAL_S = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+
+_lock = threading.Lock()
+_samples: dict[str, dict] = {}  # series key -> {"name", "labels", "value" | "buckets"/"sum"/"count"}
+_last_flush = 0.0
+
+
+def _series(name: str, labels: dict) -> dict:
+	key = json.dumps([name, sorted(labels.items())])
+	series = _samples.get(key)
+	if series is None:
+		series = {"name": name, "labels": dict(labels)}
+		if DEFINITIONS[name][0] == "histogram":
+			series.update(buckets=[0] * len(BUCKETS), sum=0.0, count=0)
+		else:
+			series["value"] = 0.0
+		_samples[key] = series
+	return series
+
+
+def inc(name: str, value: float = 1.0, **labels):
+	with _lock:
+		_series(name, labels)["value"] += value
+	_maybe_flush()
+
+
+def observe(name: str, value: float, **labels):
+	with _lock:
+		series = _series(name, labels)
+		for i, bound in enumerate(BUCKETS):
+			if value <= bound:
+				series["buckets"][i] += 1
+		series["sum"] += value
+		series["count"] += 1
+	_maybe_flush()
+
+
+def error_code(exc: BaseException) -> str:
+	"""botocore error code when there is one (e.g. ThrottlingException), else the class name."""
+	response = getattr(exc, "response", None)
+	if isinstance(response, dict):
+		code = response.get("Error", {}).get("Code")
+		if code:
+			return code
+	return type(exc).__name__
+
+
+def _maybe_flush(force: bool = False):
+	global _last_flush
+	if not METRICS_DIR:
+		return
+	now = time.monotonic()
+	if not force and now - _last_flush < FLUSH_INTERVAL_S:
+		return
+	_last_flush = now
+	with _lock:
+		payload = json.dumps(list(_samples.values()))
+	path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+	tmp = f"{path}.{threading.get_ident()}.tmp"  # forced flushes may run on several threads at once
+	try:
+		os.makedirs(METRICS_DIR, exist_ok=True)
+		with open(tmp, "w", encoding="utf-8") as f:
+			f.write(payload)
+		os.replace(tmp, path)
+	except OSError:
+		pass
+
+
+def _pid_alive(pid: int) -> bool:
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		return True
+	return True
+
+
+def _collect() -> list[dict]:
+	if not METRICS_DIR:
+		with _lock:
+			return json.loads(json.dumps(list(_samples.values())))
+	_maybe_flush(force=True)
+	merged: dict[str, dict] = {}
+	try:
+		names = os.listdir(METRICS_DIR)
+	except OSError:
+		names = []
+	for fname in names:
+		if not fname.endswith(".json"):
+			continue
+		try:
+			pid = int(fname[:-5])
+			with open(os.path.join(METRICS_DIR, fname), "r", encoding="utf-8") as f:
+				samples = json.load(f)
+		except (ValueError, OSError):
+			continue
+		alive = _pid_alive(pid)
+		for s in samples:
+			kind = DEFINITIONS.get(s["name"], ("counter",))[0]
+			if kind == "gauge" and not alive:
+				continue
+			key = json.dumps([s["name"], sorted(s["labels"].items())])
+			into = merged.get(key)
+			if into is None:
+				merged[key] = s
+			elif kind == "histogram":
+				into["buckets"] = [a + b for a, b in zip(into["buckets"], s["buckets"])]
+				into["sum"] += s["sum"]
+				into["count"] += s["count"]
+			else:
+				into["value"] += s["value"]
+	return list(merged.values())
+
+
+def _fmt_labels(labels: dict, extra: tuple = ()) -> str:
+	items = sorted(labels.items()) + list(extra)
+	if not items:
+		return ""
+	escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+	return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def _fmt_value(v: float) -> str:
+	if math.isinf(v):
+		return "+Inf"
+	return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+def render() -> str:
+	"""Prometheus text exposition (format 0.0.4) of all series."""
+	by_name: dict[str, list] = {}
+	for s in _collect():
+		by_name.setdefault(s["name"], []).append(s)
+	lines = []
+	for name, (kind, help_text) in DEFINITIONS.items():
+		series = by_name.get(name)
+		if not series:
+			continue
+		lines.append(f"# HELP {name} {help_text}")
+		lines.append(f"# TYPE {name} {kind}")
+		for s in sorted(series, key=lambda s: sorted(s["labels"].items())):
+			if kind == "histogram":
+				for bound, count in zip(BUCKETS, s["buckets"]):
+					lines.append(f"{name}_bucket{_fmt_labels(s['labels'], (('le', _fmt_value(bound)),))} {count}")
+				lines.append(f"{name}_bucket{_fmt_labels(s['labels'], (('le', '+Inf'),))} {s['count']}")
+				lines.append(f"{name}_sum{_fmt_labels(s['labels'])} {_fmt_value(s['sum'])}")
+				lines.append(f"{name}_count{_fmt_labels(s['labels'])} {s['count']}")
+			else:
+				lines.append(f"{name}{_fmt_labels(s['labels'])} {_fmt_value(s['value'])}")
+	return "\n".join(lines) + "\n"
+
+
+class MeteredRuntime:
+	"""Wraps a runtime client and records per-call metrics labelled by front end, agent and alias."""
+
+	def __init__(self, client, frontend: str):
+		self._client = client
+		self._frontend = frontend
+
+	def __getattr__(self, name):
+		return getattr(self._client, name)
+
+	def invoke_agent(self, **kwargs) -> dict:
+		labels = {"frontend": self._frontend, "agent": kwargs.get("agentId", ""), "alias": kwargs.get("agentAliasId", "")}
+		inc("bedrock_requests_total", **labels)
+		inc("bedrock_inflight_requests", 1, frontend=self._frontend)
+		start = time.perf_counter()
+		try:
+			resp = self._client.invoke_agent(**kwargs)
+		except Exception as e:
+			inc("bedrock_errors_total", error=error_code(e), **labels)
+			inc("bedrock_inflight_requests", -1, frontend=self._frontend)
+			observe("bedrock_latency_seconds", time.perf_counter() - start, **labels)
+			_maybe_flush(force=True)
+			raise
+		return {**resp, "completion": self._observe(resp.get("completion", []), start, labels)}
+
+	def _observe(self, completion, start: float, labels: dict):
+		first = True
+		try:
+			for event in completion:
+				if "chunk" in event and "bytes" in event["chunk"]:
+					if first:
+						observe("bedrock_first_chunk_seconds", time.perf_counter() - start, **labels)
+						first = False
+					inc("bedrock_response_chunks_total", **labels)
+					inc("bedrock_response_bytes_total", len(event["chunk"]["bytes"]), **labels)
+				yield event
+		except Exception as e:
+			inc("bedrock_errors_total", error=error_code(e), **labels)
+			raise
+		finally:
+			inc("bedrock_inflight_requests", -1, frontend=self._frontend)
+			observe("bedrock_latency_seconds", time.perf_counter() - start, **labels)
+			# Other workers read this file for /metrics; don't wait for the next call to publish it.
+			_maybe_flush(force=True)
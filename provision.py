@@ -0,0 +1,259 @@
+# file: provision.py
+"""Provisions the collaborator agents and the supervisor in one command.
+
+Agents are described in `agents_manifest.json`. Collaborators are created and prepared concurrently, status polls back off
+exponentially with jitter, and the collaborators' alias ARNs go straight
+into supervisor creation. Progress is written to a state file after every
+step, so an interrupted run picks up where it stopped:
+
+	python provision.py --role-arn arn:aws:iam::<ACCOUNT_ID>:role/BedrockAgentServiceRole
+
+With --regions (or REGIONS), the same agents are provisioned into every
+listed region concurrently, each with its own state file, and their ids are
+collected in AGENT_REGIONS_FILE for regions.RegionalRuntime:
+
+	python provision.py --regions us-east-1,us-west-2 --role-arn ...
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+import regions
+
+REGION = os.getenv("AWS_REGION", os.getenv("REGION", "us-east-1"))
+MODEL_ID = os.getenv("MODEL_ID", "anthropic.claude-3-5-sonnet-20241022-v2:0")
+ROLE_ARN = os.getenv("AGENT_ROLE_ARN", "")
+STATE_PATH = os.getenv("PROVISION_STATE", ".provision_state.json")
+
+MANIFEST_PATH = os.getenv("AGENTS_MANIFEST", "agents_manifest.json")
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+	"""Reads the agent manifest and fills per-agent defaults (model, TTL, collaboration)."""
+	with open(path, "r", encoding="utf-8") as f:
+		manifest = json.load(f)
+	defaults = manifest.get("defaults", {})
+	for spec in manifest["agents"]:
+		spec.setdefault("model", defaults.get("model", MODEL_ID))
+		spec.setdefault("idle_session_ttl", defaults.get("idle_session_ttl", 600))
+		spec.setdefault("collaboration", "DISABLED")
+		spec.setdefault("collaborators", [])
+	return manifest
+
+
+def split_manifest(manifest: dict):
+	"""Returns (collaborator specs, supervisor spec); collaborators are the agents nobody depends on."""
+	supervisors = [a for a in manifest["agents"] if a["collaboration"] == "SUPERVISOR"]
+	if len(supervisors) != 1:
+		raise ValueError("manifest must define exactly one SUPERVISOR agent")
+	return [a for a in manifest["agents"] if a is not supervisors[0]], supervisors[0]
+
+
+def poll_until(fetch, ready, what: str, timeout_s: float = 600, base_s: float = 1.0, max_s: float = 20.0):
+	"""Calls fetch() until ready(value) holds, sleeping with capped exponential backoff and full jitter."""
+	start = time.monotonic()
+	delay = base_s
+	while True:
+		value = fetch()
+		if ready(value):
+			return value
+		if time.monotonic() - start > timeout_s:
+			raise TimeoutError(f"{what} not ready after {timeout_s:.0f}s (last status={value})")
+		time.sleep(random.uniform(0, delay))
+		delay = min(max_s, delay * 2)
+
+
+class ProvisionState:
+	"""JSON state file updated after every completed step (atomic replace)."""
+
+	def __init__(self, path: str | None):
+		self.path = path
+		self._lock = threading.Lock()
+		self.data = {}
+		if path:
+			try:
+				with open(path, "r", encoding="utf-8") as f:
+					self.data = json.load(f)
+			except (OSError, ValueError):
+				pass
+
+	def agent(self, name: str) -> dict:
+		with self._lock:
+			return dict(self.data.setdefault("agents", {}).setdefault(name, {}))
+
+	def update(self, name: str, **fields):
+		with self._lock:
+			self.data.setdefault("agents", {}).setdefault(name, {}).update(fields)
+			if not self.path:
+				return
+			tmp = f"{self.path}.tmp"
+			with open(tmp, "w", encoding="utf-8") as f:
+				json.dump(self.data, f, indent=2)
+			os.replace(tmp, self.path)
+
+
+def state_path_for(path: str, region: str, multi_region: bool) -> str:
+	"""One resume file per region when provisioning several; the plain path otherwise."""
+	if not multi_region or not path:
+		return path
+	root, ext = os.path.splitext(path)
+	return f"{root}.{region}{ext}"
+
+
+def parse_regions(spec: str, default: str) -> list[str]:
+	return [r.strip() for r in (spec or "").split(",") if r.strip()] or [default]
+
+
+class Provisioner:
+	def __init__(self, region: str, role_arn: str, manifest: dict, state: ProvisionState):
+		self.region = region
+		self.role_arn = role_arn
+		self.collaborators, self.supervisor = split_manifest(manifest)
+		self.state = state
+		self.client = boto3.client("bedrock-agent", region_name=region)
+
+	def _agent_status(self, agent_id: str) -> str:
+		resp = self.client.get_agent(agentId=agent_id)
+		return resp.get("agent", {}).get("agentStatus") or resp.get("agent", {}).get("status") or ""
+
+	def _alias_status(self, agent_id: str, alias_id: str) -> str:
+		resp = self.client.get_agent_alias(agentId=agent_id, agentAliasId=alias_id)
+		return resp.get("agentAlias", {}).get("agentAliasStatus", "")
+
+	def _raise_if_failed(self, agent_id: str, status: str, step: str):
+		if status.upper() == "FAILED":
+			reasons = self.client.get_agent(agentId=agent_id).get("agent", {}).get("failureReasons") or []
+			raise RuntimeError(f"Agent {agent_id} failed to {step}: {'; '.join(reasons) or 'no reason given'}")
+
+	def wait_until_created(self, agent_id: str):
+		status = poll_until(lambda: self._agent_status(agent_id), lambda s: s.upper() != "CREATING", f"Agent {agent_id}")
+		self._raise_if_failed(agent_id, status, "create")
+
+	def wait_until_prepared(self, agent_id: str):
+		status = poll_until(
+			lambda: self._agent_status(agent_id),
+			lambda s: bool(s) and s.upper() not in {"PREPARING", "NOT_PREPARED", "CREATING", "UPDATING"},
+			f"Agent {agent_id}",
+		)
+		self._raise_if_failed(agent_id, status, "prepare")
+
+	def wait_alias_ready(self, agent_id: str, alias_id: str):
+		poll_until(
+			lambda: self._alias_status(agent_id, alias_id),
+			lambda s: s.upper() not in {"CREATING", "UPDATING"},
+			f"Alias {alias_id} of agent {agent_id}",
+		)
+
+	def ensure_created(self, spec: dict) -> str:
+		name = spec["name"]
+		rec = self.state.agent(name)
+		if not rec.get("agent_id"):
+			extra = {"agentCollaboration": spec["collaboration"]} if spec["collaboration"] != "DISABLED" else {}
+			resp = self.client.create_agent(
+				agentName=name,
+				foundationModel=spec["model"],
+				instruction=spec["instruction"],
+				agentResourceRoleArn=self.role_arn,
+				idleSessionTTLInSeconds=spec["idle_session_ttl"],
+				**extra,
+			)
+			rec["agent_id"] = resp["agent"]["agentId"]
+			self.state.update(name, agent_id=rec["agent_id"])
+		self.wait_until_created(rec["agent_id"])
+		return rec["agent_id"]
+
+	def ensure_prepared_and_aliased(self, name: str, alias_name: str) -> dict:
+		rec = self.state.agent(name)
+		agent_id = rec["agent_id"]
+		if not rec.get("prepared"):
+			self.client.prepare_agent(agentId=agent_id)
+			self.wait_until_prepared(agent_id)
+			self.state.update(name, prepared=True)
+		if not rec.get("alias_id"):
+			alias = self.client.create_agent_alias(agentId=agent_id, agentAliasName=alias_name)["agentAlias"]
+			self.state.update(name, alias_id=alias["agentAliasId"], alias_arn=alias["agentAliasArn"])
+			rec = self.state.agent(name)
+		self.wait_alias_ready(agent_id, rec["alias_id"])
+		return self.state.agent(name)
+
+	def provision_collaborator(self, spec: dict) -> dict:
+		self.ensure_created(spec)
+		rec = self.ensure_prepared_and_aliased(spec["name"], spec.get("alias", "live"))
+		print(f"[{spec['name']}] ready: agent={rec['agent_id']} alias={rec['alias_id']}", flush=True)
+		return rec
+
+	def associate(self, sup_id: str, link: dict, alias_arn: str):
+		self.client.associate_agent_collaborator(
+			agentId=sup_id,
+			agentVersion="DRAFT",
+			collaboratorName=link["agent"],
+			collaborationInstruction=link["instruction"],
+			agentDescriptor={"aliasArn": alias_arn},
+			relayConversationHistory="ENABLED" if link.get("relay_history", True) else "DISABLED",
+		)
+
+	def provision_supervisor(self, collaborators: dict) -> dict:
+		name = self.supervisor["name"]
+		sup_id = self.ensure_created(self.supervisor)
+		done = set(self.state.agent(name).get("collaborators", []))
+		for link in self.supervisor["collaborators"]:
+			if link["agent"] in done:
+				continue
+			self.associate(sup_id, link, collaborators[link["agent"]]["alias_arn"])
+			done.add(link["agent"])
+			self.state.update(name, collaborators=sorted(done))
+		rec = self.ensure_prepared_and_aliased(name, self.supervisor.get("alias", "live"))
+		print(f"[{name}] ready: agent={rec['agent_id']} alias={rec['alias_id']}", flush=True)
+		return rec
+
+	def run(self) -> dict:
+		with ThreadPoolExecutor(max_workers=max(1, len(self.collaborators))) as pool:
+			futures = {spec["name"]: pool.submit(self.provision_collaborator, spec) for spec in self.collaborators}
+			collaborators = {name: fut.result() for name, fut in futures.items()}
+		supervisor = self.provision_supervisor(collaborators)
+		return {"supervisor": supervisor, **collaborators}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Provision the Jigsaw Room agents.")
+	parser.add_argument("--region", default=REGION)
+	parser.add_argument("--regions", default=",".join(regions.REGIONS), help="comma-separated; the first is home (or REGIONS)")
+	parser.add_argument("--role-arn", default=ROLE_ARN, help="IAM role for the agents (or AGENT_ROLE_ARN)")
+	parser.add_argument("--manifest", default=MANIFEST_PATH)
+	parser.add_argument("--state", default=STATE_PATH, help="resume file (default: %(default)s)")
+	parser.add_argument("--agent-map", default=regions.AGENT_REGIONS_FILE, help="per-region ids (default: %(default)s)")
+	args = parser.parse_args()
+	if not args.role_arn:
+		parser.error("--role-arn or AGENT_ROLE_ARN is required")
+
+	manifest = load_manifest(args.manifest)
+	region_list = parse_regions(args.regions, args.region)
+	multi = len(region_list) > 1
+	map_lock = threading.Lock()
+
+	def provision(region: str) -> dict:
+		state = ProvisionState(state_path_for(args.state, region, multi))
+		result = Provisioner(region, args.role_arn, manifest, state).run()
+		if multi:
+			with map_lock:
+				regions.update_agent_map(args.agent_map, region, state.data.get("agents", {}))
+		return result
+
+	with ThreadPoolExecutor(max_workers=max(1, len(region_list))) as pool:
+		results = dict(zip(region_list, pool.map(provision, region_list)))
+	sup = results[region_list[0]]["supervisor"]
+	if multi:
+		print(f"export REGIONS={','.join(region_list)}")
+		print(f"# agent ids per region written to {args.agent_map}")
+	print(f"export SUPERVISOR_AGENT_ID={sup['agent_id']}")
+	print(f"export SUPERVISOR_ALIAS_ID={sup['alias_id']}")
+
+
+if __name__ == "__main__":
+	main()
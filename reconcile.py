@@ -0,0 +1,228 @@
+# file: reconcile.py
+"""Brings deployed agents in line with `agents_manifest.json`.
+
+Each agent's desired configuration (instruction, model, session TTL,
+collaboration mode and collaborator links) is hashed and compared with the
+same fields read back from Bedrock, both for DRAFT and for the version the
+alias serves. Only agents whose DRAFT differs are updated and re-prepared;
+existing aliases are re-pointed instead of recreated (also when an earlier
+run stopped before re-pointing them), and missing agents are created. A run
+with no changes only reads.
+
+	python reconcile.py --dry-run
+	python reconcile.py --role-arn arn:aws:iam::<ACCOUNT_ID>:role/BedrockAgentServiceRole
+
+With --regions (or REGIONS), every listed region is reconciled and the
+per-region ids in AGENT_REGIONS_FILE are refreshed.
+"""
+import argparse
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import regions
+from provision import MANIFEST_PATH, REGION, ROLE_ARN, ProvisionState, Provisioner, load_manifest, parse_regions, poll_until
+
+
+def config_hash(config: dict) -> str:
+	return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def desired_config(spec: dict) -> dict:
+	return {
+		"instruction": spec["instruction"].strip(),
+		"model": spec["model"],
+		"idle_session_ttl": int(spec["idle_session_ttl"]),
+		"collaboration": spec["collaboration"],
+		"collaborators": sorted(
+			[link["agent"], link["instruction"].strip(), bool(link.get("relay_history", True))]
+			for link in spec["collaborators"]
+		),
+	}
+
+
+class Reconciler(Provisioner):
+	def __init__(self, region: str, role_arn: str, manifest: dict, dry_run: bool = False):
+		super().__init__(region, role_arn, manifest, ProvisionState(None))
+		self.dry_run = dry_run
+		self.deployed_ids = self._list_agents()
+		self.alias_arns: dict[str, str] = {}  # agent name -> alias ARN, filled as agents settle
+
+	def _list_agents(self) -> dict:
+		ids = {}
+		for page in self.client.get_paginator("list_agents").paginate():
+			for summary in page.get("agentSummaries", []):
+				ids[summary["agentName"]] = summary["agentId"]
+		return ids
+
+	def _find_alias(self, agent_id: str, alias_name: str) -> dict | None:
+		for page in self.client.get_paginator("list_agent_aliases").paginate(agentId=agent_id):
+			for alias in page.get("agentAliasSummaries", []):
+				if alias["agentAliasName"] == alias_name:
+					return alias
+		return None
+
+	def _deployed_links(self, agent_id: str, version: str = "DRAFT") -> dict:
+		links = {}
+		for page in self.client.get_paginator("list_agent_collaborators").paginate(agentId=agent_id, agentVersion=version):
+			for c in page.get("agentCollaboratorSummaries", []):
+				links[c["collaboratorName"]] = c
+		return links
+
+	def deployed_config(self, spec: dict, agent: dict, version: str = "DRAFT") -> dict:
+		"""`agent` is a get_agent (DRAFT) or get_agent_version response body."""
+		links = self._deployed_links(agent["agentId"], version) if spec["collaboration"] != "DISABLED" else {}
+		arn_to_name = {arn: name for name, arn in self.alias_arns.items()}
+		return {
+			"instruction": (agent.get("instruction") or "").strip(),
+			"model": agent.get("foundationModel", ""),
+			"idle_session_ttl": int(agent.get("idleSessionTTLInSeconds") or 0),
+			"collaboration": agent.get("agentCollaboration") or "DISABLED",
+			"collaborators": sorted(
+				[
+					arn_to_name.get(c.get("agentDescriptor", {}).get("aliasArn"), c["collaboratorName"]),
+					(c.get("collaborationInstruction") or "").strip(),
+					c.get("relayConversationHistory") == "ENABLED",
+				]
+				for c in links.values()
+			),
+		}
+
+	def _sync_links(self, spec: dict, agent_id: str):
+		deployed = self._deployed_links(agent_id)
+		wanted = {link["agent"]: link for link in spec["collaborators"]}
+		for name, c in deployed.items():
+			if name not in wanted:
+				self.client.disassociate_agent_collaborator(agentId=agent_id, agentVersion="DRAFT", collaboratorId=c["collaboratorId"])
+		for name, link in wanted.items():
+			if name in deployed:
+				self.client.update_agent_collaborator(
+					agentId=agent_id,
+					agentVersion="DRAFT",
+					collaboratorId=deployed[name]["collaboratorId"],
+					collaboratorName=name,
+					collaborationInstruction=link["instruction"],
+					agentDescriptor={"aliasArn": self.alias_arns[name]},
+					relayConversationHistory="ENABLED" if link.get("relay_history", True) else "DISABLED",
+				)
+			else:
+				self.associate(agent_id, link, self.alias_arns[name])
+
+	def served_hash(self, spec: dict, agent_id: str, alias: dict) -> str | None:
+		"""Config hash of the version the alias routes to; None when it routes to none."""
+		routing = alias.get("routingConfiguration") or []
+		version = routing[0].get("agentVersion") if routing else None
+		if not version or version == "DRAFT":
+			return None
+		agent = self.client.get_agent_version(agentId=agent_id, agentVersion=version)["agentVersion"]
+		return config_hash(self.deployed_config(spec, {**agent, "agentId": agent_id}, version))
+
+	def reconcile(self, spec: dict) -> str:
+		"""Returns 'unchanged', 'updated' or 'created' (prefixed with 'would ' on a dry run)."""
+		name = spec["name"]
+		alias_name = spec.get("alias", "live")
+		agent_id = self.deployed_ids.get(name)
+		if agent_id is None:
+			if self.dry_run:
+				return "would create"
+			self.ensure_created(spec)
+			if spec["collaboration"] != "DISABLED":
+				self._sync_links(spec, self.state.agent(name)["agent_id"])
+			rec = self.ensure_prepared_and_aliased(name, alias_name)
+			self.alias_arns[name] = rec["alias_arn"]
+			return "created"
+
+		agent = self.client.get_agent(agentId=agent_id)["agent"]
+		alias = self._find_alias(agent_id, alias_name)
+		if alias is not None:
+			alias = self.client.get_agent_alias(agentId=agent_id, agentAliasId=alias["agentAliasId"])["agentAlias"]
+		desired = config_hash(desired_config(spec))
+		deployed = config_hash(self.deployed_config(spec, agent))
+		prepared = (agent.get("agentStatus") or "").upper() == "PREPARED"
+		draft_current = desired == deployed and prepared
+		# A run that prepared DRAFT but died before re-pointing leaves the alias on an old version.
+		if draft_current and alias is not None and self.served_hash(spec, agent_id, alias) == desired:
+			self.alias_arns[name] = alias["agentAliasArn"]
+			return "unchanged"
+		if self.dry_run:
+			return "would update"
+
+		if not draft_current:
+			self.client.update_agent(
+				agentId=agent_id,
+				agentName=name,
+				foundationModel=spec["model"],
+				instruction=spec["instruction"],
+				agentResourceRoleArn=agent.get("agentResourceRoleArn") or self.role_arn,
+				idleSessionTTLInSeconds=spec["idle_session_ttl"],
+				agentCollaboration=spec["collaboration"],
+			)
+			poll_until(lambda: self._agent_status(agent_id), lambda s: s.upper() != "UPDATING", f"Agent {agent_id}")
+			if spec["collaboration"] != "DISABLED":
+				self._sync_links(spec, agent_id)
+			self.client.prepare_agent(agentId=agent_id)
+			self.wait_until_prepared(agent_id)
+		if alias is None:
+			alias = self.client.create_agent_alias(agentId=agent_id, agentAliasName=alias_name)["agentAlias"]
+		else:
+			# Re-pointing the alias snapshots the freshly prepared DRAFT as a new version.
+			alias = self.client.update_agent_alias(
+				agentId=agent_id, agentAliasId=alias["agentAliasId"], agentAliasName=alias_name
+			)["agentAlias"]
+		self.wait_alias_ready(agent_id, alias["agentAliasId"])
+		self.alias_arns[name] = alias["agentAliasArn"]
+		return "updated"
+
+	def agent_ids(self) -> dict:
+		"""name -> {"agent_id", "alias_id"} for the agents settled by `run()`."""
+		return {
+			spec["name"]: {
+				"agent_id": self.deployed_ids.get(spec["name"]) or self.state.agent(spec["name"]).get("agent_id", ""),
+				"alias_id": regions.alias_id_from_arn(self.alias_arns[spec["name"]]),
+			}
+			for spec in self.collaborators + [self.supervisor]
+			if spec["name"] in self.alias_arns
+		}
+
+	def run(self) -> dict:
+		def timed(spec):
+			start = time.monotonic()
+			outcome = self.reconcile(spec)
+			print(f"[{spec['name']}] {outcome} ({time.monotonic() - start:.1f}s)", flush=True)
+			return outcome
+
+		with ThreadPoolExecutor(max_workers=max(1, len(self.collaborators))) as pool:
+			outcomes = dict(zip([s["name"] for s in self.collaborators], pool.map(timed, self.collaborators)))
+		outcomes[self.supervisor["name"]] = timed(self.supervisor)
+		return outcomes
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Reconcile deployed agents with the manifest.")
+	parser.add_argument("--region", default=REGION)
+	parser.add_argument("--regions", default=",".join(regions.REGIONS), help="comma-separated (or REGIONS)")
+	parser.add_argument("--role-arn", default=ROLE_ARN, help="IAM role for newly created agents (or AGENT_ROLE_ARN)")
+	parser.add_argument("--manifest", default=MANIFEST_PATH)
+	parser.add_argument("--agent-map", default=regions.AGENT_REGIONS_FILE, help="per-region ids (default: %(default)s)")
+	parser.add_argument("--dry-run", action="store_true", help="report what would change without changing it")
+	args = parser.parse_args()
+
+	region_list = parse_regions(args.regions, args.region)
+	for region in region_list:
+		start = time.monotonic()
+		if len(region_list) > 1:
+			print(f"== {region}", flush=True)
+		reconciler = Reconciler(region, args.role_arn, load_manifest(args.manifest), dry_run=args.dry_run)
+		missing = [s["name"] for s in reconciler.collaborators + [reconciler.supervisor] if s["name"] not in reconciler.deployed_ids]
+		if missing and not args.role_arn and not args.dry_run:
+			parser.error(f"--role-arn is required to create {', '.join(missing)} in {region}")
+		outcomes = reconciler.run()
+		changed = [n for n, o in outcomes.items() if o != "unchanged"]
+		print(f"{len(changed)} of {len(outcomes)} agents changed in {time.monotonic() - start:.1f}s")
+		if len(region_list) > 1 and not args.dry_run:
+			regions.update_agent_map(args.agent_map, region, reconciler.agent_ids())
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,308 @@
+# file: regions.py
+"""Routes agent calls across equivalent deployments in several regions.
+
+REGIONS lists the regions (the first is home), and AGENT_REGIONS_FILE
+(default `agent_regions.json`, written by `provision.py --regions`) maps
+each region to its agents' ids. Callers keep using the home region's ids:
+`RegionalRuntime` translates them per region, so the rest of the app is
+unchanged.
+
+Each region keeps exponentially weighted averages of first-chunk latency
+and error rate (REGION_EWMA_ALPHA, default 0.2). New sessions go to the
+region with the best latency weighted by errors; a small share of them
+(REGION_EXPLORE, 0.05) tries another healthy region so its averages stay
+current. Sessions stick to their region for REGION_STICKY_TTL_S (600s, the
+agents' idle session TTL), so the agents keep the conversation history. The
+session -> region map is shared by every gunicorn worker through a SQLite
+file (REGION_STICKY_STORE, default /tmp/jigsaw_regions.sqlite3; `memory`
+for a single process), so a player's turns stay in one region whichever
+worker serves them.
+
+A region is ejected after REGION_EJECT_FAILURES (3) consecutive failures,
+or when its error rate passes REGION_EJECT_ERROR_RATE (0.5) after
+REGION_MIN_SAMPLES (5) calls. It gets traffic again after REGION_COOLDOWN_S
+(60s); one more failure ejects it again. A call that fails before any
+output is retried in the next region, moving the session there.
+
+Latency and error averages are kept per process.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+log = logging.getLogger("jigsaw.regions")
+
+REGIONS = [r.strip() for r in os.getenv("REGIONS", "").split(",") if r.strip()]
+AGENT_REGIONS_FILE = os.getenv("AGENT_REGIONS_FILE", "agent_regions.json")
+EWMA_ALPHA = float(os.getenv("REGION_EWMA_ALPHA", "0.2"))
+EXPLORE = float(os.getenv("REGION_EXPLORE", "0.05"))
+STICKY_TTL_S = float(os.getenv("REGION_STICKY_TTL_S", "600"))
+EJECT_FAILURES = int(os.getenv("REGION_EJECT_FAILURES", "3"))
+EJECT_ERROR_RATE = float(os.getenv("REGION_EJECT_ERROR_RATE", "0.5"))
+MIN_SAMPLES = int(os.getenv("REGION_MIN_SAMPLES", "5"))
+COOLDOWN_S = float(os.getenv("REGION_COOLDOWN_S", "60"))
+MAX_STICKY = int(os.getenv("REGION_STICKY_MAX", "10000"))
+STICKY_STORE = os.getenv("REGION_STICKY_STORE", "/tmp/jigsaw_regions.sqlite3").strip()
+PRUNE_INTERVAL_S = 60.0
+
+
+def configured() -> bool:
+	return len(REGIONS) > 1
+
+
+def alias_id_from_arn(arn: str) -> str:
+	"""`arn:aws:bedrock:<region>:<account>:agent-alias/<agent id>/<alias id>` -> alias id."""
+	return (arn or "").rsplit("/", 1)[-1]
+
+
+def load_agent_map(path: str = AGENT_REGIONS_FILE) -> dict[str, dict[str, tuple[str, str]]]:
+	"""region -> agent name -> (agent_id, alias_id); {} when the file is missing."""
+	try:
+		with open(path, "r", encoding="utf-8") as f:
+			data = json.load(f)
+	except (OSError, ValueError):
+		return {}
+	return {
+		region: {name: (ids["agent_id"], ids["alias_id"]) for name, ids in agents.items() if ids.get("alias_id")}
+		for region, agents in data.items()
+	}
+
+
+def update_agent_map(path: str, region: str, agents: dict[str, dict]):
+	"""Replaces one region's entry (name -> record with agent_id/alias_id), atomically."""
+	try:
+		with open(path, "r", encoding="utf-8") as f:
+			data = json.load(f)
+	except (OSError, ValueError):
+		data = {}
+	data[region] = {
+		name: {"agent_id": rec["agent_id"], "alias_id": rec.get("alias_id", "")}
+		for name, rec in sorted(agents.items())
+		if rec.get("agent_id")
+	}
+	tmp = f"{path}.{region}.tmp"
+	with open(tmp, "w", encoding="utf-8") as f:
+		json.dump(data, f, indent=2, sort_keys=True)
+	os.replace(tmp, path)
+
+
+class RegionHealth:
+	"""EWMA latency and error rate of one region, plus its ejection state."""
+
+	def __init__(self, region: str, alpha: float = EWMA_ALPHA):
+		self.region = region
+		self.alpha = alpha
+		self.latency_s: float | None = None
+		self.error_rate = 0.0
+		self.samples = 0
+		self.consecutive_failures = 0
+		self.ejected_until = 0.0
+
+	def available(self, now: float) -> bool:
+		return now >= self.ejected_until
+
+	def score(self) -> float:
+		"""Lower is better; a region not measured yet ranks first so it gets measured."""
+		if self.latency_s is None:
+			return 0.0
+		return self.latency_s * (1 + 4 * self.error_rate)
+
+	def latency(self, seconds: float):
+		self.latency_s = seconds if self.latency_s is None else self.alpha * seconds + (1 - self.alpha) * self.latency_s
+
+	def success(self):
+		self.samples += 1
+		self.consecutive_failures = 0
+		self.error_rate *= 1 - self.alpha
+		self.ejected_until = 0.0
+
+	def failure(self, now: float, cooldown_s: float) -> bool:
+		"""Returns True when this failure ejects the region."""
+		self.samples += 1
+		self.consecutive_failures += 1
+		self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+		if (
+			self.ejected_until > 0  # back from a cooldown without a success yet: one failure is enough
+			or self.consecutive_failures >= EJECT_FAILURES
+			or (self.samples >= MIN_SAMPLES and self.error_rate >= EJECT_ERROR_RATE)
+		):
+			self.ejected_until = now + cooldown_s
+			return True
+		return False
+
+	def as_dict(self, now: float) -> dict:
+		return {
+			"latency_ms": round(self.latency_s * 1000) if self.latency_s is not None else None,
+			"error_rate": round(self.error_rate, 3),
+			"samples": self.samples,
+			"ejected_for_s": round(max(0.0, self.ejected_until - now), 1),
+		}
+
+
+class StickyStore:
+	"""session id -> (region, last used as wall-clock time), in memory or in a shared SQLite file."""
+
+	def __init__(self, path: str | None = None, max_entries: int = MAX_STICKY):
+		self.path = path
+		self.max_entries = max_entries
+		self._lock = threading.Lock()
+		self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+		self._local = threading.local()
+		self._last_prune = 0.0
+		if path:
+			self._db().execute(
+				"CREATE TABLE IF NOT EXISTS sticky (session TEXT PRIMARY KEY, region TEXT NOT NULL, updated REAL NOT NULL)"
+			)
+			self._db().execute("CREATE INDEX IF NOT EXISTS sticky_updated ON sticky (updated)")
+
+	def _db(self) -> sqlite3.Connection:
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=NORMAL")
+			self._local.conn = conn
+		return conn
+
+	def get(self, session_id: str) -> tuple[str, float] | None:
+		if self.path:
+			row = self._db().execute("SELECT region, updated FROM sticky WHERE session = ?", (session_id,)).fetchone()
+			return (row[0], row[1]) if row else None
+		with self._lock:
+			return self._entries.get(session_id)
+
+	def put(self, session_id: str, region: str):
+		now = time.time()
+		if self.path:
+			db = self._db()
+			db.execute("INSERT OR REPLACE INTO sticky (session, region, updated) VALUES (?, ?, ?)", (session_id, region, now))
+			if now - self._last_prune >= PRUNE_INTERVAL_S:
+				self._last_prune = now
+				db.execute("DELETE FROM sticky WHERE updated < ?", (now - STICKY_TTL_S,))
+				db.execute(
+					"DELETE FROM sticky WHERE session IN (SELECT session FROM sticky ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+					(self.max_entries,),
+				)
+			return
+		with self._lock:
+			self._entries[session_id] = (region, now)
+			self._entries.move_to_end(session_id)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+
+
+def sticky_store() -> StickyStore:
+	"""Shared by the workers unless REGION_STICKY_STORE=memory."""
+	return StickyStore(None if STICKY_STORE.lower() in {"", "memory"} else STICKY_STORE)
+
+
+class RegionalRuntime:
+	"""Picks a region per session and translates the home region's agent ids for it."""
+
+	def __init__(
+		self,
+		clients: dict,
+		agent_map: dict | None = None,
+		cooldown_s: float = COOLDOWN_S,
+		sticky: StickyStore | None = None,
+	):
+		self.regions = list(clients)
+		self._clients = clients
+		self.cooldown_s = cooldown_s
+		self._lock = threading.Lock()
+		self._health = {region: RegionHealth(region) for region in self.regions}
+		self._sticky = sticky or sticky_store()
+		self._ids: dict[tuple, dict[str, tuple[str, str]]] = {}  # any region's (agent, alias) -> region -> ids
+		agent_map = load_agent_map() if agent_map is None else agent_map
+		names = {name for agents in agent_map.values() for name in agents}
+		for name in names:
+			per_region = {region: agents[name] for region, agents in agent_map.items() if name in agents}
+			for ids in per_region.values():
+				self._ids[ids] = per_region
+
+	def __getattr__(self, name):
+		return getattr(self._clients[self.regions[0]], name)
+
+	def _targets(self, kwargs: dict) -> dict[str, tuple[str, str]]:
+		"""region -> (agent_id, alias_id) for the agent being called; unknown ids only exist at home."""
+		ids = (kwargs.get("agentId", ""), kwargs.get("agentAliasId", ""))
+		per_region = self._ids.get(ids)
+		if per_region is None:
+			return {self.regions[0]: ids}
+		return {region: per_region[region] for region in self.regions if region in per_region}
+
+	def _order(self, session_id: str, eligible: list[str]) -> list[str]:
+		"""Regions to try for this call, best first."""
+		now = time.monotonic()
+		with self._lock:
+			healthy = sorted((r for r in eligible if self._health[r].available(now)), key=lambda r: self._health[r].score())
+			# With every region ejected, try the one that comes back first rather than failing outright.
+			ejected = sorted((r for r in eligible if r not in healthy), key=lambda r: self._health[r].ejected_until)
+			order = healthy + ejected
+		sticky = self._sticky.get(session_id) if session_id else None
+		if sticky and time.time() - sticky[1] < STICKY_TTL_S and sticky[0] in healthy:
+			order.remove(sticky[0])
+			order.insert(0, sticky[0])
+		elif len(healthy) > 1 and random.random() < EXPLORE:
+			order.insert(0, order.pop(random.randrange(1, len(healthy))))
+		return order
+
+	def _stick(self, session_id: str, region: str):
+		if not session_id:
+			return
+		previous = self._sticky.get(session_id)
+		self._sticky.put(session_id, region)
+		if previous and previous[0] != region:
+			log.warning("session %s moved from %s to %s", session_id, previous[0], region)
+
+	def _failure(self, region: str, exc: BaseException):
+		with self._lock:
+			ejected = self._health[region].failure(time.monotonic(), self.cooldown_s)
+		if ejected:
+			log.warning("region %s ejected for %.0fs after %s", region, self.cooldown_s, metrics.error_code(exc))
+			metrics.inc("bedrock_region_ejections_total", region=region)
+
+	def invoke_agent(self, **kwargs) -> dict:
+		session_id = kwargs.get("sessionId", "")
+		targets = self._targets(kwargs)
+		order = self._order(session_id, list(targets))
+		for attempt, region in enumerate(order):
+			agent_id, alias_id = targets[region]
+			start = time.monotonic()
+			try:
+				resp = self._clients[region].invoke_agent(**{**kwargs, "agentId": agent_id, "agentAliasId": alias_id})
+			except Exception as e:
+				self._failure(region, e)
+				if attempt + 1 == len(order):
+					raise
+				metrics.inc("bedrock_region_failovers_total", region=region)
+				continue
+			self._stick(session_id, region)
+			return {**resp, "completion": self._observe(resp.get("completion", []), region, start)}
+
+	def _observe(self, completion, region: str, start: float):
+		first = True
+		try:
+			for event in completion:
+				if first and "chunk" in event:
+					first = False
+					with self._lock:
+						self._health[region].latency(time.monotonic() - start)
+				yield event
+		except Exception as e:
+			self._failure(region, e)
+			raise
+		with self._lock:
+			self._health[region].success()
+
+	def region_health(self) -> dict:
+		now = time.monotonic()
+		with self._lock:
+			return {region: self._health[region].as_dict(now) for region in self.regions}
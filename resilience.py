@@ -0,0 +1,304 @@
+# file: resilience.py
+"""Deadlines, hedged requests and a circuit breaker around `invoke_agent`.
+
+`ResilientRuntime` wraps a runtime client (see `clients._resilient`):
+
+- Every call has an overall deadline covering the whole completion stream
+  (INVOKE_DEADLINE_S, default 90) and an idle timeout between events
+  (CHUNK_IDLE_TIMEOUT_S, default 30). A stalled stream raises instead of
+  holding the caller's thread; the abandoned stream is closed.
+- With HEDGE_PERCENTILE set (e.g. 95), a call made with `hedge=True` that
+  has not produced its first chunk by that percentile of the alias' recent
+  first-chunk latencies (at least HEDGE_MIN_DELAY_S, after
+  HEDGE_MIN_SAMPLES calls) starts a second request, to the same alias or to
+  the alternate named in HEDGE_ALIASES (`primaryAlias=alternateAlias,...`).
+  The first to produce a chunk wins and the other is closed. The hedge runs
+  in a session of its own, since two concurrent calls must not write to one
+  Bedrock session, so only one-off calls whose session is never reused opt
+  in (evaluate.py); player turns depend on their session's history and are
+  never hedged.
+- A per-alias circuit breaker opens after BREAKER_FAILURES consecutive
+  failures (default 5) and fails fast for BREAKER_COOLDOWN_S (30), then
+  lets one probe through. While open, calls go to the alternate alias when
+  there is one.
+
+Failures raised here subclass `AgentUnavailable` and carry a message fit to
+show players; `friendly_error()` does the same for any other exception.
+"""
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+import metrics
+
+log = logging.getLogger("jigsaw.resilience")
+
+DEADLINE_S = float(os.getenv("INVOKE_DEADLINE_S", "90"))
+IDLE_TIMEOUT_S = float(os.getenv("CHUNK_IDLE_TIMEOUT_S", "30"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_S = float(os.getenv("HEDGE_MIN_DELAY_S", "2"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_S = float(os.getenv("BREAKER_COOLDOWN_S", "30"))
+
+
+def parse_aliases(spec: str) -> dict[str, str]:
+	"""`"A=B,C=D"` -> {"A": "B", "C": "D"}."""
+	pairs = (item.split("=", 1) for item in (spec or "").split(",") if "=" in item)
+	return {k.strip(): v.strip() for k, v in pairs if k.strip() and v.strip()}
+
+
+class AgentUnavailable(Exception):
+	"""A call given up on by this layer; `str()` is safe to show to players."""
+
+
+class CircuitOpen(AgentUnavailable):
+	pass
+
+
+class DeadlineExceeded(AgentUnavailable):
+	pass
+
+
+def friendly_error(exc: BaseException) -> str:
+	"""Message for players; the raw error goes to the log instead."""
+	if isinstance(exc, AgentUnavailable):
+		return str(exc)
+	code = metrics.error_code(exc)
+	if code in {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}:
+		return "Os agentes estão recebendo perguntas demais agora. Tente de novo em alguns segundos."
+	if code in {"AccessDeniedException", "ResourceNotFoundException", "ValidationException"}:
+		log.warning("agent misconfigured: %s", exc)
+		return "Este agente não está configurado corretamente. Avise a organização da oficina."
+	log.warning("agent call failed: %s", exc)
+	return "O agente teve um problema para responder. Tente de novo em instantes."
+
+
+class CircuitBreaker:
+	def __init__(self, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S):
+		self.failures = failures
+		self.cooldown_s = cooldown_s
+		self._lock = threading.Lock()
+		self._state: dict[tuple, dict] = {}  # key -> {"failures", "opened_at", "probing", "probe_at"}
+
+	def allow(self, key: tuple) -> bool:
+		with self._lock:
+			st = self._state.get(key)
+			if st is None or st["opened_at"] is None:
+				return True
+			now = time.monotonic()
+			if now - st["opened_at"] < self.cooldown_s:
+				return False
+			# Half-open: one probe at a time; a probe nobody reported back on expires.
+			if st["probing"] and now - st["probe_at"] < self.cooldown_s:
+				return False
+			st["probing"] = True
+			st["probe_at"] = now
+			return True
+
+	def success(self, key: tuple):
+		with self._lock:
+			self._state.pop(key, None)
+
+	def failure(self, key: tuple):
+		with self._lock:
+			st = self._state.setdefault(key, {"failures": 0, "opened_at": None, "probing": False, "probe_at": 0.0})
+			st["failures"] += 1
+			if st["probing"] or st["failures"] >= self.failures:
+				if st["opened_at"] is None or st["probing"]:
+					log.warning("circuit open for agent %s alias %s after %d failures", key[0], key[1], st["failures"])
+				st["opened_at"] = time.monotonic()
+				st["probing"] = False
+
+
+class LatencyWindow:
+	"""Recent first-chunk latencies of one alias."""
+
+	def __init__(self, size: int = 200):
+		self._samples: collections.deque = collections.deque(maxlen=size)
+		self._lock = threading.Lock()
+
+	def add(self, seconds: float):
+		with self._lock:
+			self._samples.append(seconds)
+
+	def percentile(self, p: float, min_samples: int) -> float | None:
+		with self._lock:
+			if len(self._samples) < min_samples:
+				return None
+			ordered = sorted(self._samples)
+		return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def _close(completion):
+	close = getattr(completion, "close", None)
+	if close is not None:
+		try:
+			close()
+		except Exception:
+			pass
+
+
+class ResilientRuntime:
+	"""Wraps a runtime client with deadlines, hedging and a per-alias circuit breaker."""
+
+	def __init__(
+		self,
+		client,
+		deadline_s: float | None = None,
+		idle_timeout_s: float = IDLE_TIMEOUT_S,
+		hedge_percentile: float = HEDGE_PERCENTILE,
+		hedge_aliases: dict | None = None,
+		breaker: CircuitBreaker | None = None,
+	):
+		self._client = client
+		self.deadline_s = DEADLINE_S if deadline_s is None else deadline_s
+		self.idle_timeout_s = idle_timeout_s
+		self.hedge_percentile = hedge_percentile
+		self.hedge_aliases = parse_aliases(os.getenv("HEDGE_ALIASES", "")) if hedge_aliases is None else hedge_aliases
+		self.breaker = breaker or CircuitBreaker()
+		self._latency: dict[tuple, LatencyWindow] = {}
+		self._latency_lock = threading.Lock()
+
+	def __getattr__(self, name):
+		return getattr(self._client, name)
+
+	def _window(self, key: tuple) -> LatencyWindow:
+		with self._latency_lock:
+			return self._latency.setdefault(key, LatencyWindow())
+
+	def _hedge_delay(self, key: tuple) -> float | None:
+		if self.hedge_percentile <= 0:
+			return None
+		p = self._window(key).percentile(self.hedge_percentile, HEDGE_MIN_SAMPLES)
+		return None if p is None else max(HEDGE_MIN_DELAY_S, p)
+
+	def invoke_agent(self, hedge: bool = False, **kwargs) -> dict:
+		"""`hedge=True` only for one-off calls: a winning hedge answers from a session of its own."""
+		agent_id = kwargs.get("agentId", "")
+		alias_id = kwargs.get("agentAliasId", "")
+		alternate = self.hedge_aliases.get(alias_id)
+		if not self.breaker.allow((agent_id, alias_id)):
+			if not alternate or not self.breaker.allow((agent_id, alternate)):
+				raise CircuitOpen("Este agente está instável agora e foi pausado por alguns segundos. Tente de novo já já.")
+			alias_id, alternate = alternate, None
+		key = (agent_id, alias_id)
+		start = time.monotonic()
+		try:
+			resp = self._client.invoke_agent(**{**kwargs, "agentAliasId": alias_id})
+		except Exception:
+			self.breaker.failure(key)
+			raise
+		# A separate session so the two calls never write to the same one.
+		hedge_kwargs = {**kwargs, "agentAliasId": alternate or alias_id, "sessionId": str(uuid.uuid4())} if hedge else None
+		return {**resp, "completion": self._stream(resp.get("completion", []), key, hedge_kwargs, start)}
+
+	def _stream(self, completion, key: tuple, hedge_kwargs: dict | None, start: float):
+		events: queue.Queue = queue.Queue()
+		streams = [completion]
+		keys = [key]
+		starts = [start]
+
+		def pump(idx: int, make):
+			try:
+				for event in make():
+					events.put((idx, "event", event))
+				events.put((idx, "end", None))
+			except Exception as e:
+				events.put((idx, "error", e))
+
+		def launch_hedge():
+			idx = len(streams)
+			hedge_key = (hedge_kwargs["agentId"], hedge_kwargs["agentAliasId"])
+			streams.append(None)
+			keys.append(hedge_key)
+			starts.append(time.monotonic())
+
+			def make():
+				resp = self._client.invoke_agent(**hedge_kwargs)
+				streams[idx] = resp.get("completion", [])
+				return streams[idx]
+
+			metrics.inc("bedrock_hedged_requests_total", agent=hedge_key[0], alias=hedge_key[1])
+			threading.Thread(target=pump, args=(idx, make), name="invoke-hedge", daemon=True).start()
+
+		threading.Thread(target=pump, args=(0, lambda: completion), name="invoke-stream", daemon=True).start()
+
+		hedge_delay = self._hedge_delay(key) if hedge_kwargs is not None else None
+		hedge_at = start + hedge_delay if hedge_delay is not None else None
+		deadline = start + self.deadline_s
+		last_event = time.monotonic()
+		winner = None
+		pending: dict[int, list] = {0: []}  # events held back until a stream wins
+		dead: set = set()
+		finished = False
+		try:
+			while True:
+				now = time.monotonic()
+				if now >= deadline:
+					raise DeadlineExceeded(f"O agente não terminou de responder em {self.deadline_s:.0f}s. Tente de novo.")
+				if now - last_event >= self.idle_timeout_s:
+					raise DeadlineExceeded(f"O agente ficou {self.idle_timeout_s:.0f}s sem responder. Tente de novo.")
+				wait = min(deadline, last_event + self.idle_timeout_s) - now
+				if hedge_at is not None and winner is None and len(streams) == 1:
+					if now >= hedge_at:
+						launch_hedge()
+						pending[1] = []
+						log.info("hedging agent %s alias %s after %.2fs without a chunk", key[0], key[1], now - start)
+						continue
+					wait = min(wait, hedge_at - now)
+				try:
+					idx, kind, value = events.get(timeout=max(0.0, wait))
+				except queue.Empty:
+					continue
+				if idx in dead or (winner is not None and idx != winner):
+					continue
+				last_event = time.monotonic()
+				if kind == "event":
+					if winner is None:
+						if "chunk" not in value:
+							if len(streams) == 1:
+								yield value  # trace events keep their timing while nothing is hedged
+							else:
+								pending[idx].append(value)
+							continue
+						pending[idx].append(value)
+						winner = idx
+						self._window(keys[idx]).add(last_event - starts[idx])
+						for other, stream in enumerate(streams):
+							if other != idx:
+								dead.add(other)
+								_close(stream)
+						yield from pending.pop(idx)
+					else:
+						yield value
+					continue
+				if kind == "error":
+					self.breaker.failure(keys[idx])
+					dead.add(idx)
+					if winner == idx or len(dead) == len(streams):
+						raise value
+					continue
+				# kind == "end"
+				if winner is None:
+					if len(dead) + 1 < len(streams) and not pending[idx]:
+						dead.add(idx)  # empty stream; let the other one answer
+						continue
+					winner = idx
+					yield from pending.pop(idx)
+				self.breaker.success(keys[idx])
+				finished = True
+				return
+		except DeadlineExceeded:
+			for i, k in enumerate(keys):
+				if i == winner or (winner is None and i not in dead):
+					self.breaker.failure(k)
+			raise
+		finally:
+			if not finished:
+				for stream in streams:
+					_close(stream)
@@ -0,0 +1,164 @@
+# file: response_cache.py
+"""Opt-in cache for agent replies.
+
+Entries are keyed by agent ID, alias ID, selected challenge and a normalized
+prompt. An in-process LRU with TTL and a byte budget sits in front of an
+optional SQLite file (WAL mode) so several gunicorn workers share hits.
+
+Enable with RESPONSE_CACHE=memory or RESPONSE_CACHE=sqlite.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_prompt(text: str) -> str:
+	text = unicodedata.normalize("NFKC", text or "").casefold()
+	text = re.sub(r"\s+", " ", text).strip()
+	return text.rstrip(" ?!.…")
+
+
+def make_key(agent_id: str, alias_id: str, challenge: str, prompt: str) -> str:
+	raw = "\x1f".join([agent_id or "", alias_id or "", (challenge or "").strip(), normalize_prompt(prompt)])
+	return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+	def __init__(self, ttl_s: float = 900, max_bytes: int = 8 * 1024 * 1024, path: str | None = None):
+		self.ttl_s = ttl_s
+		self.max_bytes = max_bytes
+		self.path = path
+		self._lock = threading.Lock()
+		self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+		self._bytes = 0
+		self._local = threading.local()
+		self.hits = 0
+		self.misses = 0
+		self.disk_hits = 0
+		self.evictions = 0
+		if path:
+			self._db().execute(
+				"CREATE TABLE IF NOT EXISTS replies ("
+				" key TEXT PRIMARY KEY, reply TEXT NOT NULL, size INTEGER NOT NULL,"
+				" expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+			)
+
+	def _db(self) -> sqlite3.Connection:
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=NORMAL")
+			self._local.conn = conn
+		return conn
+
+	def get(self, key: str) -> str | None:
+		now = time.time()
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				expires_at, reply = entry
+				if expires_at > now:
+					self._entries.move_to_end(key)
+					self.hits += 1
+					return reply
+				self._drop(key)
+		if self.path:
+			try:
+				row = self._db().execute(
+					"SELECT reply, expires_at FROM replies WHERE key = ? AND expires_at > ?", (key, now)
+				).fetchone()
+				if row:
+					self._db().execute("UPDATE replies SET last_access = ? WHERE key = ?", (now, key))
+					with self._lock:
+						self.hits += 1
+						self.disk_hits += 1
+						self._store(key, row[0], row[1])
+					return row[0]
+			except sqlite3.Error:
+				pass
+		with self._lock:
+			self.misses += 1
+		return None
+
+	def put(self, key: str, reply: str):
+		if not reply:
+			return
+		expires_at = time.time() + self.ttl_s
+		with self._lock:
+			self._store(key, reply, expires_at)
+		if self.path:
+			try:
+				db = self._db()
+				db.execute(
+					"INSERT OR REPLACE INTO replies (key, reply, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+					(key, reply, len(reply.encode("utf-8")), expires_at, time.time()),
+				)
+				self._trim_disk(db)
+			except sqlite3.Error:
+				pass
+
+	def stats(self) -> dict:
+		with self._lock:
+			lookups = self.hits + self.misses
+			return {
+				"backend": "sqlite" if self.path else "memory",
+				"entries": len(self._entries),
+				"bytes": self._bytes,
+				"max_bytes": self.max_bytes,
+				"hits": self.hits,
+				"disk_hits": self.disk_hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+			}
+
+	# Callers hold self._lock for the helpers below.
+	def _store(self, key: str, reply: str, expires_at: float):
+		size = len(reply.encode("utf-8"))
+		if size > self.max_bytes:
+			return
+		if key in self._entries:
+			self._drop(key)
+		self._entries[key] = (expires_at, reply)
+		self._bytes += size
+		while self._bytes > self.max_bytes:
+			oldest = next(iter(self._entries))
+			self._drop(oldest)
+			self.evictions += 1
+
+	def _drop(self, key: str):
+		_, reply = self._entries.pop(key)
+		self._bytes -= len(reply.encode("utf-8"))
+
+	def _trim_disk(self, db: sqlite3.Connection):
+		now = time.time()
+		db.execute("DELETE FROM replies WHERE expires_at <= ?", (now,))
+		total = db.execute("SELECT COALESCE(SUM(size), 0) FROM replies").fetchone()[0]
+		if total <= self.max_bytes:
+			return
+		for key, size in db.execute("SELECT key, size FROM replies ORDER BY last_access").fetchall():
+			db.execute("DELETE FROM replies WHERE key = ?", (key,))
+			total -= size
+			if total <= self.max_bytes:
+				break
+
+
+def from_env() -> ResponseCache | None:
+	"""Builds the cache described by RESPONSE_CACHE_* env vars, or None when disabled."""
+	backend = os.getenv("RESPONSE_CACHE", "").strip().lower()
+	if backend not in {"memory", "sqlite"}:
+		return None
+	path = None
+	if backend == "sqlite":
+		path = os.getenv("RESPONSE_CACHE_PATH", "/tmp/jigsaw_response_cache.sqlite3")
+	return ResponseCache(
+		ttl_s=float(os.getenv("RESPONSE_CACHE_TTL", "900")),
+		max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+		path=path,
+	)
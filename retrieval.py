@@ -0,0 +1,201 @@
+# file: retrieval.py
+"""Lexical retrieval over the persona material in `agents_description/`.
+
+Every persona file is split into paragraph-sized chunks, identical chunks
+are stored once (the three copies of `oficina_sem_respostas.txt` become one
+set of chunks shared by all personas), and the result is indexed with
+Okapi BM25. For each message, `grounding()` returns the top-k snippets of
+the targeted persona that fit a byte budget, ready to go in front of the
+player's question.
+
+The index is built from the shared catalog, so it is rebuilt only when the
+catalog swaps its index. Agents name their persona directory with
+`persona` in `agents_manifest.json` (see `persona_for()`); an agent without
+one gets no snippets. Tunables: RETRIEVAL=off disables it,
+RETRIEVAL_TOP_K (3), RETRIEVAL_BUDGET_BYTES (1200), RETRIEVAL_CHUNK_CHARS (600).
+"""
+import functools
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from catalog import get_catalog
+from grading import fold
+
+ENABLED = os.getenv("RETRIEVAL", "on").strip().lower() not in {"off", "0", "false", "no"}
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+BUDGET_BYTES = int(os.getenv("RETRIEVAL_BUDGET_BYTES", "1200"))
+CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "600"))
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+# Function words that would otherwise dominate short Portuguese/English queries.
+STOPWORDS = frozenset(
+	"a o as os um uma uns umas de da do das dos em na no nas nos por para com sem que se e ou "
+	"ao aos mas como mais ja nao sim eu voce ele ela isso esse essa este esta qual quais quem "
+	"the an of to in on and or is are for with what who which this that it be".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+	return [w for w in WORD_RE.findall(fold(text)) if w not in STOPWORDS and len(w) > 1]
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_CHARS) -> list[str]:
+	"""Paragraphs merged up to `max_chars`; longer paragraphs are split on sentences."""
+	pieces = []
+	for para in re.split(r"\n\s*\n", text):
+		para = para.strip()
+		if not para:
+			continue
+		if len(para) <= max_chars:
+			pieces.append(para)
+			continue
+		current = ""
+		for sentence in SENTENCE_RE.split(para):
+			if current and len(current) + len(sentence) + 1 > max_chars:
+				pieces.append(current)
+				current = ""
+			current = f"{current} {sentence}".strip()
+		if current:
+			pieces.append(current)
+	chunks, current = [], ""
+	for piece in pieces:
+		if current and len(current) + len(piece) + 2 > max_chars:
+			chunks.append(current)
+			current = ""
+		current = f"{current}\n\n{piece}".strip()
+	if current:
+		chunks.append(current)
+	return chunks
+
+
+@dataclass
+class Chunk:
+	text: str
+	source: str
+	tokens: Counter
+	length: int
+	personas: set = field(default_factory=set)
+
+
+class BM25Index:
+	def __init__(self, k1: float = 1.5, b: float = 0.75):
+		self.k1 = k1
+		self.b = b
+		self.chunks: list[Chunk] = []
+		self._by_digest: dict[str, Chunk] = {}
+		self._postings: dict[str, list[int]] = {}
+		self._idf: dict[str, float] = {}
+		self._avg_len = 0.0
+
+	def add(self, persona: str, source: str, text: str):
+		for piece in chunk_text(text):
+			digest = hashlib.sha1(" ".join(fold(piece).split()).encode("utf-8")).hexdigest()
+			chunk = self._by_digest.get(digest)
+			if chunk is None:
+				tokens = tokenize(piece)
+				chunk = Chunk(piece, source, Counter(tokens), len(tokens))
+				self._by_digest[digest] = chunk
+				self.chunks.append(chunk)
+			chunk.personas.add(persona)
+
+	def build(self) -> "BM25Index":
+		self._postings = {}
+		for i, chunk in enumerate(self.chunks):
+			for term in chunk.tokens:
+				self._postings.setdefault(term, []).append(i)
+		n = len(self.chunks)
+		self._idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in self._postings.items()}
+		self._avg_len = sum(c.length for c in self.chunks) / n if n else 0.0
+		return self
+
+	def search(self, query: str, persona: str | None = None, k: int = TOP_K) -> list[tuple[float, Chunk]]:
+		scores: dict[int, float] = {}
+		for term in set(tokenize(query)):
+			idf = self._idf.get(term)
+			if idf is None:
+				continue
+			for i in self._postings[term]:
+				chunk = self.chunks[i]
+				if persona and persona not in chunk.personas:
+					continue
+				tf = chunk.tokens[term]
+				norm = self.k1 * (1 - self.b + self.b * chunk.length / (self._avg_len or 1))
+				scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+		ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+		return [(score, self.chunks[i]) for i, score in ranked]
+
+	@classmethod
+	def from_catalog(cls, catalog) -> "BM25Index":
+		index = cls()
+		for persona, data in sorted(catalog.personas.items()):
+			for name, text in sorted(data["files"].items()):
+				# The short persona blurb is already on screen and says nothing a question would match.
+				if name.startswith("descricao"):
+					continue
+				index.add(persona, name, text)
+		return index.build()
+
+
+_index: BM25Index | None = None
+_index_source = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> BM25Index:
+	"""Index for the current catalog; rebuilt only when the catalog swaps its index."""
+	global _index, _index_source
+	catalog = get_catalog()
+	with _index_lock:
+		if _index is None or _index_source is not catalog.index:
+			_index = BM25Index.from_catalog(catalog)
+			_index_source = catalog.index
+		return _index
+
+
+@functools.lru_cache(maxsize=1)
+def _agent_personas() -> dict[str, str]:
+	path = Path(os.getenv("AGENTS_MANIFEST", Path(__file__).resolve().parent / "agents_manifest.json"))
+	with open(path, "r", encoding="utf-8") as f:
+		return {a["name"]: a.get("persona", "") for a in json.load(f)["agents"]}
+
+
+def persona_for(agent: str) -> str:
+	"""The `agents_description/` directory of a manifest agent, or "" when it has none."""
+	return _agent_personas().get(agent, "")
+
+
+def grounding(persona: str, message: str, exclude: str = "", k: int = TOP_K, budget_bytes: int = BUDGET_BYTES) -> str:
+	"""Top-k snippets of `persona` relevant to `message`, at most `budget_bytes` of UTF-8.
+
+	Chunks contained in `exclude` (typically the challenge text the agent
+	already has) are skipped. Returns "" when nothing matches.
+	"""
+	if not ENABLED or not persona or budget_bytes <= 0:
+		return ""
+	header = "Trechos do seu material de referência que podem ajudar:\n"
+	used = len(header.encode("utf-8"))
+	excluded = " ".join(fold(exclude).split())
+	parts = []
+	for _, chunk in get_index().search(message, persona, k):
+		if excluded and " ".join(fold(chunk.text).split()) in excluded:
+			continue
+		part = f"[{chunk.source}]\n{chunk.text}\n"
+		size = len(part.encode("utf-8"))
+		if used + size > budget_bytes:
+			room = budget_bytes - used - len(f"[{chunk.source}]\n…\n".encode("utf-8"))
+			if room < 80:
+				break
+			clipped = chunk.text.encode("utf-8")[:room].decode("utf-8", "ignore")
+			part = f"[{chunk.source}]\n{clipped}…\n"
+			size = len(part.encode("utf-8"))
+		parts.append(part)
+		used += size + 1
+	return header + "\n".join(parts) if parts else ""
@@ -0,0 +1,175 @@
+# file: rooms.py
+"""Game rooms: one upstream call per question, broadcast to every member.
+
+A room has its own Bedrock session, a numbered event log and a set of
+subscribers. `Room.ask()` runs a question on a background thread and
+publishes `question`, `chunk` and `done`/`error` events as the reply
+streams in; every subscriber gets each event once, and late joiners (or
+reconnecting clients passing the last id they saw) replay the buffered
+events first. Only one question runs per room at a time, so upstream calls
+scale with rooms, not with the browsers watching them.
+
+Rooms live in process memory, so they only work with a single worker: under
+gunicorn with more than one (GUNICORN_WORKERS, set by gunicorn.conf.py)
+`get_room()` raises RoomsUnavailable instead of letting members split across
+workers and silently miss each other's broadcasts. Tunables:
+ROOM_REPLAY_EVENTS (2000 events kept per room), ROOM_IDLE_S (3600s before an
+unwatched room is dropped), ROOM_MAX (500 rooms), ROOM_HEARTBEAT_S (15s).
+"""
+import collections
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+log = logging.getLogger("jigsaw.rooms")
+
+WORKERS = int(os.getenv("GUNICORN_WORKERS", "1"))
+REPLAY_EVENTS = int(os.getenv("ROOM_REPLAY_EVENTS", "2000"))
+IDLE_S = float(os.getenv("ROOM_IDLE_S", "3600"))
+MAX_ROOMS = int(os.getenv("ROOM_MAX", "500"))
+# Comment frames keep idle subscriber connections open through proxies.
+HEARTBEAT_S = float(os.getenv("ROOM_HEARTBEAT_S", "15"))
+ROOM_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class RoomBusy(Exception):
+	"""Another member's question is still being answered."""
+
+
+class RoomLimit(Exception):
+	"""ROOM_MAX rooms are already open."""
+
+
+class RoomsUnavailable(Exception):
+	"""The server runs several workers, which cannot share rooms."""
+
+
+if WORKERS > 1:
+	log.error("rooms disabled: %d gunicorn workers cannot share room state; set WEB_CONCURRENCY=1 for room mode", WORKERS)
+
+
+class Room:
+	def __init__(self, room_id: str, replay_events: int = REPLAY_EVENTS):
+		self.id = room_id
+		# Shared by every member, so the agents see one conversation per room.
+		self.session_id = str(uuid.uuid4())
+		self._lock = threading.Lock()
+		self._events: collections.deque = collections.deque(maxlen=replay_events)
+		self._seq = 0
+		self._subscribers: dict[int, object] = {}
+		self._next_subscriber = 0
+		self._turn = 0
+		self.busy = False
+		self.last_active = time.monotonic()
+
+	def publish(self, event: str, data: dict) -> int:
+		with self._lock:
+			self._seq += 1
+			item = (self._seq, event, data)
+			self._events.append(item)
+			subscribers = list(self._subscribers.values())
+			self.last_active = time.monotonic()
+		for notify in subscribers:
+			try:
+				notify(item)
+			except Exception:
+				pass  # a subscriber that went away must not stall the others
+		return item[0]
+
+	def subscribe(self, notify, after: int = 0):
+		"""Registers `notify(item)` for new events; returns (backlog, unsubscribe).
+
+		`item` is `(seq, event, data)`. The backlog holds the buffered events
+		with seq > `after`, and nothing published after it is missed.
+		"""
+		with self._lock:
+			backlog = [item for item in self._events if item[0] > after]
+			token = self._next_subscriber
+			self._next_subscriber += 1
+			self._subscribers[token] = notify
+			self.last_active = time.monotonic()
+
+		def unsubscribe():
+			with self._lock:
+				self._subscribers.pop(token, None)
+				self.last_active = time.monotonic()
+
+		return backlog, unsubscribe
+
+	@property
+	def subscriber_count(self) -> int:
+		with self._lock:
+			return len(self._subscribers)
+
+	def state(self) -> dict:
+		with self._lock:
+			return {
+				"room": self.id,
+				"busy": self.busy,
+				"members": len(self._subscribers),
+				"last_event_id": self._seq,
+			}
+
+	def ask(self, member: str, message: str, run) -> int:
+		"""Starts answering `message`; `run()` yields the reply text.
+
+		Raises RoomBusy while another question is in flight. Returns the turn number.
+		"""
+		with self._lock:
+			if self.busy:
+				raise RoomBusy("A question from this room is still being answered.")
+			self.busy = True
+			self._turn += 1
+			turn = self._turn
+		self.publish("question", {"turn": turn, "member": member, "message": message})
+
+		def pump():
+			try:
+				for text in run():
+					self.publish("chunk", {"turn": turn, "text": text})
+				self.publish("done", {"turn": turn})
+			except Exception as e:
+				self.publish("error", {"turn": turn, "message": str(e)})
+			finally:
+				with self._lock:
+					self.busy = False
+
+		threading.Thread(target=pump, name=f"room-{self.id}", daemon=True).start()
+		return turn
+
+
+_rooms: dict[str, Room] = {}
+_rooms_lock = threading.Lock()
+
+
+def _sweep(now: float):
+	for room_id, room in list(_rooms.items()):
+		if not room.busy and room.subscriber_count == 0 and now - room.last_active > IDLE_S:
+			del _rooms[room_id]
+
+
+def parse_after(value) -> int:
+	"""Last-Event-ID header / `after` query value as a seq number (0 replays everything)."""
+	try:
+		return max(0, int(value or 0))
+	except (TypeError, ValueError):
+		return 0
+
+
+def get_room(room_id: str) -> Room:
+	"""The room with this id, created on first use. Raises ValueError for a bad id."""
+	if WORKERS > 1:
+		raise RoomsUnavailable("Rooms need a single server worker (WEB_CONCURRENCY=1).")
+	if not ROOM_ID_RE.match(room_id or ""):
+		raise ValueError("room ids are 1-64 letters, digits, '-' or '_'")
+	with _rooms_lock:
+		room = _rooms.get(room_id)
+		if room is None:
+			_sweep(time.monotonic())
+			if len(_rooms) >= MAX_ROOMS:
+				raise RoomLimit("Too many open rooms; try again later.")
+			room = _rooms[room_id] = Room(room_id)
+		return room
@@ -0,0 +1,69 @@
+# file: session_context.py
+"""Sends challenge context once per Bedrock session instead of on every turn.
+
+The first turn to an agent (or the first after the selected challenge
+changes) carries a primer with the challenge text; later turns send only the
+player's message. The challenge identity also travels in
+`sessionState.sessionAttributes`, which Bedrock keeps for the whole session.
+"""
+import hashlib
+from dataclasses import dataclass
+
+
+def fingerprint(challenge: dict | None) -> str:
+	if not challenge or not challenge.get("description"):
+		return ""
+	raw = f"{challenge.get('title', '')}\x1f{challenge.get('description', '')}"
+	return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def legacy_prompt(challenge: dict | None, message: str) -> str:
+	"""What every turn used to send: the full challenge text plus the message."""
+	base_text = (challenge or {}).get("description", "")
+	return (base_text + "\n\nPergunta do jogador: " + message).strip()
+
+
+@dataclass
+class Turn:
+	input_text: str
+	session_state: dict
+	fingerprint: str
+	bytes_saved: int
+
+
+class SessionContext:
+	"""Per-session record of which challenge context each agent has already seen."""
+
+	def __init__(self):
+		self._sent: dict[str, str] = {}  # agent_id -> fingerprint
+
+	def reset(self):
+		self._sent.clear()
+
+	def forget(self, agent_id: str):
+		"""The agent moved to a new Bedrock session; its next turn carries the primer again."""
+		self._sent.pop(agent_id, None)
+
+	def prepare(self, agent_id: str, challenge: dict | None, message: str, grounding: str = "") -> Turn:
+		"""`grounding` (retrieved persona snippets) goes just before the player's question."""
+		fp = fingerprint(challenge)
+		asked = f"{grounding}\nPergunta do jogador: {message}" if grounding else f"Pergunta do jogador: {message}"
+		attributes = {"challenge_fingerprint": fp}
+		if challenge:
+			attributes["challenge_title"] = challenge.get("title", "")
+		session_state = {"sessionAttributes": attributes}
+		if fp and self._sent.get(agent_id) != fp:
+			primer = (
+				"Contexto do desafio (vale para o resto da conversa até novo aviso):\n"
+				f"### {challenge.get('title', '')}\n{challenge.get('description', '')}\n\n"
+				+ asked
+			)
+			return Turn(primer, session_state, fp, 0)
+		input_text = asked if grounding else message
+		# Savings only exist against a challenge primer; the grounding is new bytes, not saved ones.
+		saved = len(legacy_prompt(challenge, message).encode("utf-8")) - len(input_text.encode("utf-8")) if fp else 0
+		return Turn(input_text, session_state, fp, max(0, saved))
+
+	def mark_sent(self, agent_id: str, fp: str):
+		"""Call once a turn carrying the primer has completed successfully."""
+		self._sent[agent_id] = fp
@@ -0,0 +1,241 @@
+# file: session_rotation.py
+"""Keeps Bedrock sessions short so per-turn latency stays flat.
+
+Collaborators are associated with relayConversationHistory=ENABLED, so
+every turn of a long session relays more history. `SessionRotation` tracks
+how many bytes each session has exchanged. Past SESSION_MAX_HISTORY_BYTES
+(or SESSION_MAX_TURNS), it compacts the conversation into a short summary:
+facts already established, open hypotheses and the last exchange. The next
+turn then goes to a fresh Bedrock session, and that first turn carries the
+summary in front of the player's message. Players keep their own session
+id; only the upstream one changes.
+
+The summary is extractive, so rotating costs no extra model call. The
+servers keep state in a SQLite file shared by every gunicorn worker
+(SESSION_STORE, default /tmp/jigsaw_sessions.sqlite3; `memory` for a
+single process), pruned after SESSION_STATE_TTL_S (86400s) without use.
+SESSION_ROTATION=off disables it.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+ENABLED = os.getenv("SESSION_ROTATION", "on").strip().lower() not in {"off", "0", "false", "no"}
+MAX_HISTORY_BYTES = int(os.getenv("SESSION_MAX_HISTORY_BYTES", "12000"))
+MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "12"))
+SUMMARY_BYTES = int(os.getenv("SESSION_SUMMARY_BYTES", "1500"))
+MAX_TRACKED = int(os.getenv("SESSION_TRACKED_MAX", "10000"))
+STATE_TTL_S = float(os.getenv("SESSION_STATE_TTL_S", "86400"))
+PRUNE_INTERVAL_S = 60.0
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+# Sentences worth carrying over: numbers, codes, answers, names of clues.
+FACT_RE = re.compile(r"\d|c[oó]digo|senha|resposta|cadeado|frasco|culpad|pista|code|answer|clue", re.I)
+HYPOTHESIS_RE = re.compile(r"talvez|pode ser|hip[oó]tese|suspeit|provavelmente|acho que|ser[aá] que|maybe|might|could be", re.I)
+MAX_ITEMS = 12
+ITEM_CHARS = 220
+SEED_HEADER = "Resumo da conversa até aqui (continue a partir dele, sem repetir):"
+
+
+def _sentences(text: str) -> list[str]:
+	out = []
+	for s in SENTENCE_RE.split(text or ""):
+		s = " ".join(s.split()).strip("-•* ")
+		if len(s) >= 12:
+			out.append(s if len(s) <= ITEM_CHARS else s[:ITEM_CHARS] + "…")
+	return out
+
+
+def _merge(previous: list[str], new: list[str]) -> list[str]:
+	"""Most recent first, no duplicates, at most MAX_ITEMS."""
+	seen, merged = set(), []
+	for item in list(reversed(new)) + previous:
+		key = item.casefold()
+		if key not in seen:
+			seen.add(key)
+			merged.append(item)
+	return merged[:MAX_ITEMS]
+
+
+def compact(state: dict, budget_bytes: int = SUMMARY_BYTES) -> str:
+	"""Folds the session's turns into its running facts/hypotheses and renders the summary."""
+	facts, hypotheses = [], []
+	for user, reply in state["turns"]:
+		for s in _sentences(user) + _sentences(reply):
+			if HYPOTHESIS_RE.search(s) or s.endswith("?"):
+				hypotheses.append(s)
+			elif FACT_RE.search(s):
+				facts.append(s)
+	state["facts"] = _merge(state.get("facts", []), facts)
+	state["hypotheses"] = _merge(state.get("hypotheses", []), hypotheses)
+
+	lines = [SEED_HEADER]
+	if state["facts"]:
+		lines.append("Fatos já estabelecidos:")
+		lines += [f"- {f}" for f in state["facts"]]
+	if state["hypotheses"]:
+		lines.append("Hipóteses em aberto:")
+		lines += [f"- {h}" for h in state["hypotheses"]]
+	if state["turns"]:
+		user, reply = state["turns"][-1]
+		lines.append("Última troca:")
+		lines.append(f"Jogador: {' '.join(user.split())[:ITEM_CHARS]}")
+		lines.append(f"Resposta: {' '.join(reply.split())[:ITEM_CHARS * 2]}")
+	out, used = [], 0
+	for line in lines:
+		size = len(line.encode("utf-8")) + 1
+		if used + size > budget_bytes:
+			break
+		out.append(line)
+		used += size
+	return "\n".join(out)
+
+
+def _new_state(session_id: str) -> dict:
+	return {
+		"session_id": session_id, "generation": 0, "bytes": 0, "turns": [],
+		"facts": [], "hypotheses": [], "seed": "", "updated": time.time(),
+	}
+
+
+class SessionRotation:
+	def __init__(
+		self,
+		max_history_bytes: int = MAX_HISTORY_BYTES,
+		max_turns: int = MAX_TURNS,
+		summary_bytes: int = SUMMARY_BYTES,
+		path: str | None = None,
+	):
+		self.max_history_bytes = max_history_bytes
+		self.max_turns = max_turns
+		self.summary_bytes = summary_bytes
+		self.path = path
+		self.rotations = 0
+		self._last_prune = 0.0
+		self._lock = threading.Lock()
+		self._states: OrderedDict[str, dict] = OrderedDict()
+		self._local = threading.local()
+		if path:
+			self._db().execute(
+				"CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)"
+			)
+			self._db().execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+	def _db(self) -> sqlite3.Connection:
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=NORMAL")
+			self._local.conn = conn
+		return conn
+
+	def _load(self, key: str, initial: str | None = None) -> dict:
+		if self.path:
+			row = self._db().execute("SELECT state FROM sessions WHERE key = ?", (key,)).fetchone()
+			return json.loads(row[0]) if row else _new_state(initial or key)
+		state = self._states.get(key)
+		if state is None:
+			state = self._states[key] = _new_state(initial or key)
+			while len(self._states) > MAX_TRACKED:
+				self._states.popitem(last=False)
+		self._states.move_to_end(key)
+		return state
+
+	def _save(self, key: str, state: dict):
+		state["updated"] = time.time()
+		if self.path:
+			self._db().execute(
+				"INSERT OR REPLACE INTO sessions (key, state, updated) VALUES (?, ?, ?)",
+				(key, json.dumps(state, ensure_ascii=False), state["updated"]),
+			)
+
+	def _prune(self, db: sqlite3.Connection):
+		"""Drops sessions idle for STATE_TTL_S and keeps at most MAX_TRACKED rows."""
+		now = time.time()
+		if now - self._last_prune < PRUNE_INTERVAL_S:
+			return
+		self._last_prune = now
+		db.execute("DELETE FROM sessions WHERE updated < ?", (now - STATE_TTL_S,))
+		db.execute(
+			"DELETE FROM sessions WHERE key IN (SELECT key FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+			(MAX_TRACKED,),
+		)
+
+	def session_for(self, key: str, initial: str | None = None) -> tuple[str, str]:
+		"""(Bedrock session id, summary seed to put in front of this turn's input, or "").
+
+		A key seen for the first time starts on `initial` (default: the key itself).
+		"""
+		with self._lock:
+			state = self._load(key, initial)
+			if self.path:
+				self._save(key, state)
+			return state["session_id"], state["seed"]
+
+	def record(self, key: str, message: str, reply: str, input_bytes: int | None = None) -> bool:
+		"""Accounts one completed turn; returns True when the session was rotated.
+
+		`message` is what the player typed (kept for the summary); `input_bytes`
+		is the size of what was actually sent, primers and seeds included.
+		"""
+		sent = len(message.encode("utf-8")) if input_bytes is None else input_bytes
+		with self._lock:
+			db = self._db() if self.path else None
+			if db is not None:
+				db.execute("BEGIN IMMEDIATE")  # workers read-modify-write the same row
+			try:
+				state = self._load(key)
+				state["seed"] = ""  # delivered with this turn
+				state["bytes"] += sent + len(reply.encode("utf-8"))
+				state["turns"] = (state["turns"] + [[message, reply]])[-self.max_turns:]
+				rotated = state["bytes"] > self.max_history_bytes or len(state["turns"]) >= self.max_turns
+				if rotated:
+					state["seed"] = compact(state, self.summary_bytes)
+					state["generation"] += 1
+					state["session_id"] = str(uuid.uuid4())
+					state["bytes"] = 0
+					state["turns"] = []
+					self.rotations += 1
+				self._save(key, state)
+				if db is not None:
+					self._prune(db)
+					db.execute("COMMIT")
+			except BaseException:
+				if db is not None:
+					db.execute("ROLLBACK")
+				raise
+			return rotated
+
+	def seeded(self, seed: str, input_text: str) -> str:
+		return f"{seed}\n\n{input_text}" if seed else input_text
+
+	def track(self, key: str, message: str, input_text: str, resp: dict) -> dict:
+		"""Wraps an `invoke_agent` response so the turn is recorded once its stream completes."""
+
+		def completion():
+			parts = []
+			for event in resp.get("completion", []):
+				if "chunk" in event and "bytes" in event["chunk"]:
+					parts.append(event["chunk"]["bytes"])
+				yield event
+			self.record(key, message, b"".join(parts).decode("utf-8", "replace"), len(input_text.encode("utf-8")))
+
+		return {**resp, "completion": completion()}
+
+
+def from_env() -> SessionRotation | None:
+	"""None when SESSION_ROTATION=off; SQLite-backed unless SESSION_STORE=memory.
+
+	Workers must agree on each session's upstream id, so the servers share a
+	file by default.
+	"""
+	if not ENABLED:
+		return None
+	path = os.getenv("SESSION_STORE", "/tmp/jigsaw_sessions.sqlite3").strip()
+	return SessionRotation(path=None if path.lower() == "memory" else path)
@@ -1,12 +1,29 @@
+import time
+
+_script_start = time.perf_counter()
+
+import collections
+import functools
+import logging
 import os
 import uuid
-import boto3
 import streamlit as st
-import json
-from pathlib import Path
-import re
+
+import regions
+import tracing
+from catalog import get_catalog
+from session_context import SessionContext
+import session_rotation
+from transcript import Transcript
+
+# Heavier modules (boto3 via clients, grading, admission, the reply cache)
+# are imported where they are first used, so the first paint does not wait
+# on them and each rerun only pays a sys.modules lookup.
+
+log = logging.getLogger("jigsaw.streamlit")
 
 st.set_page_config(page_title="Jigsaw Room", page_icon="🧩", layout="centered")
+st.session_state["_full_run"] = True
 
 REGION = os.getenv("AWS_REGION", os.getenv("REGION", "us-east-1"))
 SUPERVISOR_AGENT_ID = os.getenv("SUPERVISOR_AGENT_ID", "")
@@ -17,148 +34,133 @@ MAYA_AGENT_ID = "DSNQSVFD3N"
 MAYA_ALIAS_ID = os.getenv("MAYA_ALIAS_ID", "")
 CAROLINE_AGENT_ID = "KHOXBCC9II"
 CAROLINE_ALIAS_ID = os.getenv("CAROLINE_ALIAS_ID", "")
+PERSONA_LABELS = ["Gustavo", "Maya", "Dra. Caroline"]
+# Per-persona deadline for one reply; a slow persona never holds up the others.
+AGENT_TIMEOUT_S = float(os.getenv("AGENT_TIMEOUT_S", "60"))
+TRANSCRIPT_WINDOW = int(os.getenv("TRANSCRIPT_WINDOW", "30"))
+TRANSCRIPT_MAX_PAGES = int(os.getenv("TRANSCRIPT_MAX_PAGES", "40"))
+
+@st.cache_resource
+def get_reply_cache():
+	import response_cache
+
+	return response_cache.from_env()  # None unless RESPONSE_CACHE is set
+
+reply_cache = get_reply_cache()
+
+@st.cache_resource
+def get_admission_control():
+	# One controller per process, shared by every browser session
+	import admission
+
+	return admission.from_env()  # None when ADMISSION=off
+
+admission_control = get_admission_control()
+
+# Suffix kept on a streamed reply until it completes; stays visible if the
+# run is interrupted before the last chunk.
+INTERRUPTED_NOTE = "\n\n_(resposta interrompida)_"
+
+@st.cache_resource
+def run_timings():
+	# Per process; the first full run after start-up is the cold start.
+	return {"cold_s": None, "full": collections.deque(maxlen=50), "chat": collections.deque(maxlen=50)}
 
-runtime = boto3.client("bedrock-agent-runtime", region_name=REGION)
-
-# Load challenges
-@st.cache_data
-def load_challenges():
-	try:
-		with open("challenges.json", "r") as f:
-			return json.load(f)["challenges"]
-	except FileNotFoundError:
-		return []
-
-def _read_text_file(path: Path) -> str:
-	try:
-		return path.read_text(encoding="utf-8").strip()
-	except Exception:
-		return ""
-
-@st.cache_data
-def load_oficina_and_personas(base_dir: str = "agents_description"):
-	base = Path(base_dir)
-	personas = {}
-	oficina_text = ""
-	# Prefer the specific Caroline file if present
-	preferred = base / "dra_caroline" / "oficina_sem_respostas.txt"
-	if preferred.exists():
-		try:
-			oficina_text = preferred.read_text(encoding="utf-8").strip()
-		except Exception:
-			pass
-	if not base.exists():
-		return oficina_text, personas
-
-	for persona_dir in base.iterdir():
-		if not persona_dir.is_dir():
-			continue
-		files = {p.name: p for p in persona_dir.glob("*.txt")}
-		if not oficina_text and "oficina_sem_respostas.txt" in files:
-			oficina_text = _read_text_file(files["oficina_sem_respostas.txt"])
-		bg = next((p for n, p in files.items() if n.startswith("background_") or n.startswith("background")), None)
-		desc = next((p for n, p in files.items() if n.startswith("descricao_") or n.startswith("descricao")), None)
-		tips = next((p for n, p in files.items() if n.startswith("dicas_") or n.startswith("dicas")), None)
-		personas[persona_dir.name] = {
-			"background": _read_text_file(bg) if bg else "",
-			"descricao": _read_text_file(desc) if desc else "",
-			"dicas": _read_text_file(tips) if tips else "",
+def record_run(scope: str, start: float):
+	took = time.perf_counter() - start
+	timings = run_timings()
+	if scope == "full" and timings["cold_s"] is None:
+		timings["cold_s"] = took
+		log.info("streamlit cold start: %.0fms", took * 1000)
+	else:
+		timings[scope].append(took)
+		log.info("streamlit %s rerun: %.0fms", scope, took * 1000)
+
+def timing_report() -> str:
+	timings = run_timings()
+	lines = []
+	if timings["cold_s"] is not None:
+		lines.append(f"Cold start: {timings['cold_s'] * 1000:.0f} ms")
+	for scope, label in (("full", "Página inteira"), ("chat", "Só o chat")):
+		runs = sorted(timings[scope])
+		if runs:
+			lines.append(f"{label}: mediana {runs[len(runs) // 2] * 1000:.0f} ms, máx {runs[-1] * 1000:.0f} ms ({len(runs)} reruns)")
+	return "\n\n".join(lines) or "Sem medições ainda."
+
+# Game content comes from the shared catalog: parsed once per process and
+# re-parsed only for files whose mtime changed.
+catalog = get_catalog()
+
+@st.cache_resource
+def _sidebar_cache() -> dict:
+	return {}
+
+def sidebar_content() -> dict:
+	"""Lists the sidebar needs, rebuilt only when the catalog swaps its index."""
+	cache = _sidebar_cache()
+	if cache.get("source") is not catalog.index:
+		challenges = catalog.challenges
+		cache.update(
+			source=catalog.index,
+			challenge_keys=[e["title"] for e in catalog.desafios],
+			categories=["All"] + sorted(set(c["category"] for c in challenges)),
+			difficulties=["All"] + sorted(set(c["difficulty"] for c in challenges)),
+			filtered={},
+		)
+	return cache
+
+def filtered_challenges(category: str, difficulty: str) -> dict:
+	content = sidebar_content()
+	options = content["filtered"].get((category, difficulty))
+	if options is None:
+		options = {
+			f"{c['title']} ({c['difficulty']})": c
+			for c in catalog.challenges
+			if category in ("All", c["category"]) and difficulty in ("All", c["difficulty"])
 		}
+		content["filtered"][(category, difficulty)] = options
+	return options
 
-	return oficina_text, personas
-
-challenges = load_challenges()
-oficina_text, personas = load_oficina_and_personas()
-
-def normalize_challenge_key(title: str) -> str:
-	if not title:
-		return ""
-	# Strip heading hashes and emoji, then keep from 'DESAFIO ...'
-	clean = re.sub(r"^#+\\s+", "", title).strip()
-	i = clean.upper().find("DESAFIO")
-	core = clean[i:] if i != -1 else clean
-	core = re.sub(r"\s+", " ", core)
-	return core.strip()
-
-# Build challenge catalog from Oficina using heading lines like '### 🎂 DESAFIO 1 — ...'
-challenge_texts = {}
-if oficina_text:
-	lines = oficina_text.splitlines()
-	current_display = None
-	buf = []
-	for ln in lines:
-		ls = ln.strip()
-		if re.match(r".*DESAFIO\\s+\\d+\\s+—\\s+.*$", ls, re.IGNORECASE):
-			if current_display and buf:
-				challenge_texts[current_display] = "\n".join(buf).strip()
-				buf = []
-			current_display = ls
-		else:
-			buf.append(ln)
-	if current_display and buf:
-		challenge_texts[current_display] = "\n".join(buf).strip()
-challenge_keys = list(challenge_texts.keys())
-
-@st.cache_data
-def load_respostas(path: str = "respostas.txt"):
-	try:
-		text = Path(path).read_text(encoding="utf-8")
-		answers = {}
-		current_norm = None
-		for line in text.splitlines():
-			line_stripped = line.strip()
-			# Headings like '### 🎂 DESAFIO 1 — ...' (robust match)
-			if re.match(r".*DESAFIO\\s+\\d+\\s+—\\s+.*$", line_stripped, re.IGNORECASE):
-				current_norm = normalize_challenge_key(line_stripped)
-				continue
-			if current_norm and line_stripped.startswith("**Resposta:**"):
-				answers[current_norm] = line_stripped.split("**Resposta:**",1)[1].strip().strip("* ")
-		return answers
-	except Exception:
-		return {}
-
-respostas = load_respostas()
-
-# New: parse respostas.txt into full entries (title, description, answer)
-@st.cache_data
-def load_respostas_entries(path: str = "respostas.txt"):
-    try:
-        text = Path(path).read_text(encoding="utf-8")
-        entries = []
-        current_title = None
-        buf = []
-        answer = ""
-        heading_re = re.compile(r"^\s*#{2,6}\s+.*DESAFIO\s+\d+\s+[—\-–]\s+.*$", re.IGNORECASE)
-        for ln in text.splitlines():
-            ls = ln.strip()
-            if heading_re.match(ls):
-                if current_title is not None:
-                    desc = "\n".join([x for x in buf if not x.strip().lower().startswith("**resposta:**")]).strip()
-                    entries.append({"title": current_title, "description": desc, "answer": answer})
-                    buf = []
-                    answer = ""
-                current_title = ls
-            else:
-                buf.append(ln)
-                if ls.lower().startswith("**resposta:**"):
-                    answer = ls.split("**Resposta:**", 1)[1].strip().strip("* ")
-        if current_title is not None:
-            desc = "\n".join([x for x in buf if not x.strip().lower().startswith("**resposta:**")]).strip()
-            entries.append({"title": current_title, "description": desc, "answer": answer})
-        return entries
-    except Exception:
-        return []
-
-respostas_entries = load_respostas_entries()
-respostas_map = {normalize_challenge_key(e["title"]): e for e in respostas_entries}
-challenge_keys_ui = [e["title"] for e in respostas_entries]
+challenges = catalog.challenges
+personas = catalog.personas
+challenge_keys_ui = sidebar_content()["challenge_keys"]
+
+# Static sidebar copy for the persona toggles
+AGENTS_INFO = {
+	"gustavo": {
+		"label": "Gustavo",
+		"description": "Agente jurídico (Direito)",
+		"specialties": "Análise legal, interpretação de normas, raciocínio lógico",
+		"color": "🔧",
+		"persona_key": "gustavo",
+	},
+	"maya": {
+		"label": "Maya",
+		"description": "Engenheira de Software Sênior", 
+		"specialties": "Lógica, cifras, quebra de códigos, passo-a-passo",
+		"color": "🧠",
+		"persona_key": "maya",
+	},
+	"dra_caroline": {
+		"label": "Dra. Caroline",
+		"description": "Química/Docente",
+		"specialties": "Laboratorial, método científico, ensino",
+		"color": "🧪",
+		"persona_key": "dra_caroline",
+	}
+}
+PERSONA_KEYS = {info["label"]: info["persona_key"] for info in AGENTS_INFO.values()}
 
 st.title("🧩 Jigsaw Room")
 
 # Use the native sidebar for left panel
 with st.sidebar:
 	st.subheader("Configuration")
-	st.text_input("AWS Region", key="cfg_region", value=REGION)
+	if regions.configured():
+		# Each session goes to the healthiest region; ids below are the home region's
+		st.caption(f"Regiões: {', '.join(regions.REGIONS)}")
+	else:
+		st.text_input("AWS Region", key="cfg_region", value=REGION)
 	st.markdown("**Agents**")
 	st.text_input("Gustavo Agent ID", key="gustavo_agent", value=GUSTAVO_AGENT_ID)
 	st.text_input("Gustavo Alias ID", key="gustavo_alias", value=GUSTAVO_ALIAS_ID)
@@ -171,37 +173,12 @@ with st.sidebar:
 	st.divider()
 	st.subheader("👥 Personagens")
 	
-	# Agent selection (toggle-like checkboxes)
-	agents_info = {
-		"gustavo": {
-			"label": "Gustavo",
-			"description": "Agente jurídico (Direito)",
-			"specialties": "Análise legal, interpretação de normas, raciocínio lógico",
-			"color": "🔧",
-			"persona_key": "gustavo",
-		},
-		"maya": {
-			"label": "Maya",
-			"description": "Engenheira de Software Sênior", 
-			"specialties": "Lógica, cifras, quebra de códigos, passo-a-passo",
-			"color": "🧠",
-			"persona_key": "maya",
-		},
-		"dra_caroline": {
-			"label": "Dra. Caroline",
-			"description": "Química/Docente",
-			"specialties": "Laboratorial, método científico, ensino",
-			"color": "🧪",
-			"persona_key": "dra_caroline",
-		}
-	}
-	
 	# Initialize selected agents if not set
 	if "selected_agents" not in st.session_state:
-		st.session_state.selected_agents = [a["label"] for a in agents_info.values()]
+		st.session_state.selected_agents = [a["label"] for a in AGENTS_INFO.values()]
 	
 	# Agent checkboxes
-	for key, info in agents_info.items():
+	for key, info in AGENTS_INFO.items():
 		col1, col2 = st.columns([1, 4])
 		with col1:
 			selected = st.checkbox(
@@ -234,7 +211,7 @@ with st.sidebar:
 	st.subheader("🎯 Desafios")
 	selected_challenge_key = st.selectbox("Desafio", ["(texto livre)"] + challenge_keys_ui)
 	if selected_challenge_key != "(texto livre)":
-		entry = respostas_map.get(normalize_challenge_key(selected_challenge_key))
+		entry = catalog.challenge(selected_challenge_key)
 		st.session_state.selected_challenge = {
 			"title": selected_challenge_key,
 			"category": "oficina",
@@ -257,34 +234,26 @@ with st.sidebar:
 	attempt = st.text_input("Digite sua resposta final:", key="attempt_text_sidebar", placeholder="Ex: 19790312 ou 1-3-5")
 	if st.button("Verificar Resposta", type="primary", key="check_answer_sidebar"):
 		if "selected_challenge" in st.session_state:
-			entry = respostas_map.get(normalize_challenge_key(st.session_state.selected_challenge.get("title", "")))
-			correct = (entry or {}).get("answer") if entry else None
-			if not correct:
+			from grading import get_answer_key
+
+			result = get_answer_key().grade(st.session_state.selected_challenge.get("title", ""), attempt, strict=True)
+			if result.correct is None:
 				st.warning("⚠️ Nenhum gabarito encontrado para o desafio selecionado.")
+			elif result.correct:
+				st.success("✅ **Resposta correta!** Parabéns!")
+				st.balloons()
 			else:
-				def norm(s: str) -> str:
-					return re.sub(r"\s+", "", s or "").strip().lower()
-				if norm(attempt) == norm(correct):
-					st.success("✅ **Resposta correta!** Parabéns!")
-					st.balloons()
-				else:
-					st.error(f"❌ **Resposta incorreta.** A resposta correta é: `{correct}`")
+				correct = catalog.answer(st.session_state.selected_challenge.get("title", ""))
+				st.error(f"❌ **Resposta incorreta.** A resposta correta é: `{correct}`")
 		else:
 			st.warning("⚠️ Selecione um desafio primeiro.")
 
 	st.divider()
 	st.subheader("📚 Extra Challenges (optional)")
 	if challenges:
-		categories = ["All"] + list(set(c["category"] for c in challenges))
-		difficulties = ["All"] + list(set(c["difficulty"] for c in challenges))
-		selected_category = st.selectbox("Category", categories)
-		selected_difficulty = st.selectbox("Difficulty", difficulties)
-		filtered_challenges = challenges
-		if selected_category != "All":
-			filtered_challenges = [c for c in filtered_challenges if c["category"] == selected_category]
-		if selected_difficulty != "All":
-			filtered_challenges = [c for c in filtered_challenges if c["difficulty"] == selected_difficulty]
-		challenge_options = {f"{c['title']} ({c['difficulty']})": c for c in filtered_challenges}
+		selected_category = st.selectbox("Category", sidebar_content()["categories"])
+		selected_difficulty = st.selectbox("Difficulty", sidebar_content()["difficulties"])
+		challenge_options = filtered_challenges(selected_category, selected_difficulty)
 		selected_challenge_name = st.selectbox("Select Challenge", ["Custom"] + list(challenge_options.keys()))
 		if selected_challenge_name != "Custom" and selected_challenge_name in challenge_options:
 			selected_challenge = challenge_options[selected_challenge_name]
@@ -297,86 +266,229 @@ with st.sidebar:
 	else:
 		st.caption("No challenges loaded")
 
+	if reply_cache is not None:
+		stats = reply_cache.stats()
+		st.caption(f"Cache: {stats['hits']} hits / {stats['misses']} misses ({stats['backend']})")
+
+	with st.expander("⏱️ Desempenho"):
+		st.caption(timing_report())
+
+	if tracing.enabled():
+		with st.expander("Traces"):
+			for t in tracing.recent(5):
+				st.code(tracing.render_text(t), language=None)
+
 if "session_id" not in st.session_state:
 	st.session_state.session_id = str(uuid.uuid4())
+if "context" not in st.session_state:
+	st.session_state.context = SessionContext()
+if "rotation" not in st.session_state:
+	# Per agent: long Bedrock sessions move to a fresh one seeded with a summary
+	st.session_state.rotation = session_rotation.SessionRotation() if session_rotation.ENABLED else None
 if "messages" not in st.session_state:
-	st.session_state.messages = []  # list of (role, content)
-
-# Show an info if we parsed zero challenges from respostas.txt
-if not challenge_keys_ui:
-    st.info("Nenhum desafio encontrado em respostas.txt. Verifique os títulos ('### DESAFIO N — ...').")
-
-# Main chat area - display messages
-for role, content in st.session_state.messages:
-    with st.chat_message(role):
-        st.markdown(content)
-
-# Character selection
-col_role, _ = st.columns([1, 3])
-with col_role:
-    target = st.selectbox("Personagem", ["Gustavo", "Maya", "Dra. Caroline"], index=0)
-
-# Chat input at the bottom
-prompt = st.chat_input("Escreva sua pergunta / resposta…")
-if prompt:
-    st.session_state.messages.append(("user", prompt))
-    with st.chat_message("user"):
-        st.markdown(prompt)
-
-    # Build final prompt: selected challenge text plus user's message
-    base_text = ""
-    if "selected_challenge" in st.session_state:
-        base_text = st.session_state.selected_challenge.get("description", "")
-    enhanced_prompt = (base_text + "\n\nPergunta do jogador: " + prompt).strip()
-
-    # Invoke Bedrock Agent (non-streaming)
-    try:
-        if target == "Gustavo":
-            agent_id = st.session_state.get("gustavo_agent") or GUSTAVO_AGENT_ID
-            alias_id = st.session_state.get("gustavo_alias") or GUSTAVO_ALIAS_ID
-        elif target == "Maya":
-            agent_id = st.session_state.get("maya_agent") or MAYA_AGENT_ID
-            alias_id = st.session_state.get("maya_alias") or MAYA_ALIAS_ID
-        else:
-            agent_id = st.session_state.get("caroline_agent") or CAROLINE_AGENT_ID
-            alias_id = st.session_state.get("caroline_alias") or CAROLINE_ALIAS_ID
-
-        if not agent_id:
-            raise RuntimeError(f"Missing Agent ID for target: {target}")
-
-        # Use agent ID directly if no alias provided
-        if not alias_id:
-            alias_id = "TSTALIASID"  # Default alias for agents without custom aliases
-
-        resp = runtime.invoke_agent(
-            agentId=agent_id,
-            agentAliasId=alias_id,
-            sessionId=st.session_state.session_id,
-            inputText=enhanced_prompt,
+	# (role, content) pairs; only the recent window is kept uncompressed
+	st.session_state.messages = Transcript(window=TRANSCRIPT_WINDOW, max_pages=TRANSCRIPT_MAX_PAGES)
+
+def resolve_agent(label: str):
+    if label == "Gustavo":
+        agent_id = st.session_state.get("gustavo_agent") or GUSTAVO_AGENT_ID
+        alias_id = st.session_state.get("gustavo_alias") or GUSTAVO_ALIAS_ID
+    elif label == "Maya":
+        agent_id = st.session_state.get("maya_agent") or MAYA_AGENT_ID
+        alias_id = st.session_state.get("maya_alias") or MAYA_ALIAS_ID
+    else:
+        agent_id = st.session_state.get("caroline_agent") or CAROLINE_AGENT_ID
+        alias_id = st.session_state.get("caroline_alias") or CAROLINE_ALIAS_ID
+
+    if not agent_id:
+        raise RuntimeError(f"Missing Agent ID for target: {label}")
+
+    # Use agent ID directly if no alias provided
+    if not alias_id:
+        alias_id = "TSTALIASID"  # Default alias for agents without custom aliases
+    return agent_id, alias_id
+
+def with_verdict(reply: str) -> str:
+    # Validate against respostas.txt once the full reply is in
+    if "selected_challenge" not in st.session_state:
+        return reply
+    from grading import get_answer_key
+
+    result = get_answer_key().grade(st.session_state.selected_challenge.get("title", ""), reply)
+    if result.correct is None:
+        return reply
+    return reply + "\n\n" + ("✅ Resposta correta!" if result.correct else "❌ Resposta incorreta.")
+
+# Chat input reruns only this fragment, not the sidebar. Streamlit 1.36 ships
+# it as experimental_fragment; older versions rerun the whole page.
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+@fragment
+def chat_area():
+    start = time.perf_counter()
+    # Show an info if we parsed zero challenges from respostas.txt
+    if not challenge_keys_ui:
+        st.info("Nenhum desafio encontrado em respostas.txt. Verifique os títulos ('### DESAFIO N — ...').")
+
+    # Main chat area - display messages. Older turns stay compressed unless asked for,
+    # so rerun cost does not grow with the length of the session.
+    transcript = st.session_state.messages
+    transcript.compact()
+    if transcript.page_count:
+        if st.toggle(f"Mostrar mensagens anteriores ({transcript.archived_count})", key="show_archived"):
+            page = st.selectbox(
+                "Página",
+                list(range(transcript.page_count - 1, -1, -1)),
+                format_func=lambda n: f"{n + 1} de {transcript.page_count}",
+                key="archived_page",
+            )
+            for role, content in transcript.page(page):
+                with st.chat_message(role):
+                    st.markdown(content)
+            st.divider()
+    for role, content in transcript.live:
+        with st.chat_message(role):
+            st.markdown(content)
+
+    # Character selection
+    col_role, col_mode = st.columns([1, 3])
+    with col_role:
+        target = st.selectbox("Personagem", PERSONA_LABELS, index=0)
+    with col_mode:
+        fan_out_mode = st.toggle(
+            "Perguntar a todos os selecionados",
+            key="fan_out_mode",
+            help="Envia a pergunta a todos os personagens marcados ao mesmo tempo.",
         )
-        chunks = []
-        for chunk in resp.get("completion", []):
-            if "chunk" in chunk and "bytes" in chunk["chunk"]:
-                chunks.append(chunk["chunk"]["bytes"].decode("utf-8"))
-        reply = "".join(chunks) if chunks else "(no reply)"
-    except Exception as e:
-        reply = f"Error: {e}"
-
-    # Validate against respostas.txt if a known challenge is selected
-    veredito = None
-    if "selected_challenge" in st.session_state:
-        challenge_title = st.session_state.selected_challenge.get("title", "")
-        gabarito = respostas.get(normalize_challenge_key(challenge_title))
-        if gabarito:
-            # normalize both strings (remove spaces/newlines/markdown)
-            def norm(s: str) -> str:
-                return re.sub(r"\s+", "", s or "").strip().lower()
-            if norm(reply).find(norm(gabarito)) != -1 or norm(reply) == norm(gabarito):
-                veredito = "✅ Resposta correta!"
+
+    # Chat input at the bottom
+    prompt = st.chat_input("Escreva sua pergunta / resposta…")
+    if not st.session_state.get("_full_run"):
+        record_run("chat", start)
+    if prompt:
+        import admission
+        import resilience
+        import response_cache
+        import retrieval
+        from agent_runtime import fan_out
+        from clients import get_runtime_client
+
+        st.session_state.messages.append(("user", prompt))
+        with st.chat_message("user"):
+            st.markdown(prompt)
+
+        # The challenge text goes upstream once per agent session (see session_context);
+        # later turns carry only the player's message.
+        selected = st.session_state.get("selected_challenge")
+        challenge_title = (selected or {}).get("title", "")
+
+        targets = [target]
+        if fan_out_mode and st.session_state.selected_agents:
+            targets = [label for label in PERSONA_LABELS if label in st.session_state.selected_agents]
+        prefix = len(targets) > 1
+
+        # Reserve one assistant slot per persona up front and keep it updated while
+        # the reply streams in, so a rerun mid-answer keeps whatever arrived so far.
+        slots = {}
+        calls = {}
+        bytes_saved = 0
+        # Cached per region, so changing the sidebar region takes effect without
+        # paying connection setup on every message.
+        runtime = get_runtime_client(st.session_state.get("cfg_region") or REGION, frontend="streamlit")
+        for label in targets:
+            st.session_state.messages.append(("assistant", ""))
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                placeholder.markdown(f"**{label}:** …" if prefix else "…")
+            slot = {"index": len(st.session_state.messages) - 1, "placeholder": placeholder, "reply": "", "cache_key": None}
+            slots[label] = slot
+            try:
+                agent_id, alias_id = resolve_agent(label)
+            except Exception as e:
+                slot["reply"] = f"Error: {e}"
+                continue
+            if reply_cache is not None:
+                slot["cache_key"] = response_cache.make_key(agent_id, alias_id, challenge_title, prompt)
+                cached = reply_cache.get(slot["cache_key"])
+                if cached is not None:
+                    slot["reply"] = cached
+                    continue
+            if admission_control is not None:
+                ticket = None
+                try:
+                    ticket = admission_control.request(st.session_state.session_id, check_session=not calls)
+                    while not ticket.wait(0.5):
+                        placeholder.markdown(f"⏳ Na fila (posição {ticket.position})…")
+                except admission.Rejected as e:
+                    slot["reply"] = f"⏳ {e.reason} (tente novamente em {e.retry_after}s)"
+                    continue
+                finally:
+                    if ticket is not None:
+                        ticket.cancel()
+            # Only the snippets of this persona's material that match the question
+            grounding = retrieval.grounding(PERSONA_KEYS.get(label, ""), prompt, exclude=(selected or {}).get("description", ""))
+            turn = st.session_state.context.prepare(agent_id, selected, prompt, grounding)
+            slot["context"] = (agent_id, turn.fingerprint)
+            bytes_saved += turn.bytes_saved
+            upstream_session, input_text = st.session_state.session_id, turn.input_text
+            rotation = st.session_state.rotation
+            if rotation is not None:
+                upstream_session, seed = rotation.session_for(agent_id, st.session_state.session_id)
+                input_text = rotation.seeded(seed, input_text)
+            slot["input_bytes"] = len(input_text.encode("utf-8"))
+            calls[label] = functools.partial(
+                runtime.invoke_agent,
+                agentId=agent_id,
+                agentAliasId=alias_id,
+                sessionId=upstream_session,
+                inputText=input_text,
+                sessionState=turn.session_state,
+            )
+
+        def show(label: str, text: str, final: bool = False):
+            slot = slots[label]
+            body = f"**{label}:** {text}" if prefix else text
+            st.session_state.messages[slot["index"]] = ("assistant", body if final else body + INTERRUPTED_NOTE)
+            slot["placeholder"].markdown(body if final else body + "▌")
+
+        def finish(label: str, error: str = ""):
+            slot = slots[label]
+            reply = slot["reply"]
+            if error:
+                reply = (reply + "\n\n" if reply else "") + error
+            show(label, with_verdict(reply or "(no reply)"), final=True)
+
+        for label in targets:
+            if label not in calls:
+                finish(label)
+
+        if bytes_saved:
+            st.session_state.context_bytes_saved = st.session_state.get("context_bytes_saved", 0) + bytes_saved
+            st.caption(
+                f"Contexto do desafio já enviado nesta sessão: {bytes_saved} bytes economizados neste turno "
+                f"({st.session_state.context_bytes_saved} no total)."
+            )
+
+        # Invoke Bedrock Agents (streaming, in parallel); each persona has its own deadline
+        for label, event, value in fan_out(calls, AGENT_TIMEOUT_S):
+            slot = slots[label]
+            if event == "chunk":
+                slot["reply"] += value
+                show(label, slot["reply"])
+            elif event == "done":
+                st.session_state.context.mark_sent(*slot["context"])
+                rotation = st.session_state.rotation
+                if rotation is not None and rotation.record(slot["context"][0], prompt, slot["reply"], slot["input_bytes"]):
+                    # The new Bedrock session has not seen the challenge yet
+                    st.session_state.context.forget(slot["context"][0])
+                if slot["cache_key"] and slot["reply"]:
+                    reply_cache.put(slot["cache_key"], slot["reply"])
+                finish(label)
+            elif event == "error":
+                finish(label, f"⚠️ {resilience.friendly_error(value)}")
             else:
-                veredito = f"❌ Resposta incorreta."
+                finish(label, f"⏱️ {label} não respondeu em {AGENT_TIMEOUT_S:.0f}s.")
 
-    final_block = reply if veredito is None else (reply + "\n\n" + veredito)
-    st.session_state.messages.append(("assistant", final_block))
-    with st.chat_message("assistant"):
-        st.markdown(final_block)
+chat_area()
+record_run("full", _script_start)
+st.session_state["_full_run"] = False
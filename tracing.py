@@ -0,0 +1,260 @@
+# file: tracing.py
+"""Opt-in orchestration tracing for supervisor turns.
+
+A sampled fraction of `invoke_agent` calls (TRACE_SAMPLE_RATE, 0..1,
+default 0) is sent with `enableTrace=True`. The trace events the agents
+emit are turned into a per-request timeline:
+
+- one step span per trace event, lasting until the next event arrives
+  (supervisor or collaborator, pre/post-processing, routing, failures);
+- spans of the invoked agent itself are attributed to `agent`, those of
+  collaborators to their name;
+- a `model` span from each model invocation input to its output, with
+  token usage when the service reports it;
+- a `delegate:<name>` span from each hand-off to Gustavo, Maya or Ivy to
+  the supervisor's observation of the reply, with the relayed input size;
+- `first_chunk` and `completion` marks for the reply stream itself.
+
+The last TRACE_BUFFER traces (default 50) are kept in a ring buffer per
+process. When TRACE_DIR is set, each process also writes its buffer to
+`<TRACE_DIR>/<pid>.json` and `recent()` merges every file, so
+`/debug/traces` shows the traces of all workers.
+"""
+import collections
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+BUFFER_SIZE = int(os.getenv("TRACE_BUFFER", "50"))
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+DETAIL_CHARS = 200
+
+# Keys of the inner `trace` object, in the order Bedrock documents them.
+TRACE_TYPES = (
+	"preProcessingTrace",
+	"routingClassifierTrace",
+	"orchestrationTrace",
+	"customOrchestrationTrace",
+	"postProcessingTrace",
+	"guardrailTrace",
+	"failureTrace",
+)
+
+_lock = threading.Lock()
+_buffer: collections.deque = collections.deque(maxlen=BUFFER_SIZE)
+
+
+def enabled() -> bool:
+	return SAMPLE_RATE > 0
+
+
+def _clip(text) -> str:
+	text = str(text or "")
+	return text if len(text) <= DETAIL_CHARS else text[:DETAIL_CHARS] + "…"
+
+
+class Trace:
+	"""Spans of one `invoke_agent` call, with offsets in ms from the call."""
+
+	def __init__(self, frontend: str, agent_id: str, alias_id: str, session_id: str):
+		self.id = uuid.uuid4().hex[:16]
+		self.frontend = frontend
+		self.agent_id = agent_id
+		self.alias_id = alias_id
+		self.session_id = session_id
+		self.started_at = time.time()
+		self._t0 = time.perf_counter()
+		self.spans: list[dict] = []
+		self._open: dict[str, dict] = {}
+		self._step: dict | None = None
+		self.error: str | None = None
+		self.duration_ms: float | None = None
+
+	def now_ms(self) -> float:
+		return round((time.perf_counter() - self._t0) * 1000, 1)
+
+	def _span(self, name: str, actor: str, start_ms: float, **attrs) -> dict:
+		span = {"name": name, "actor": actor, "start_ms": start_ms, "end_ms": None, "attrs": attrs}
+		self.spans.append(span)
+		return span
+
+	def mark(self, name: str, actor: str, **attrs):
+		t = self.now_ms()
+		self._span(name, actor, t, **attrs)["end_ms"] = t
+
+	def step(self, name: str, actor: str, **attrs):
+		"""Starts a step span; the previous step ends here."""
+		t = self.now_ms()
+		if self._step is not None:
+			self._step["end_ms"] = t
+		self._step = self._span(name, actor, t, **attrs)
+
+	def open(self, key: str, name: str, actor: str, **attrs):
+		self._open[key] = self._span(name, actor, self.now_ms(), **attrs)
+
+	def close(self, key: str, **attrs):
+		span = self._open.pop(key, None)
+		if span is not None:
+			span["end_ms"] = self.now_ms()
+			span["attrs"].update(attrs)
+
+	def finish(self, error: str | None = None):
+		t = self.now_ms()
+		self.duration_ms = t
+		self.error = error
+		for span in self.spans:
+			if span["end_ms"] is None:
+				span["end_ms"] = t
+				span["attrs"]["unfinished"] = True
+		self._open.clear()
+		self._step = None
+
+	def as_dict(self) -> dict:
+		return {
+			"id": self.id,
+			"pid": os.getpid(),
+			"frontend": self.frontend,
+			"agent_id": self.agent_id,
+			"alias_id": self.alias_id,
+			"session_id": self.session_id,
+			"started_at": self.started_at,
+			"duration_ms": self.duration_ms,
+			"error": self.error,
+			"spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+		}
+
+
+def _actor(event: dict) -> str:
+	return event.get("collaboratorName") or "agent"
+
+
+def record_event(trace: Trace, event: dict):
+	"""Turns one `trace` event of the completion stream into spans."""
+	actor = _actor(event)
+	inner = event.get("trace", {})
+	for trace_type in TRACE_TYPES:
+		body = inner.get(trace_type)
+		if not isinstance(body, dict):
+			continue
+		phase = trace_type[: -len("Trace")]
+		for part, value in body.items():
+			if not isinstance(value, dict):
+				trace.step(f"{phase}.{part}", actor, detail=_clip(value))
+				continue
+			if part == "rationale":
+				trace.step(f"{phase}.{part}", actor, detail=_clip(value.get("text")))
+			else:
+				trace.step(f"{phase}.{part}", actor)
+			key = f"{actor}:{phase}:model"
+			if part == "modelInvocationInput":
+				trace.open(key, "model", actor, phase=phase)
+			elif part == "modelInvocationOutput":
+				usage = value.get("metadata", {}).get("usage", {})
+				trace.close(key, input_tokens=usage.get("inputTokens"), output_tokens=usage.get("outputTokens"))
+			elif part == "invocationInput":
+				collab = value.get("agentCollaboratorInvocationInput")
+				if collab:
+					name = collab.get("agentCollaboratorName", "?")
+					text = collab.get("input", {}).get("text", "")
+					trace.open(f"{actor}:delegate:{name}", f"delegate:{name}", actor, input_chars=len(text), input=_clip(text))
+			elif part == "observation":
+				collab = value.get("agentCollaboratorInvocationOutput")
+				if collab:
+					name = collab.get("agentCollaboratorName", "?")
+					text = collab.get("output", {}).get("text", "")
+					trace.close(f"{actor}:delegate:{name}", output_chars=len(text))
+		break
+
+
+def store(trace: Trace):
+	with _lock:
+		_buffer.append(trace.as_dict())
+		snapshot = list(_buffer)
+	if TRACE_DIR:
+		path = os.path.join(TRACE_DIR, f"{os.getpid()}.json")
+		tmp = f"{path}.{threading.get_ident()}.tmp"  # traced calls finish on several threads at once
+		try:
+			os.makedirs(TRACE_DIR, exist_ok=True)
+			with open(tmp, "w", encoding="utf-8") as f:
+				json.dump(snapshot, f, ensure_ascii=False)
+			os.replace(tmp, path)
+		except OSError:
+			pass  # tracing must never fail the call it observes
+
+
+def recent(limit: int = BUFFER_SIZE) -> list[dict]:
+	"""Newest traces first, across every process sharing TRACE_DIR."""
+	with _lock:
+		traces = {t["id"]: t for t in _buffer}
+	if TRACE_DIR and os.path.isdir(TRACE_DIR):
+		for name in os.listdir(TRACE_DIR):
+			if not name.endswith(".json"):
+				continue
+			try:
+				with open(os.path.join(TRACE_DIR, name), "r", encoding="utf-8") as f:
+					for t in json.load(f):
+						traces.setdefault(t["id"], t)
+			except (OSError, ValueError):
+				continue
+	return sorted(traces.values(), key=lambda t: t["started_at"], reverse=True)[:limit]
+
+
+def render_text(trace: dict) -> str:
+	"""Waterfall view of one trace."""
+	lines = [
+		f"trace {trace['id']}  {trace['frontend']}  agent={trace['agent_id']}/{trace['alias_id']}  "
+		f"session={trace['session_id']}  {trace['duration_ms']}ms" + (f"  error={trace['error']}" if trace["error"] else "")
+	]
+	for span in trace["spans"]:
+		took = span["end_ms"] - span["start_ms"]
+		attrs = " ".join(f"{k}={v}" for k, v in span["attrs"].items() if v is not None)
+		lines.append(f"  +{span['start_ms']:>9.1f}ms {took:>9.1f}ms  {span['actor']:<12} {span['name']:<40} {attrs}".rstrip())
+	return "\n".join(lines)
+
+
+class TracingRuntime:
+	"""Wraps a runtime client and traces a sampled fraction of `invoke_agent` calls."""
+
+	def __init__(self, client, frontend: str, sample_rate: float = SAMPLE_RATE):
+		self._client = client
+		self._frontend = frontend
+		self._sample_rate = sample_rate
+
+	def __getattr__(self, name):
+		return getattr(self._client, name)
+
+	def invoke_agent(self, **kwargs) -> dict:
+		if random.random() >= self._sample_rate:
+			return self._client.invoke_agent(**kwargs)
+		trace = Trace(self._frontend, kwargs.get("agentId", ""), kwargs.get("agentAliasId", ""), kwargs.get("sessionId", ""))
+		try:
+			resp = self._client.invoke_agent(**{**kwargs, "enableTrace": True})
+		except Exception as e:
+			trace.finish(error=type(e).__name__)
+			store(trace)
+			raise
+		return {**resp, "completion": self._trace(resp.get("completion", []), trace)}
+
+	def _trace(self, completion, trace: Trace):
+		first = True
+		error = None
+		try:
+			for event in completion:
+				if "trace" in event:
+					record_event(trace, event["trace"])
+				elif "chunk" in event and first:
+					trace.mark("first_chunk", "agent")
+					trace.step("answer", "agent")
+					first = False
+				yield event
+		except Exception as e:
+			error = type(e).__name__
+			raise
+		finally:
+			trace.mark("completion", "agent")
+			trace.finish(error=error)
+			store(trace)
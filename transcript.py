@@ -0,0 +1,67 @@
+# file: transcript.py
+"""Bounded chat transcript for the Streamlit app.
+
+Only the most recent `window` messages are kept as plain tuples and
+re-rendered on every rerun. Older messages are moved, a page at a time,
+into zlib-compressed JSON blobs that are decoded only when the player asks
+to see them, and at most `max_pages` such pages are kept.
+
+Messages are addressed by absolute index, so a slot reserved for a streaming
+reply keeps its index while older turns are archived.
+"""
+import json
+import zlib
+
+
+class Transcript:
+	def __init__(self, window: int = 30, max_pages: int = 40):
+		self.window = max(1, window)
+		self.max_pages = max(1, max_pages)
+		self.live: list[tuple[str, str]] = []
+		self._pages: list[bytes] = []
+		self._offset = 0  # absolute index of live[0]
+		self.dropped = 0  # messages discarded once max_pages was reached
+
+	def __len__(self) -> int:
+		return self._offset + len(self.live)
+
+	def append(self, message: tuple[str, str]):
+		self.live.append(tuple(message))
+
+	def __getitem__(self, index: int) -> tuple[str, str]:
+		return self.live[self._live_index(index)]
+
+	def __setitem__(self, index: int, message: tuple[str, str]):
+		self.live[self._live_index(index)] = tuple(message)
+
+	def _live_index(self, index: int) -> int:
+		if index < 0:
+			index += len(self)
+		if index < self._offset:
+			raise IndexError("message has been archived")
+		return index - self._offset
+
+	def compact(self):
+		"""Archives whole pages of the oldest live messages once the window overflows.
+
+		Call this between turns, never while a reply is streaming into a slot.
+		"""
+		while len(self.live) >= self.window * 2:
+			page, self.live = self.live[: self.window], self.live[self.window:]
+			self._pages.append(zlib.compress(json.dumps(page, ensure_ascii=False).encode("utf-8")))
+			self._offset += len(page)
+			if len(self._pages) > self.max_pages:
+				self._pages.pop(0)
+				self.dropped += self.window
+
+	@property
+	def page_count(self) -> int:
+		return len(self._pages)
+
+	@property
+	def archived_count(self) -> int:
+		return self._offset - self.dropped
+
+	def page(self, n: int) -> list[tuple[str, str]]:
+		"""Archived page n (0 is the oldest kept)."""
+		return [tuple(m) for m in json.loads(zlib.decompress(self._pages[n]).decode("utf-8"))]